@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+run.py - ビルド処理のベンチマーク
+
+合成データ（benchmarks/synthetic.py）を使って、build.py の各ステージの処理時間を計測します。
+計測結果は benchmarks/results/ に JSON で保存され、前回の結果との差分を表示します。
+
+計測するステージ:
+  - normalize_form_df      : コメント・写真CSVの正規化（行数ごと）
+  - prepare_comments_data  : テンプレート用データへの変換（行数ごと）
+  - aggregate_menu_items   : メニュー集計（行数ごと）
+    （上の3つは csv エンジン版も engine=csv として計測。こちらは CSV の読み込みを含む）
+  - generate_html          : HTML生成（行数ごと）
+  - process_images         : 画像の変換（初回・2回目）
+  - copy_static_files      : public/ へのコピー（初回・2回目）
+
+作業用のディレクトリは一時ディレクトリに作成し、リポジトリ内のファイルは変更しません。
+
+使用方法:
+    python benchmarks/run.py
+    python benchmarks/run.py --sizes 1000 10000 --images 10
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).parent.resolve()
+PROJECT_ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(BENCH_DIR))
+
+import pandas as pd
+
+import build
+import synthetic
+
+# =============================================================================
+# 設定
+# =============================================================================
+
+RESULTS_DIR = BENCH_DIR / "results"
+DEFAULT_SIZES = [1000, 10000, 100000]  # コメントCSVの行数
+DEFAULT_IMAGES = 20                    # 画像の枚数
+
+# 一時ディレクトリに差し替える build.py のパス設定
+BUILD_PATHS = {
+    "DATA_DIR": "data",
+    "RAW_IMAGES_DIR": "raw_images",
+    "STATIC_DIR": "static",
+    "OUTPUT_IMAGES_DIR": "static/images",
+    "PUBLIC_DIR": "public",
+    "DOWNLOAD_HISTORY_FILE": "data/.download_history.json",
+    "PHOTO_STORE_FILE": "data/.photo_store.json",
+    "IMAGE_MANIFEST_FILE": "data/.image_manifest.json",
+    "FETCH_STATE_FILE": "data/.fetch_state.json",
+    "STATE_DB_FILE": "data/.state.db",
+    "BUILD_STATE_FILE": "data/.build_state.json",
+    "STAGE_CACHE_DIR": "data/.stage_cache",
+    "JINJA_CACHE_DIR": "data/.jinja_cache",
+}
+
+
+@contextmanager
+def build_paths(root: Path):
+    """
+    build.py の入出力先を root 以下に差し替えます（終了時に元に戻します）。
+    static/css/ はリポジトリのものをコピーしておきます。
+    """
+    saved = {name: getattr(build, name) for name in BUILD_PATHS}
+    for name, rel in BUILD_PATHS.items():
+        setattr(build, name, root / rel)
+    for directory in ("data", "raw_images", "static/images", "public"):
+        (root / directory).mkdir(parents=True, exist_ok=True)
+    shutil.copytree(PROJECT_ROOT / "static" / "css", root / "static" / "css", dirs_exist_ok=True)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(build, name, value)
+
+
+def measure(results: list, stage: str, func, *args, **labels):
+    """
+    関数を1回実行し、経過時間とCPU時間を results に追加します。
+    build.py のログ出力は計測の邪魔になるため捨てます。
+
+    Returns:
+        関数の戻り値
+    """
+    with redirect_stdout(io.StringIO()):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        value = func(*args)
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+    entry = {"stage": stage, **labels, "wall_s": round(wall, 4), "cpu_s": round(cpu, 4)}
+    results.append(entry)
+    label = ", ".join(f"{k}={v}" for k, v in labels.items())
+    print(f"  {stage:<24} {label:<22} {wall:8.3f}s (CPU {cpu:.3f}s)")
+    return value
+
+
+def merge_comments_and_photos(df_comments: pd.DataFrame, df_photos: pd.DataFrame) -> pd.DataFrame:
+    """fetch_and_merge_csv_data() と同じ手順で正規化済みのCSVをマージ"""
+    df_merged = pd.concat([df_comments, df_photos], ignore_index=True, sort=False)
+    df_merged["_ts"] = pd.to_datetime(df_merged["timestamp"], errors="coerce")
+    return df_merged.sort_values("_ts", ascending=False).drop(columns=["_ts"])
+
+
+def bench_images(results: list, root: Path, count: int):
+    """画像の変換と public/ へのコピーを計測"""
+    print(f"\n🖼️ 画像: {count} 枚")
+    with redirect_stdout(io.StringIO()):
+        synthetic.generate_image_corpus(root / "raw_images", count)
+
+    images = measure(results, "process_images", lambda: build.process_images(force=True), images=count, run="cold")
+    measure(results, "process_images", build.process_images, images=count, run="warm")
+    measure(results, "copy_static_files", build.copy_static_files, images=count, run="cold")
+    measure(results, "copy_static_files", build.copy_static_files, images=count, run="warm")
+    return images, build.image_variant_manifest(build.load_image_manifest())
+
+
+def bench_rows(results: list, root: Path, rows: int, images: list, image_variants: dict, config: dict):
+    """CSVの行数ごとのステージを計測"""
+    print(f"\n📝 コメント: {rows} 行")
+    data_dir = root / "data"
+    synthetic.generate_comments_csv(data_dir / "comments.csv", rows)
+    synthetic.generate_photos_csv(data_dir / "photos.csv", rows // 5)
+    raw_comments = pd.read_csv(data_dir / "comments.csv", encoding="utf-8")
+    raw_photos = pd.read_csv(data_dir / "photos.csv", encoding="utf-8")
+
+    def normalize():
+        return (
+            build.normalize_form_df(raw_comments, "comments"),
+            build.normalize_form_df(raw_photos, "photos"),
+        )
+
+    df_comments, df_photos = measure(results, "normalize_form_df", normalize, rows=rows)
+    df = merge_comments_and_photos(df_comments, df_photos)
+
+    comments = measure(results, "prepare_comments_data", build.prepare_comments_data, df, rows=rows)
+    menu_stats = measure(results, "aggregate_menu_items", build.aggregate_menu_items, df, rows=rows)
+
+    # csv エンジン（--engine csv）
+    def normalize_records():
+        return (
+            build.normalize_form_df(build.read_csv_records(data_dir / "comments.csv"), "comments")
+            + build.normalize_form_df(build.read_csv_records(data_dir / "photos.csv"), "photos")
+        )
+
+    records = measure(results, "normalize_form_df", normalize_records, rows=rows, engine="csv")
+    measure(results, "prepare_comments_data", build.prepare_comments_data, records, rows=rows, engine="csv")
+    measure(results, "aggregate_menu_items", build.aggregate_menu_items, records, rows=rows, engine="csv")
+
+    shutil.rmtree(root / "public" / "timeline", ignore_errors=True)
+    measure(
+        results, "generate_html",
+        lambda: build.generate_html(comments, images, "", config, menu_stats=menu_stats,
+                                    copy_static=False, image_variants=image_variants),
+        rows=rows,
+    )
+
+
+def git_commit() -> str:
+    """計測したコードのコミットID（取得できない場合は空文字）"""
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+        )
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def environment_info() -> dict:
+    """結果を比較するときに必要な実行環境の情報"""
+    import jinja2
+    import PIL
+
+    return {
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pandas": pd.__version__,
+        "pillow": PIL.__version__,
+        "jinja2": jinja2.__version__,
+        "image_workers": build.IMAGE_WORKERS,
+    }
+
+
+def result_key(entry: dict) -> tuple:
+    """ステージとラベル（行数・枚数など）で結果を識別するキー"""
+    return tuple(sorted((k, v) for k, v in entry.items() if k not in ("wall_s", "cpu_s")))
+
+
+def compare_results(previous: dict, current: dict):
+    """前回の結果との差分（経過時間）を表示"""
+    before = {result_key(e): e["wall_s"] for e in previous.get("results", [])}
+    print(f"\n📊 前回（{previous.get('created_at', '?')}, {previous.get('environment', {}).get('git_commit', '?')}）との比較:")
+    for entry in current["results"]:
+        old = before.get(result_key(entry))
+        if old is None:
+            continue
+        change = (entry["wall_s"] - old) / old * 100 if old else 0.0
+        label = ", ".join(f"{k}={v}" for k, v in entry.items() if k not in ("stage", "wall_s", "cpu_s"))
+        print(f"  {entry['stage']:<24} {label:<22} {old:8.3f}s → {entry['wall_s']:8.3f}s ({change:+.1f}%)")
+
+
+def latest_result() -> Path | None:
+    """results/ にある最新の結果ファイル"""
+    paths = sorted(RESULTS_DIR.glob("*.json"))
+    return paths[-1] if paths else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ビルド処理のベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="コメントCSVの行数（複数指定可）")
+    parser.add_argument("--images", type=int, default=DEFAULT_IMAGES, help="画像の枚数（0 で画像の計測をスキップ）")
+    parser.add_argument("--compare", type=Path, default=None, help="比較する結果ファイル（デフォルト: 前回の結果）")
+    parser.add_argument("--output", type=Path, default=None, help="結果の保存先（デフォルト: benchmarks/results/日時.json）")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("⏱️ ビルド処理のベンチマーク")
+    print("=" * 60)
+
+    previous_path = args.compare or latest_result()
+    created_at = datetime.now()
+    results = []
+    config = build.load_config()
+
+    with tempfile.TemporaryDirectory(prefix="memorial-bench-") as tmp:
+        root = Path(tmp)
+        with build_paths(root):
+            images, image_variants = [], {}
+            if args.images:
+                images, image_variants = bench_images(results, root, args.images)
+            for rows in args.sizes:
+                bench_rows(results, root, rows, images, image_variants, config)
+
+    report = {
+        "created_at": created_at.isoformat(timespec="seconds"),
+        "environment": environment_info(),
+        "results": results,
+    }
+
+    output_path = args.output or RESULTS_DIR / f"{created_at:%Y%m%d-%H%M%S}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✓ 結果を保存: {output_path}")
+
+    if previous_path and previous_path.exists() and previous_path.resolve() != output_path.resolve():
+        with open(previous_path, "r", encoding="utf-8") as f:
+            compare_results(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
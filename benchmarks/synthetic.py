@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+synthetic.py - ベンチマーク用の合成データ生成
+
+Googleフォームから出力されるCSVと同じ列名（日本語）を持つ
+コメント投稿・写真投稿のCSVと、ベンチマーク用の画像を生成します。
+乱数のシードを固定しているため、同じ引数なら毎回同じデータになります。
+
+使用方法:
+    python benchmarks/synthetic.py --rows 10000 --images 20 --output /tmp/bench-data
+"""
+
+import argparse
+import csv
+import random
+import string
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from PIL import Image
+
+# =============================================================================
+# 設定
+# =============================================================================
+
+# Googleフォームの列名（build.normalize_form_df() が参照するもの）
+COMMENT_COLUMNS = [
+    "タイムスタンプ",
+    "想い出（必須）",
+    "公開可能なお名前（ニックネーム、任意）",
+    "好きだったメニュー（複数可、任意）",
+]
+PHOTO_COLUMNS = [
+    "タイムスタンプ",
+    "想い出の写真",
+    "写真にまつわる想い出",
+    "公開可能なお名前（ニックネーム、任意）",
+]
+
+# 本文・名前・メニューの素材
+SENTENCES = [
+    "初めて行ったのは学生の頃でした。",
+    "優しい味の塩ラーメンが大好きでした。",
+    "家族でよく通っていました。",
+    "NORIさんの笑顔が忘れられません。",
+    "帰省のたびに必ず食べに行っていました。",
+    "こってりしたラーメンが多い中、NORIのラーメンはオアシスでした。",
+    "裏メニューを教えてもらった日のことを覚えています。",
+    "本当にありがとうございました。",
+    "もう一度あのスープを飲みたかったです。",
+    "子供が成人してからも一緒に通いました。",
+]
+NAMES = ["太郎", "花子", "道後の常連", "松山市民", "ラーメン好き", "NORIファン", "匿名希望"]
+MENUS = ["塩ラーメン", "焦がしガーリック", "わさび塩", "裏メニュー", "醤油ラーメン", "つけ麺", "チャーシュー丼"]
+MENU_SEPARATORS = [", ", "、", "，", ";", "\n"]
+
+# 生成する画像のサイズ（スマートフォン・デジカメで撮影した写真を想定）
+IMAGE_SIZES = [(4032, 3024), (3024, 4032), (1920, 1080), (1600, 1200), (800, 600)]
+
+# タイムスタンプの起点
+START_TIME = datetime(2026, 1, 11, 8, 0, 0)
+
+
+def format_timestamp(dt: datetime) -> str:
+    """Googleフォームと同じ書式（例: 2026/01/11 8:32:53）に変換"""
+    return f"{dt:%Y/%m/%d} {dt.hour}:{dt:%M:%S}"
+
+
+def drive_url(rng: random.Random) -> str:
+    """Google ドライブの共有URLに似た文字列を生成"""
+    file_id = "".join(rng.choices(string.ascii_letters + string.digits + "-_", k=33))
+    return f"https://drive.google.com/open?id={file_id}"
+
+
+def comment_text(rng: random.Random) -> str:
+    """1〜6文の本文を生成（ときどき改行を含む）"""
+    sentences = rng.choices(SENTENCES, k=rng.randint(1, 6))
+    separator = "\n" if rng.random() < 0.2 else ""
+    return separator.join(sentences)
+
+
+def menu_text(rng: random.Random) -> str:
+    """0〜3個のメニューを様々な区切り文字で連結"""
+    if rng.random() < 0.3:
+        return ""
+    menus = rng.sample(MENUS, k=rng.randint(1, 3))
+    return rng.choice(MENU_SEPARATORS).join(menus)
+
+
+def generate_comments_csv(path: Path, rows: int, seed: int = 0) -> Path:
+    """
+    コメント投稿フォームのCSVを生成します。
+
+    Args:
+        path: 出力先のパス
+        rows: 行数
+        seed: 乱数のシード
+
+    Returns:
+        Path: 出力したCSVのパス
+    """
+    rng = random.Random(seed)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COMMENT_COLUMNS)
+        for i in range(rows):
+            writer.writerow([
+                format_timestamp(START_TIME + timedelta(minutes=7 * i, seconds=rng.randint(0, 59))),
+                comment_text(rng),
+                rng.choice(NAMES) if rng.random() < 0.6 else "",
+                menu_text(rng),
+            ])
+    return path
+
+
+def generate_photos_csv(path: Path, rows: int, seed: int = 0) -> Path:
+    """
+    写真投稿フォームのCSVを生成します。
+
+    Args:
+        path: 出力先のパス
+        rows: 行数
+        seed: 乱数のシード
+
+    Returns:
+        Path: 出力したCSVのパス
+    """
+    rng = random.Random(seed + 1)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(PHOTO_COLUMNS)
+        for i in range(rows):
+            writer.writerow([
+                format_timestamp(START_TIME + timedelta(minutes=11 * i, seconds=rng.randint(0, 59))),
+                drive_url(rng),
+                comment_text(rng) if rng.random() < 0.7 else "",
+                rng.choice(NAMES) if rng.random() < 0.6 else "",
+            ])
+    return path
+
+
+def generate_image(path: Path, size: tuple, rng: random.Random) -> Path:
+    """
+    写真に近い圧縮率になるよう、グラデーションにノイズを重ねた画像を生成します。
+    拡張子が .png の場合は PNG、それ以外は JPEG で保存します。
+    """
+    base = Image.linear_gradient("L").resize(size).convert("RGB")
+    tint = Image.new("RGB", size, tuple(rng.randint(60, 220) for _ in range(3)))
+    noise = Image.effect_noise(size, rng.randint(20, 60)).convert("RGB")
+    img = Image.blend(Image.blend(base, tint, 0.5), noise, 0.25)
+    if path.suffix.lower() == ".png":
+        img.save(path, "PNG")
+    else:
+        img.save(path, "JPEG", quality=rng.randint(80, 95))
+    return path
+
+
+def generate_image_corpus(directory: Path, count: int, seed: int = 0) -> list:
+    """
+    ベンチマーク用の画像を生成します（5枚に1枚は PNG）。
+
+    Args:
+        directory: 出力先ディレクトリ
+        count: 枚数
+        seed: 乱数のシード
+
+    Returns:
+        list: 生成した画像のパスのリスト
+    """
+    rng = random.Random(seed + 2)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(count):
+        suffix = ".png" if i % 5 == 4 else ".jpg"
+        paths.append(generate_image(directory / f"bench_{i:04d}{suffix}", rng.choice(IMAGE_SIZES), rng))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ベンチマーク用の合成データを生成")
+    parser.add_argument("--rows", type=int, default=1000, help="コメントCSVの行数")
+    parser.add_argument("--photo-rows", type=int, default=None, help="写真CSVの行数（デフォルト: コメントの1/5）")
+    parser.add_argument("--images", type=int, default=0, help="生成する画像の枚数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    parser.add_argument("--output", type=Path, required=True, help="出力先ディレクトリ")
+    args = parser.parse_args()
+
+    photo_rows = args.photo_rows if args.photo_rows is not None else args.rows // 5
+    print(f"📝 コメントCSVを生成中: {args.rows} 行")
+    generate_comments_csv(args.output / "comments.csv", args.rows, args.seed)
+    print(f"📝 写真CSVを生成中: {photo_rows} 行")
+    generate_photos_csv(args.output / "photos.csv", photo_rows, args.seed)
+    if args.images:
+        print(f"🖼️ 画像を生成中: {args.images} 枚")
+        generate_image_corpus(args.output / "raw_images", args.images, args.seed)
+    print(f"✅ 生成完了: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,18 +12,45 @@ Usage:
     python build.py [--csv-url URL]
 """
 
+from __future__ import annotations
+
 import os
 import sys
 import argparse
 from pathlib import Path
 from datetime import datetime
+import csv
+import importlib
 import json
+import re
+import threading
+import time
+import types
+from contextlib import contextmanager
+
+
+class LazyModule(types.ModuleType):
+    """
+    最初に属性を参照したときに import するモジュールの代理。
+    
+    pandas / Pillow / markdown / requests / Jinja2 は読み込みに時間がかかるため、
+    実際に使うステージが実行されるまで import しません。
+    テンプレートだけを作り直すビルドでは、CSV の取得や画像処理のライブラリを読み込まずに済みます。
+    """
+    
+    def __getattr__(self, name):
+        module = self.__dict__.get("_module")
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_module"] = module
+        return getattr(module, name)
+
 
-import pandas as pd
-import markdown
-import requests
-from jinja2 import Environment, FileSystemLoader
-from PIL import Image
+pd = LazyModule("pandas")
+markdown = LazyModule("markdown")
+requests = LazyModule("requests")
+jinja2 = LazyModule("jinja2")
+Image = LazyModule("PIL.Image")
 
 # =============================================================================
 # 設定
@@ -41,13 +68,89 @@ STATIC_DIR = BASE_DIR / "static"
 OUTPUT_IMAGES_DIR = STATIC_DIR / "images"
 PUBLIC_DIR = BASE_DIR / "public"
 CONFIG_FILE = BASE_DIR / "config.json"
+STATE_DB_FILE = DATA_DIR / ".state.db"  # 取得状態・写真ストア・画像マニフェストの SQLite データベース（WAL）
+# 以前の JSON 形式の状態ファイル（初回に STATE_DB_FILE へ移行し、*.migrated に名前を変更）
 DOWNLOAD_HISTORY_FILE = DATA_DIR / ".download_history.json"
+PHOTO_STORE_FILE = DATA_DIR / ".photo_store.json"
+IMAGE_MANIFEST_FILE = DATA_DIR / ".image_manifest.json"
+FETCH_STATE_FILE = DATA_DIR / ".fetch_state.json"
+BUILD_STATE_FILE = DATA_DIR / ".build_state.json"
+STAGE_CACHE_DIR = DATA_DIR / ".stage_cache"
+TRACE_FILE = DATA_DIR / ".build_trace.json"
+PROFILE_DIR = DATA_DIR / ".profile"
+JINJA_CACHE_DIR = DATA_DIR / ".jinja_cache"  # コンパイル済みテンプレートのキャッシュ
 
 # 画像処理設定
 MAX_IMAGE_WIDTH = 1200  # 最大幅（ピクセル）
 MAX_IMAGE_HEIGHT = 800  # 最大高さ（ピクセル）
 IMAGE_QUALITY = 85      # JPEG/WebP品質（1-100）
 OUTPUT_FORMAT = "webp"  # 出力フォーマット（webp または jpg）
+IMAGE_VARIANT_WIDTHS = [480, 800]  # srcset 用に追加で出力する幅（ピクセル、最大幅より小さいもののみ）
+IMAGE_AVIF = False      # True の場合は AVIF 版も出力（Pillow が AVIF に対応している場合のみ）
+IMAGE_WORKERS = 1       # エンコードに使うプロセス数（1 で逐次処理、0 で CPU コア数）
+IMAGE_MEMORY_BUDGET_MB = 1024  # 並列デコード時に同時に展開する画像の見積もりメモリ上限（MB）
+IMAGE_PLACEHOLDER_WIDTH = 16  # 読み込み中に表示するぼかし画像の幅（ピクセル、0 で代表色のみ）
+IMAGE_FAST_DECODE = True  # JPEG を出力サイズに近い解像度で直接デコードする（draft）
+MAX_SOURCE_PIXELS = 100_000_000  # これより画素数の多い元画像はデコードせずにエラーにする（展開爆弾対策）
+
+# 画像ダウンロード設定
+DOWNLOAD_WORKERS = 8         # 同時ダウンロード数
+DOWNLOAD_PER_HOST_LIMIT = 4  # 同一ホストへの同時接続数の上限
+MAX_DOWNLOAD_MB = 50         # 1ファイルあたりの最大ダウンロードサイズ（MB）
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # ストリーミング時の読み込み単位（バイト）
+PHOTO_SIMILAR_DISTANCE = 4   # --dedupe-similar で同じ写真とみなす dHash のハミング距離（64ビット中）
+
+# HTTP 取得設定（CSV・写真で共通）
+HTTP_CONNECT_TIMEOUT = 5     # 接続のタイムアウト（秒）
+HTTP_READ_TIMEOUT = 20       # 受信が途切れてからのタイムアウト（秒）
+HTTP_RETRIES = 3             # 接続エラー・タイムアウト・429 / 5xx の再試行回数
+HTTP_BACKOFF_BASE = 0.5      # 再試行の待ち時間の基準（秒、1回ごとに2倍、0〜その値のランダムな待ち）
+HTTP_BACKOFF_MAX = 8         # 再試行の待ち時間の上限（秒）
+HTTP_RETRY_STATUSES = {429, 500, 502, 503, 504}
+HTTP_BREAKER_THRESHOLD = 5   # 同じホストで続けて失敗したら、そのホストへのリクエストを一時停止する回数
+HTTP_BREAKER_COOLDOWN = 60   # 一時停止する時間（秒）
+NETWORK_BUDGET_SECONDS = 300  # 1回のビルドでネットワークに使える時間（秒、0 で無制限、--network-budget）
+
+# public/ への静的ファイルの配置方法
+# "auto": reflink → ハードリンク → コピーの順に試す / "copy": 常にコピー
+STATIC_SYNC_MODE = "auto"
+
+# public/ のテキストファイルの事前圧縮（.gz / .br を横に出力）
+COMPRESS_EXTENSIONS = {".html", ".css", ".js", ".json", ".svg", ".txt", ".xml"}
+COMPRESS_MIN_SIZE = 256  # これより小さいファイルは圧縮しない（バイト）
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# --minify で CSS から削除しないクラス（Bootstrap の JavaScript が実行時に付けるものなど）
+CSS_PURGE_SAFELIST = [
+    "active", "show", "showing", "hiding", "fade", "collapsing",
+    "modal-open", "modal-backdrop", "modal-static",
+]
+
+# タイムライン分割設定（config.json の "timeline" で上書き可能）
+TIMELINE_INITIAL_ITEMS = 20  # index.html に直接埋め込むコメント数（0 で全件を埋め込む）
+TIMELINE_CHUNK_SIZE = 20     # public/timeline/page-N.html 1ページあたりのコメント数
+
+# 想い出の検索インデックス（public/search/）
+SEARCH_SHARD_COUNT = 16     # 転置インデックスの分割数（index-N.json）
+SEARCH_DOCS_PER_FILE = 200  # 検索結果の表示用データ（docs-N.json）1ファイルあたりの件数
+SEARCH_SNIPPET_LENGTH = 80  # 検索結果に表示する本文の文字数
+
+# --stream-ingest の設定
+STREAM_CHUNK_ROWS = 5000  # CSVを一度に読み込んで正規化する行数
+MERGED_COLUMNS = ["timestamp", "comment", "name", "menu", "photo"]
+
+# HTML の書き出し（テンプレートの出力をこの件数ずつまとめてファイルに書き込む）
+RENDER_BUFFER_SIZE = 64
+
+# --skip-fetch 時にローカルのCSVを読み込む方法
+# "pandas": pandas で読み込む / "csv": 標準ライブラリの csv モジュールで読み込む（pandas を import しないため起動が速い）
+INGEST_ENGINE = "pandas"
+
+# --watch の設定
+WATCH_INTERVAL = 0.5  # 入力の変更を確認する間隔（秒）
+WATCH_PORT = 8000     # プレビューサーバーのポート
+LIVE_RELOAD_PATH = "/__livereload"  # ライブリロード通知（Server-Sent Events）のパス
 
 # Google スプレッドシートの公開CSV URL
 # 環境変数 CSV_URL で設定するか、コマンドライン引数 --csv-url で指定してください
@@ -61,24 +164,18 @@ DEFAULT_PHOTO_URL = os.environ.get("PHOTO_URL", "")
 # ユーティリティ関数
 # =============================================================================
 
-def normalize_form_df(df: pd.DataFrame, kind: str) -> pd.DataFrame:
-    """Googleフォーム由来のCSVを共通スキーマに正規化します。
-
-    共通スキーマ:
-      - timestamp: タイムスタンプ
-      - comment:   想い出本文
-      - name:      公開可能なお名前
-      - menu:      好きだったメニュー（コメントフォームのみ想定）
-      - photo:     写真URL（写真フォームのみ想定）
-
-    kind:
-      - "comments": コメント投稿フォーム
-      - "photos":   写真投稿フォーム
+def form_columns(cols: list, kind: str) -> dict:
     """
-    if df is None or df.empty:
-        return pd.DataFrame(columns=["timestamp", "comment", "name", "menu", "photo"])
-
-    cols = [str(c) for c in df.columns]
+    Googleフォーム由来のCSVの列名から、共通スキーマの各項目に対応する列を探します。
+    
+    Args:
+        cols: CSVの列名のリスト
+        kind: "comments"（コメント投稿フォーム）または "photos"（写真投稿フォーム）
+    
+    Returns:
+        dict: 共通スキーマの項目名をキーとした列名（見つからない場合は None）の辞書
+    """
+    cols = [str(c) for c in cols]
 
     def find_col(*keywords: str) -> str | None:
         for c in cols:
@@ -106,27 +203,82 @@ def normalize_form_df(df: pd.DataFrame, kind: str) -> pd.DataFrame:
             "写真にまつわる想い出"
         )
         photo_col = "想い出の写真"
-        if photo_col not in df.columns:
+        if photo_col not in cols:
             raise KeyError(f"PHOTO_URL 列 '{photo_col}' が見つかりません。columns={cols}")
         menu_col = find_col("好きだったメニュー", "メニュー", "menu")  # もし混ざってても拾う
+    return {"timestamp": ts_col, "comment": comment_col, "name": name_col, "menu": menu_col, "photo": photo_col}
+
+
+def normalize_form_df(df: pd.DataFrame, kind: str) -> pd.DataFrame:
+    """Googleフォーム由来のCSVを共通スキーマに正規化します。
+
+    共通スキーマ:
+      - timestamp: タイムスタンプ
+      - comment:   想い出本文
+      - name:      公開可能なお名前
+      - menu:      好きだったメニュー（コメントフォームのみ想定）
+      - photo:     写真URL（写真フォームのみ想定）
+
+    kind:
+      - "comments": コメント投稿フォーム
+      - "photos":   写真投稿フォーム
+    
+    df に行の辞書のリスト（csv エンジン）を渡した場合は normalize_form_records() で処理します。
+    """
+    if isinstance(df, list):
+        return normalize_form_records(df, kind)
+    
+    if df is None or df.empty:
+        return pd.DataFrame(columns=["timestamp", "comment", "name", "menu", "photo"])
+
+    columns = form_columns(df.columns, kind)
     # 列名が取れない場合は、従来の並び（先頭から）にフォールバック
     def safe_iloc(i: int) -> pd.Series:
         if df.shape[1] > i:
             return df.iloc[:, i]
-        return pd.Series([""] * len(df))
+        return pd.Series([""] * len(df), index=df.index)
 
     out = pd.DataFrame({
-        "timestamp": df[ts_col] if ts_col else safe_iloc(0),
-        "comment": df[comment_col] if comment_col else safe_iloc(1),
-        "name": df[name_col] if name_col else safe_iloc(2),
-        "menu": df[menu_col] if menu_col else pd.Series([""] * len(df)),
-        "photo": df[photo_col] if photo_col else pd.Series([""] * len(df)),
+        "timestamp": df[columns["timestamp"]] if columns["timestamp"] else safe_iloc(0),
+        "comment": df[columns["comment"]] if columns["comment"] else safe_iloc(1),
+        "name": df[columns["name"]] if columns["name"] else safe_iloc(2),
+        "menu": df[columns["menu"]] if columns["menu"] else pd.Series([""] * len(df), index=df.index),
+        "photo": df[columns["photo"]] if columns["photo"] else pd.Series([""] * len(df), index=df.index),
     })
-
     # NaNを空文字に寄せる（後段の処理を単純化）
     out = out.fillna("")
     return out
 
+
+def normalize_form_records(records: list, kind: str) -> list:
+    """
+    normalize_form_df() の csv エンジン版です。
+    
+    Args:
+        records: read_csv_records() で読み込んだ行の辞書のリスト
+        kind: "comments"（コメント投稿フォーム）または "photos"（写真投稿フォーム）
+    
+    Returns:
+        list: 共通スキーマ（timestamp, comment, name, menu, photo）の辞書のリスト
+    """
+    if not records:
+        return []
+    
+    cols = list(records[0])
+    columns = form_columns(cols, kind)
+    # 列名が取れない場合は、従来の並び（先頭から）にフォールバック
+    fallback = {"timestamp": 0, "comment": 1, "name": 2}
+    keys = {}
+    for field, col in columns.items():
+        if col is None and field in fallback and len(cols) > fallback[field]:
+            col = cols[fallback[field]]
+        keys[field] = col
+    return [
+        {field: (row[col] if col else "") for field, col in keys.items()}
+        for row in records
+    ]
+
+
 def ensure_directories():
     """
     必要なディレクトリが存在することを確認し、なければ作成します。
@@ -159,33 +311,479 @@ def load_config() -> dict:
         return {}
 
 
-def fetch_csv_data(csv_url: str) -> pd.DataFrame:
+STATE_DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS migrations (name TEXT PRIMARY KEY, migrated_at TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS fetch_state (name TEXT PRIMARY KEY, entry TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS image_manifest (filename TEXT PRIMARY KEY, source_hash TEXT, entry TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS compress_no_gain (file TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS image_manifest_source_hash ON image_manifest (source_hash);
+CREATE TABLE IF NOT EXISTS photo_contents (sha256 TEXT PRIMARY KEY, filename TEXT NOT NULL, size INTEGER, dhash TEXT, added_at TEXT);
+CREATE INDEX IF NOT EXISTS photo_contents_filename ON photo_contents (filename);
+CREATE TABLE IF NOT EXISTS photo_urls (url TEXT PRIMARY KEY, sha256 TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS photo_urls_sha256 ON photo_urls (sha256);
+CREATE TABLE IF NOT EXISTS download_history (url_hash TEXT PRIMARY KEY, url TEXT, filename TEXT, timestamp TEXT, downloaded_at TEXT);
+CREATE INDEX IF NOT EXISTS download_history_filename ON download_history (filename);
+CREATE TABLE IF NOT EXISTS failed_urls (url TEXT PRIMARY KEY, error TEXT, attempts INTEGER NOT NULL, last_failed_at TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS menu_row_tokens (fingerprint TEXT PRIMARY KEY, version TEXT NOT NULL, tokens TEXT NOT NULL);
+"""
+
+# スキーマ作成と JSON からの移行が済んだデータベースのパス（プロセス内で1回だけ行う）
+_state_db_ready = set()
+_state_db_lock = threading.Lock()
+
+
+@contextmanager
+def state_db():
+    """
+    状態データベース（STATE_DB_FILE）に接続します。
+    
+    with state_db() as conn: の形で使い、ブロックを正常に抜けるとコミット、
+    例外の場合はロールバックして接続を閉じます。
+    WAL モードのため、別のスレッドやプロセスが書き込み中でも読み込みは待たされません。
+    接続はスレッド間で共有せず、使うたびに開いてください。
+    
+    初回の接続時にテーブルを作成し、JSON 形式の状態ファイルがあれば移行します。
+    
+    Yields:
+        sqlite3.Connection: データベース接続
+    """
+    import sqlite3
+    
+    STATE_DB_FILE.parent.mkdir(parents=True, exist_ok=True)
+    key = str(STATE_DB_FILE)
+    exists = STATE_DB_FILE.exists()
+    conn = sqlite3.connect(STATE_DB_FILE, timeout=30)
+    try:
+        with _state_db_lock:
+            if key not in _state_db_ready or not exists:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(STATE_DB_SCHEMA)
+                migrate_json_state(conn)
+                _state_db_ready.add(key)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def migrate_json_state(conn):
+    """
+    JSON 形式の状態ファイルを状態データベースに移行します（ファイルごとに1回だけ）。
+    
+    移行したファイルは <ファイル名>.migrated に名前を変更して残します。
+    同時に起動した別のプロセスと二重に移行しないよう、書き込みロックを取ってから確認します。
+    
+    Args:
+        conn: 状態データベースの接続
+    """
+    sources = [
+        ("fetch_state", FETCH_STATE_FILE, write_fetch_state),
+        ("image_manifest", IMAGE_MANIFEST_FILE, write_image_manifest),
+        ("photo_store", PHOTO_STORE_FILE, write_photo_store),
+        ("download_history", DOWNLOAD_HISTORY_FILE, write_download_history),
+    ]
+    for name, path, write in sources:
+        if not path.exists():
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM migrations WHERE name = ?", (name,)).fetchone():
+                conn.rollback()
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if name == "photo_store":
+                data.setdefault("urls", {})
+                data.setdefault("contents", {})
+            write(conn, data)
+            conn.execute("INSERT INTO migrations VALUES (?, ?)", (name, datetime.now().isoformat()))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"  ⚠️ {path.name} の移行に失敗: {e}")
+            continue
+        os.replace(path, path.with_name(f"{path.name}.migrated"))
+        print(f"  📦 {path.name} を {STATE_DB_FILE.name} に移行しました")
+
+
+def sync_state_table(conn, table: str, rows: dict) -> int:
+    """
+    テーブルの内容を rows と同じにします。変わった行の書き込みと、なくなった行の削除だけを行います。
+    
+    Args:
+        conn: 状態データベースの接続
+        table: テーブル名（1列目が主キー）
+        rows: 主キーをキー、残りの列の値のタプルを値とした辞書
+    
+    Returns:
+        int: 書き込み・削除した行数
+    """
+    current = {row[0]: tuple(row[1:]) for row in conn.execute(f"SELECT * FROM {table}")}
+    removed = [(key,) for key in current.keys() - rows.keys()]
+    changed = [(key, *values) for key, values in rows.items() if current.get(key) != values]
+    key_column = conn.execute(f"PRAGMA table_info({table})").fetchone()[1]
+    conn.executemany(f"DELETE FROM {table} WHERE {key_column} = ?", removed)
+    if changed:
+        placeholders = ", ".join("?" * len(changed[0]))
+        conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})", changed)
+    return len(removed) + len(changed)
+
+
+def write_fetch_state(conn, fetch_state: dict):
+    """取得状態を書き込みます（変わったエントリだけを更新し、なくなったものは削除）。"""
+    sync_state_table(conn, "fetch_state", {
+        name: (json.dumps(entry, ensure_ascii=False),) for name, entry in fetch_state.items()
+    })
+
+
+def write_image_manifest(conn, manifest: dict):
+    """画像マニフェストを書き込みます（変わったエントリだけを更新し、なくなったものは削除）。"""
+    sync_state_table(conn, "image_manifest", {
+        filename: (entry.get("source_hash"), json.dumps(entry, ensure_ascii=False))
+        for filename, entry in manifest.items()
+    })
+
+
+def write_photo_store(conn, store: dict):
+    """写真ストアを書き込みます（写真は削除しないため、追加・更新のみ）。"""
+    conn.executemany(
+        "INSERT OR REPLACE INTO photo_contents VALUES (?, ?, ?, ?, ?)",
+        ((sha, entry["filename"], entry.get("size"), entry.get("dhash"), entry.get("added_at"))
+         for sha, entry in store["contents"].items()),
+    )
+    conn.executemany("INSERT OR REPLACE INTO photo_urls VALUES (?, ?)", store["urls"].items())
+
+
+def write_download_history(conn, history: dict):
+    """旧形式のダウンロード履歴（URLのMD5の先頭8文字がキー）を書き込みます。"""
+    conn.executemany(
+        "INSERT OR REPLACE INTO download_history VALUES (?, ?, ?, ?, ?)",
+        ((url_hash, entry.get("url"), entry.get("filename"), entry.get("timestamp"), entry.get("downloaded_at"))
+         for url_hash, entry in history.items()),
+    )
+
+
+def load_fetch_state() -> dict:
+    """
+    CSV取得のバリデータ（ETag / Last-Modified / 本文ハッシュ）を読み込みます。
+    各エントリの changed フラグは今回のビルドで取得し直すまで False として扱います。
+    
+    Returns:
+        dict: キャッシュファイル名をキーとした取得状態の辞書
+    """
+    fetch_state = {}
+    try:
+        with state_db() as conn:
+            fetch_state = {name: json.loads(entry) for name, entry in conn.execute("SELECT name, entry FROM fetch_state")}
+    except Exception as e:
+        print(f"  ⚠️ CSV取得状態の読み込みに失敗: {e}")
+    for entry in fetch_state.values():
+        entry["changed"] = False
+    return fetch_state
+
+
+def save_fetch_state(fetch_state: dict):
+    """
+    CSV取得のバリデータを保存します。
+    
+    Args:
+        fetch_state: キャッシュファイル名をキーとした取得状態の辞書
+    """
+    try:
+        with state_db() as conn:
+            write_fetch_state(conn, fetch_state)
+    except Exception as e:
+        print(f"  ⚠️ CSV取得状態の保存に失敗: {e}")
+
+
+_network_lock = threading.Lock()
+_network_deadline = None  # ネットワーク予算の期限（time.monotonic()、None なら無制限）
+_host_circuits = {}       # ホスト名 → {"failures": 連続失敗回数, "open_until": 一時停止の期限}
+
+
+def reset_network_state(budget_seconds: float = 0):
+    """
+    ネットワーク予算を設定し、ホストごとの失敗回数を消去します（ビルドの開始時に呼び出します）。
+    
+    Args:
+        budget_seconds: これから使えるネットワークの時間（秒、0 以下なら無制限）
+    """
+    global _network_deadline
+    
+    with _network_lock:
+        _network_deadline = time.monotonic() + budget_seconds if budget_seconds and budget_seconds > 0 else None
+        _host_circuits.clear()
+
+
+def network_time_left() -> float | None:
+    """
+    ネットワーク予算の残り時間を返します。
+    
+    Returns:
+        float | None: 残り秒数（無制限なら None）
+    """
+    if _network_deadline is None:
+        return None
+    return _network_deadline - time.monotonic()
+
+
+def check_network_budget(url: str):
+    """
+    ネットワーク予算を使い切っていれば requests.Timeout を送出します。
+    
+    リクエストの開始前に加え、本文を少しずつ受信するループの中でも呼び出し、
+    受信が遅いレスポンスでビルドが予算を超えて止まらないようにします。
+    
+    Args:
+        url: 取得中のURL（エラーメッセージ用）
+    
+    Raises:
+        requests.Timeout: 予算を使い切った場合
+    """
+    left = network_time_left()
+    if left is not None and left <= 0:
+        raise requests.Timeout(f"ネットワーク予算を使い切りました: {url}")
+
+
+def record_host_result(host: str, ok: bool):
+    """
+    ホストへのリクエストの成否を記録し、続けて失敗したホストへのリクエストを一時停止します。
+    
+    一時停止の期限が過ぎたホストには再びリクエストを送り、成功すれば失敗回数を消去、
+    失敗すればすぐにまた一時停止します。
+    
+    Args:
+        host: ホスト名
+        ok: 応答を受け取れた場合 True（再試行しても 429 / 5xx、接続エラー、タイムアウトだった場合は False）
+    """
+    with _network_lock:
+        if ok:
+            _host_circuits.pop(host, None)
+            return
+        circuit = _host_circuits.setdefault(host, {"failures": 0, "open_until": 0.0})
+        circuit["failures"] += 1
+        if circuit["failures"] >= HTTP_BREAKER_THRESHOLD:
+            if circuit["open_until"] <= time.monotonic():
+                print(f"  ⚠️ {host} への失敗が続いたため {HTTP_BREAKER_COOLDOWN} 秒間リクエストを停止します")
+            circuit["open_until"] = time.monotonic() + HTTP_BREAKER_COOLDOWN
+
+
+def http_get(url: str, session: requests.Session | None = None, headers: dict | None = None, stream: bool = False) -> requests.Response:
+    """
+    タイムアウト・再試行・ホストごとの一時停止・ネットワーク予算を適用して GET します。
+    
+    接続エラー・タイムアウト・429 / 5xx の場合は、最大 HTTP_RETRIES 回まで
+    ランダムな待ち時間（指数バックオフ）を挟んで再試行します。
+    最後の試行も 429 / 5xx だった場合はそのレスポンスを返すため、
+    呼び出し側の raise_for_status() で例外になります。
+    
+    予算を使い切った場合は requests.Timeout、一時停止中のホストには
+    requests.ConnectionError を送出するため、呼び出し側は通常の取得失敗と同じく
+    キャッシュに切り替えられます。複数のスレッドから呼び出せます。
+    
+    Args:
+        url: 取得するURL
+        session: 使用するセッション（省略時は requests.get）
+        headers: リクエストヘッダー
+        stream: True の場合は本文を読み込まずに返す
+    
+    Returns:
+        requests.Response: レスポンス
+    
+    Raises:
+        requests.RequestException: 再試行しても取得できなかった場合
+    """
+    import random
+    from urllib.parse import urlsplit
+    
+    host = urlsplit(url).hostname or ""
+    get = session.get if session is not None else requests.get
+    attempt = 0
+    while True:
+        with _network_lock:
+            circuit = _host_circuits.get(host)
+            if circuit and circuit["open_until"] > time.monotonic():
+                raise requests.ConnectionError(f"{host} へのリクエストは一時停止中です（連続 {circuit['failures']} 回失敗）")
+        check_network_budget(url)
+        left = network_time_left()
+        
+        # 予算の残りより長く待たないようにタイムアウトを短くする
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        if left is not None:
+            timeout = (min(timeout[0], left), min(timeout[1], left))
+        
+        try:
+            response = get(url, headers=headers, timeout=timeout, stream=stream)
+        except requests.exceptions.SSLError:
+            # 証明書の問題は再試行しても直らない
+            raise
+        except (requests.ConnectionError, requests.Timeout) as e:
+            response, error = None, e
+        else:
+            if response.status_code not in HTTP_RETRY_STATUSES:
+                record_host_result(host, True)
+                return response
+            error = None
+        
+        attempt += 1
+        delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** (attempt - 1)))
+        left = network_time_left()
+        if attempt > HTTP_RETRIES or (left is not None and delay >= left):
+            # 一時停止の判定には、再試行を使い切ったリクエストを1回の失敗として数える
+            record_host_result(host, False)
+            if error is not None:
+                raise error
+            return response
+        
+        if response is not None:
+            response.close()
+        time.sleep(delay)
+
+
+def fetch_csv_if_changed(url: str, cache_path: Path, fetch_state: dict) -> str | None:
+    """
+    条件付きリクエストでCSVを取得し、前回から変わっている場合のみ本文を返します。
+    
+    キャッシュファイルが前回保存したものと同一の場合に限り、
+    If-None-Match / If-Modified-Since を送信します。304 が返った場合や、
+    200 でも本文のハッシュが前回と同じ場合は「変更なし」として None を返します。
+    
+    Args:
+        url: CSV形式で公開されたスプレッドシートのURL
+        cache_path: ローカルキャッシュのパス（fetch_state のキーにも使用）
+        fetch_state: load_fetch_state() で読み込んだ取得状態（この関数が更新します）
+    
+    Returns:
+        str | None: 変更があった場合はCSV本文、変更がなければ None
+    
+    Raises:
+        requests.RequestException: 取得に失敗した場合
+    """
+    import hashlib
+    
+    url_hash, cache_valid, headers = conditional_request(url, cache_path, fetch_state)
+    
+    response = http_get(url, headers=headers)
+    count_stage("requests")
+    if response.status_code == 304 and cache_valid:
+        mark_not_modified(cache_path, fetch_state)
+        return None
+    response.raise_for_status()
+    
+    count_stage("bytes_fetched", len(response.content))
+    body_hash = hashlib.sha256(response.content).hexdigest()
+    if not record_fetch_response(cache_path, fetch_state, response, url_hash, body_hash, cache_valid):
+        return None
+    
+    # レスポンスのエンコーディングをUTF-8に設定
+    response.encoding = 'utf-8'
+    return response.text
+
+
+def conditional_request(url: str, cache_path: Path, fetch_state: dict) -> tuple:
+    """
+    条件付きリクエストに使うヘッダーを求めます。
+    
+    キャッシュファイルが前回保存したものと同一の場合に限り、
+    If-None-Match / If-Modified-Since を付けます。
+    
+    Returns:
+        (URLのハッシュ, キャッシュが有効か, リクエストヘッダー) のタプル
+    """
+    import hashlib
+    
+    entry = fetch_state.get(cache_path.name, {})
+    url_hash = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    
+    # キャッシュが前回の取得結果そのものであることを確認してから条件付きリクエストにする
+    cache_valid = (
+        entry.get("url_hash") == url_hash
+        and cache_path.exists()
+        and entry.get("cache_hash") == compute_file_hash(cache_path)
+    )
+    headers = {}
+    if cache_valid:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return url_hash, cache_valid, headers
+
+
+def mark_not_modified(cache_path: Path, fetch_state: dict):
+    """304 Not Modified を受け取ったことを取得状態に記録します。"""
+    count_stage("not_modified")
+    entry = fetch_state.setdefault(cache_path.name, {})
+    entry["changed"] = False
+    entry["checked_at"] = datetime.now().isoformat()
+
+
+def record_fetch_response(cache_path: Path, fetch_state: dict, response, url_hash: str, body_hash: str, cache_valid: bool) -> bool:
+    """
+    取得したレスポンスのバリデータと本文ハッシュを取得状態に記録します。
+    
+    Returns:
+        bool: 前回から本文が変わっていれば True
+    """
+    entry = fetch_state.get(cache_path.name, {})
+    changed = not (cache_valid and entry.get("body_hash") == body_hash)
+    fetch_state[cache_path.name] = dict(
+        entry,
+        url_hash=url_hash,
+        etag=response.headers.get("ETag", ""),
+        last_modified=response.headers.get("Last-Modified", ""),
+        body_hash=body_hash,
+        changed=changed,
+        checked_at=datetime.now().isoformat(),
+    )
+    return changed
+
+
+def record_cache_file(cache_path: Path, fetch_state: dict):
+    """
+    キャッシュCSVを書き込んだ後に、そのハッシュを取得状態に記録します。
+    
+    Args:
+        cache_path: 書き込んだキャッシュファイルのパス
+        fetch_state: 取得状態の辞書
+    """
+    if cache_path.name in fetch_state:
+        fetch_state[cache_path.name]["cache_hash"] = compute_file_hash(cache_path)
+
+
+def fetch_csv_data(csv_url: str, fetch_state: dict | None = None) -> pd.DataFrame:
     """
     Google スプレッドシートからCSVデータを取得します。
+    前回から変更がない場合はローカルキャッシュを読み込み、書き直しません。
     
     Args:
         csv_url: CSV形式で公開されたスプレッドシートのURL
+        fetch_state: 条件付きリクエスト用の取得状態（省略時は常に取得し直す）
     
     Returns:
         pandas.DataFrame: 取得したデータ
     """
     print(f"\n📥 CSVデータを取得中: {csv_url[:50]}...")
     
+    if fetch_state is None:
+        fetch_state = {}
+    cache_path = DATA_DIR / "comments.csv"
+    
     try:
-        # URLからCSVを取得
-        response = requests.get(csv_url, timeout=30)
-        response.raise_for_status()
-        
-        # レスポンスのエンコーディングをUTF-8に設定
-        response.encoding = 'utf-8'
+        # URLからCSVを取得（変更がなければ None）
+        text = fetch_csv_if_changed(csv_url, cache_path, fetch_state)
+        if text is None:
+            print(f"  ⊙ 変更なし: キャッシュを使用します: {cache_path}")
+            return pd.read_csv(cache_path, encoding='utf-8')
         
         # CSVをDataFrameに変換
         from io import StringIO
-        df = pd.read_csv(StringIO(response.text), encoding='utf-8')
+        df = pd.read_csv(StringIO(text), encoding='utf-8')
         
         # ローカルにキャッシュとして保存
-        cache_path = DATA_DIR / "comments.csv"
         df.to_csv(cache_path, index=False, encoding="utf-8")
+        record_cache_file(cache_path, fetch_state)
         print(f"✓ CSVデータを保存: {cache_path}")
         print(f"  → {len(df)} 件のコメントを取得しました")
         print(f"df(Comments):\n{df}")
@@ -196,7 +794,6 @@ def fetch_csv_data(csv_url: str) -> pd.DataFrame:
         print(f"⚠️ CSVの取得に失敗しました: {e}")
         
         # キャッシュファイルがあれば使用
-        cache_path = DATA_DIR / "comments.csv"
         if cache_path.exists():
             print(f"  → キャッシュファイルを使用します: {cache_path}")
             return pd.read_csv(cache_path, encoding='utf-8')
@@ -206,62 +803,119 @@ def fetch_csv_data(csv_url: str) -> pd.DataFrame:
         return pd.DataFrame()
 
 
-def load_local_csv() -> pd.DataFrame:
+def read_csv_records(path: Path) -> list:
+    """
+    CSVを標準ライブラリの csv モジュールで読み込みます（csv エンジン）。
+    
+    pandas.read_csv() と同様に空行は読み飛ばし、重複した列名には ".1" などを付けます。
+    値はすべて文字列のまま扱い、空欄は空文字になります。
+    
+    Args:
+        path: CSVファイルのパス
+    
+    Returns:
+        list: 列名をキーとした行の辞書のリスト（列の順序はヘッダーの順）
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return []
+        
+        columns = []
+        for name in header:
+            unique, n = name, 0
+            while unique in columns:
+                n += 1
+                unique = f"{name}.{n}"
+            columns.append(unique)
+        
+        width = len(columns)
+        return [
+            dict(zip(columns, row + [""] * (width - len(row))))
+            for row in reader if row
+        ]
+
+
+def load_local_csv(engine: str = "pandas"):
     """
     ローカルのキャッシュCSVを読み込みます。
     正規化済みのmerged.csvを優先的に読み込みます。
     
+    Args:
+        engine: "pandas" または "csv"（pandas を読み込まずに標準ライブラリで処理）
+    
     Returns:
-        pandas.DataFrame: 読み込んだデータ（ファイルがなければ空のDataFrame）
+        pandas.DataFrame: 読み込んだデータ（ファイルがなければ空のDataFrame）。
+        engine="csv" の場合は行の辞書のリスト。
     """
+    if engine == "csv":
+        read_csv, empty = read_csv_records, list
+    else:
+        read_csv, empty = (lambda path: pd.read_csv(path, encoding='utf-8')), pd.DataFrame
+    
     # 正規化済みのmerged.csvを優先
     merged_path = DATA_DIR / "merged.csv"
     if merged_path.exists():
-        return pd.read_csv(merged_path, encoding='utf-8')
+        return read_csv(merged_path)
     
     # なければcomments.csvを読み込んで正規化
     cache_path = DATA_DIR / "comments.csv"
     if cache_path.exists():
-        df = pd.read_csv(cache_path, encoding='utf-8')
+        df = read_csv(cache_path)
         # 正規化して返す
         return normalize_form_df(df, "comments")
     
-    return pd.DataFrame()
+    return empty()
 
 
-def fetch_and_merge_csv_data(csv_url: str, photo_url: str = "") -> pd.DataFrame:
+def fetch_and_merge_csv_data(csv_url: str, photo_url: str = "", fetch_state: dict | None = None) -> pd.DataFrame:
     """
     コメントフォームと写真フォームの両方のCSVを取得してマージします。
+    両方とも前回から変更がなければ、保存済みの merged.csv をそのまま使用します。
     
     Args:
         csv_url: コメント投稿フォームのCSV URL
         photo_url: 写真投稿フォーム用のCSV URL（オプション）
+        fetch_state: 条件付きリクエスト用の取得状態（省略時は常に取得し直す）
     
     Returns:
         pandas.DataFrame: マージされたデータ
     """
+    if fetch_state is None:
+        fetch_state = {}
+    
     # コメントCSVを取得
-    df_comments = fetch_csv_data(csv_url)
+    df_comments = fetch_csv_data(csv_url, fetch_state)
     # コメントCSVを共通スキーマに正規化
     df_comments_norm = normalize_form_df(df_comments, "comments")
     
     # 写真投稿フォームのCSVも取得（URLが設定されている場合）
     if photo_url and photo_url.strip():
         print(f"\n📥 写真投稿フォームのCSVデータを取得中...")
+        photo_cache_path = DATA_DIR / "photos.csv"
+        merged_path = DATA_DIR / "merged.csv"
         try:
-            response = requests.get(photo_url, timeout=30)
-            response.raise_for_status()
-            response.encoding = 'utf-8'
-            
-            from io import StringIO
-            df_photos = pd.read_csv(StringIO(response.text), encoding='utf-8')
+            text = fetch_csv_if_changed(photo_url, photo_cache_path, fetch_state)
             
-            # 写真投稿データを保存
-            photo_cache_path = DATA_DIR / "photos.csv"
-            df_photos.to_csv(photo_cache_path, index=False, encoding="utf-8")
-            print(f"✓ 写真投稿CSVを保存: {photo_cache_path}")
-            print(f"  → {len(df_photos)} 件の写真投稿を取得しました")
-            print(f"df(Photos):\n{df_photos}")
+            if text is None:
+                print(f"  ⊙ 変更なし: キャッシュを使用します: {photo_cache_path}")
+                comments_changed = fetch_state.get("comments.csv", {}).get("changed", True)
+                if not comments_changed and merged_path.exists():
+                    # どちらも変わっていなければマージ済みの結果を再利用
+                    print(f"  ⊙ マージ済みのデータを使用します: {merged_path}")
+                    return pd.read_csv(merged_path, encoding='utf-8').fillna("")
+                df_photos = pd.read_csv(photo_cache_path, encoding='utf-8')
+            else:
+                from io import StringIO
+                df_photos = pd.read_csv(StringIO(text), encoding='utf-8')
+                
+                # 写真投稿データを保存
+                df_photos.to_csv(photo_cache_path, index=False, encoding="utf-8")
+                record_cache_file(photo_cache_path, fetch_state)
+                print(f"✓ 写真投稿CSVを保存: {photo_cache_path}")
+                print(f"  → {len(df_photos)} 件の写真投稿を取得しました")
+                print(f"df(Photos):\n{df_photos}")
             
             # 写真投稿CSVを共通スキーマに正規化
             df_photos_norm = normalize_form_df(df_photos, "photos")
@@ -269,12 +923,13 @@ def fetch_and_merge_csv_data(csv_url: str, photo_url: str = "") -> pd.DataFrame:
             if not df_photos_norm.empty:
                 df_merged = pd.concat([df_comments_norm, df_photos_norm], ignore_index=True, sort=False)
                 # タイムスタンプで新しいものが先頭に来るようソート
+                # （同じタイムスタンプはコメント・写真投稿の順、それぞれCSVの順のまま。--stream-ingest と同じ並び）
                 df_merged["_ts"] = pd.to_datetime(df_merged["timestamp"], errors="coerce")
-                df_merged = df_merged.sort_values("_ts", ascending=False).drop(columns=["_ts"])
+                df_merged = df_merged.sort_values("_ts", ascending=False, kind="stable").drop(columns=["_ts"])
                 # df_merged = df_merged.sort_values("_ts", ascending=False)
                 print(f"✓ コメントと写真投稿をマージ: 合計 {len(df_merged)} 件")
                 print("df_merged:\n", df_merged)
-                df_merged.to_csv(DATA_DIR / "merged.csv", index=False, encoding="utf-8")
+                df_merged.to_csv(merged_path, index=False, encoding="utf-8")
                 return df_merged
                 
         except requests.RequestException as e:
@@ -283,33 +938,634 @@ def fetch_and_merge_csv_data(csv_url: str, photo_url: str = "") -> pd.DataFrame:
     
     # コメントのみの場合もソートして返す
     df_comments_norm["_ts"] = pd.to_datetime(df_comments_norm["timestamp"], errors="coerce")
-    df_comments_norm = df_comments_norm.sort_values("_ts", ascending=False).drop(columns=["_ts"])
+    df_comments_norm = df_comments_norm.sort_values("_ts", ascending=False, kind="stable").drop(columns=["_ts"])
     return df_comments_norm
 
 
-def download_image_from_google_drive(url: str, output_path: Path) -> bool:
-    """Google DriveのURL（または直接画像URL）から画像をダウンロードします。
-
-    注意:
-      - Driveの共有設定が「リンクを知っている全員」等で公開されていない場合は取得できません。
-      - 大きいファイル等で Google のウイルススキャン確認（confirm=...）が必要な場合は2段階で取得します。
+def stream_csv_if_changed(url: str, cache_path: Path, fetch_state: dict) -> bool:
     """
-    try:
-        url = str(url).strip()
+    fetch_csv_if_changed() のストリーミング版です。
+    
+    本文をメモリに読み込まず、少しずつハッシュを計算しながら一時ファイルに書き込み、
+    前回から変わっていた場合だけキャッシュファイルと置き換えます。
+    キャッシュには受け取った本文をそのまま保存します。
+    
+    Args:
+        url: CSV形式で公開されたスプレッドシートのURL
+        cache_path: ローカルキャッシュのパス（fetch_state のキーにも使用）
+        fetch_state: load_fetch_state() で読み込んだ取得状態（この関数が更新します）
+    
+    Returns:
+        bool: キャッシュを更新した場合は True
+    
+    Raises:
+        requests.RequestException: 取得に失敗した場合
+    """
+    import hashlib
+    
+    url_hash, cache_valid, headers = conditional_request(url, cache_path, fetch_state)
+    
+    with http_get(url, headers=headers, stream=True) as response:
+        count_stage("requests")
+        if response.status_code == 304 and cache_valid:
+            mark_not_modified(cache_path, fetch_state)
+            return False
+        response.raise_for_status()
+        
+        tmp_path = cache_path.with_name(f".{cache_path.name}.part")
+        digest = hashlib.sha256()
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    check_network_budget(url)
+                    digest.update(chunk)
+                    f.write(chunk)
+                    count_stage("bytes_fetched", len(chunk))
+            changed = record_fetch_response(cache_path, fetch_state, response, url_hash, digest.hexdigest(), cache_valid)
+            if changed:
+                os.replace(tmp_path, cache_path)
+                record_cache_file(cache_path, fetch_state)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+    return changed
+
+
+def iter_normalized_rows(path: Path, kind: str):
+    """
+    CSVを STREAM_CHUNK_ROWS 行ずつ読み込み、normalize_form_df() で正規化した行を順に返します。
+    
+    チャンクごとに型の推定が変わらないよう、値はすべて文字列として読み込みます（空欄は空文字）。
+    
+    Args:
+        path: Googleフォーム由来のCSVのパス
+        kind: "comments" または "photos"
+    
+    Yields:
+        tuple: (timestamp, comment, name, menu, photo)
+    """
+    try:
+        reader = pd.read_csv(path, encoding="utf-8", dtype=str, keep_default_na=False, chunksize=STREAM_CHUNK_ROWS)
+    except pd.errors.EmptyDataError:
+        return
+    with reader:
+        for chunk in reader:
+            yield from normalize_form_df(chunk, kind).itertuples(index=False, name=None)
+
+
+def iter_rows_newest_first(path: Path, kind: str, spool_dir: Path):
+    """
+    iter_normalized_rows() の行を新しい順（ファイルの末尾から）に返します。
+    
+    正規化したチャンクを spool_dir に1つずつ書き出してから逆順に読み込むため、
+    メモリに載るのは1チャンク分だけです。
+    同じタイムスタンプの行はファイルの並び順のまま返します（安定ソートで新しい順に並べた場合と同じ）。
+    
+    Args:
+        path: Googleフォーム由来のCSVのパス
+        kind: "comments" または "photos"
+        spool_dir: チャンクを書き出す一時ディレクトリ
+    
+    Yields:
+        tuple: (タイムスタンプ（解釈できない場合は datetime.min）, 行のタプル)
+    """
+    import pickle
+    
+    chunk_paths = []
+    rows = []
+    for row in iter_normalized_rows(path, kind):
+        rows.append(row)
+        if len(rows) >= STREAM_CHUNK_ROWS:
+            chunk_paths.append(spool_dir / f"{path.stem}-{len(chunk_paths)}.pickle")
+            chunk_paths[-1].write_bytes(pickle.dumps(rows))
+            rows = []
+    
+    def reversed_rows():
+        yield from reversed(rows)
+        for chunk_path in reversed(chunk_paths):
+            yield from reversed(pickle.loads(chunk_path.read_bytes()))
+            chunk_path.unlink()
+    
+    # 逆順に読むと同じタイムスタンプの行も逆になるため、同じタイムスタンプの並びだけ元に戻す
+    same_ts = []
+    for row in reversed_rows():
+        ts = parse_timestamp_text(str(row[0])) or datetime.min
+        if same_ts and same_ts[0][0] != ts:
+            yield from reversed(same_ts)
+            same_ts = []
+        same_ts.append((ts, row))
+    yield from reversed(same_ts)
+
+
+def write_merged_csv(sources: list, merged_path: Path) -> int:
+    """
+    正規化した行をタイムスタンプの新しい順に k-way マージしながら merged.csv に書き込みます。
+    
+    Googleフォームの出力は投稿順（古い順）に並んでいるため、各CSVを末尾から読んだ行
+    （iter_rows_newest_first()）はそのまま heapq.merge() で新しい順に併合できます。
+    並びは fetch_and_merge_csv_data() と同じで、同じタイムスタンプの行は sources の順、
+    同じCSVの中ではファイルの順になります。
+    全体をメモリに読み込まないため、スプレッドシートが大きくてもメモリ使用量は増えません。
+    並びが崩れている行があってもすべて出力されます（表示時に新しい順に並べ替えます）。
+    
+    Args:
+        sources: (CSVのパス, フォームの種類) のリスト
+        merged_path: 出力先のパス
+    
+    Returns:
+        int: 書き込んだ行数
+    """
+    import heapq
+    import tempfile
+    
+    tmp_path = merged_path.with_name(f".{merged_path.name}.part")
+    rows = out_of_order = 0
+    previous = datetime.max
+    try:
+        with tempfile.TemporaryDirectory(dir=merged_path.parent) as spool_dir:
+            streams = [iter_rows_newest_first(path, kind, Path(spool_dir)) for path, kind in sources]
+            # 改行コードは DataFrame.to_csv() と揃える
+            with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f, lineterminator=os.linesep)
+                writer.writerow(MERGED_COLUMNS)
+                for ts, row in heapq.merge(*streams, key=lambda item: item[0], reverse=True):
+                    if ts > previous:
+                        out_of_order += 1
+                    previous = min(previous, ts)
+                    writer.writerow(row)
+                    rows += 1
+        os.replace(tmp_path, merged_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    
+    if out_of_order:
+        print(f"  ℹ️ 投稿順に並んでいない行が {out_of_order} 件あります（表示時に並べ替えます）")
+    return rows
+
+
+def fetch_and_merge_csv_stream(csv_url: str, photo_url: str = "", fetch_state: dict | None = None) -> int:
+    """
+    fetch_and_merge_csv_data() のストリーミング版です（--stream-ingest）。
+    
+    コメントフォームと写真フォームのCSVを少しずつ data/ に保存し、
+    チャンクごとに正規化してタイムスタンプ順にマージした data/merged.csv を書き出します。
+    DataFrame 全体を作らないため、後続のステージは必要になった時点で merged.csv を読み込みます。
+    どちらのCSVも merged.csv も前回から変わっていなければ、merged.csv は書き直しません。
+    merged.csv は fetch_and_merge_csv_data() と同じく新しい順に並びます。
+    
+    Args:
+        csv_url: コメント投稿フォームのCSV URL
+        photo_url: 写真投稿フォーム用のCSV URL（オプション）
+        fetch_state: 条件付きリクエスト用の取得状態（省略時は常に取得し直す）
+    
+    Returns:
+        int: merged.csv の行数（書き直さなかった場合は -1）
+    """
+    if fetch_state is None:
+        fetch_state = {}
+    
+    targets = [("コメント", csv_url, DATA_DIR / "comments.csv", "comments")]
+    if photo_url and photo_url.strip():
+        targets.append(("写真投稿", photo_url, DATA_DIR / "photos.csv", "photos"))
+    
+    for label, url, cache_path, _ in targets:
+        print(f"\n📥 {label}フォームのCSVデータを取得中（ストリーミング）: {url[:50]}...")
+        try:
+            if stream_csv_if_changed(url, cache_path, fetch_state):
+                print(f"✓ CSVデータを保存: {cache_path}")
+            else:
+                print(f"  ⊙ 変更なし: キャッシュを使用します: {cache_path}")
+        except requests.RequestException as e:
+            print(f"⚠️ {label}フォームのCSVの取得に失敗しました: {e}")
+            if cache_path.exists():
+                print(f"  → キャッシュファイルを使用します: {cache_path}")
+    
+    sources = [(cache_path, kind) for _, _, cache_path, kind in targets if cache_path.exists()]
+    merged_path = DATA_DIR / "merged.csv"
+    # マージ元のハッシュが同じで merged.csv も前回書き出したままなら再利用
+    merge_key = {cache_path.name: compute_file_hash(cache_path) for cache_path, _ in sources}
+    entry = fetch_state.get(merged_path.name, {})
+    if (merged_path.exists() and entry.get("sources") == merge_key
+            and entry.get("cache_hash") == compute_file_hash(merged_path)):
+        print(f"  ⊙ マージ済みのデータを使用します: {merged_path}")
+        return -1
+    
+    rows = write_merged_csv(sources, merged_path)
+    fetch_state[merged_path.name] = {
+        "sources": merge_key,
+        "cache_hash": compute_file_hash(merged_path),
+        "changed": True,
+        "checked_at": datetime.now().isoformat(),
+    }
+    print(f"✓ マージしたデータを保存: {merged_path}（{rows} 件）")
+    return rows
+
+
+def fingerprint_files(paths) -> str:
+    """
+    ファイル内容のフィンガープリントを計算します（存在しないファイルは無視）。
+    
+    Args:
+        paths: 対象ファイルのパスのリスト
+    
+    Returns:
+        str: ファイル名と内容ハッシュをまとめた SHA-256 ハッシュ
+    """
+    import hashlib
+    
+    digest = hashlib.sha256()
+    for path in paths:
+        if path.is_file():
+            digest.update(f"{path.relative_to(BASE_DIR)}:{compute_file_hash(path)}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def fingerprint_tree(directory: Path, pattern: str = "**/*") -> str:
+    """
+    ディレクトリ内のファイル内容のフィンガープリントを計算します。
+    
+    Args:
+        directory: 対象ディレクトリ
+        pattern: 対象ファイルの glob パターン
+    
+    Returns:
+        str: SHA-256 ハッシュ
+    """
+    if not directory.exists():
+        return fingerprint_files([])
+    return fingerprint_files(sorted(p for p in directory.glob(pattern) if p.is_file()))
+
+
+def fingerprint_tree_stat(directory: Path) -> str:
+    """
+    ディレクトリ内のファイルのメタデータ（ファイル名・サイズ・更新日時）から
+    フィンガープリントを計算します。画像のように数が多く大きいファイル向けです。
+    
+    Args:
+        directory: 対象ディレクトリ
+    
+    Returns:
+        str: SHA-256 ハッシュ
+    """
+    import hashlib
+    
+    digest = hashlib.sha256()
+    if directory.exists():
+        for path in sorted(directory.iterdir()):
+            if path.is_file():
+                stat = path.stat()
+                digest.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def combine_fingerprints(inputs: dict) -> str:
+    """
+    ステージの入力（名前 → フィンガープリント）を1つのフィンガープリントにまとめます。
+    
+    Args:
+        inputs: 入力名をキーとしたフィンガープリントの辞書
+    
+    Returns:
+        str: SHA-256 ハッシュ
+    """
+    import hashlib
+    
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_build_state() -> dict:
+    """
+    前回のビルド状態（ステージごとの入力フィンガープリント）を読み込みます。
+    
+    Returns:
+        dict: ビルド状態の辞書
+    """
+    if BUILD_STATE_FILE.exists():
+        try:
+            with open(BUILD_STATE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"  ⚠️ ビルド状態の読み込みに失敗: {e}")
+    return {}
+
+
+def save_build_state(build_state: dict):
+    """
+    ビルド状態を保存します。
+    
+    Args:
+        build_state: ビルド状態の辞書
+    """
+    try:
+        with open(BUILD_STATE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(build_state, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"  ⚠️ ビルド状態の保存に失敗: {e}")
+
+
+def check_stage(build_state: dict, stage: str, inputs: dict, outputs: list = ()) -> tuple:
+    """
+    ステージの入力が前回の実行時から変わっていないかを判定します。
+    
+    Args:
+        build_state: load_build_state() で読み込んだビルド状態
+        stage: ステージ名
+        inputs: 入力名をキーとしたフィンガープリントの辞書
+        outputs: 存在している必要がある出力ファイルのパス
+    
+    Returns:
+        tuple: (スキップ可能なら True, 理由の文字列)
+    """
+    previous = build_state.get("stages", {}).get(stage)
+    if not previous:
+        return False, "前回の記録なし"
+    
+    previous_inputs = previous.get("inputs", {})
+    changed = sorted(k for k in set(inputs) | set(previous_inputs) if inputs.get(k) != previous_inputs.get(k))
+    if changed:
+        return False, f"入力が変更: {', '.join(changed)}"
+    
+    for path in outputs:
+        if not path.exists():
+            return False, f"出力が見つからない: {path.relative_to(BASE_DIR)}"
+    
+    return True, "入力に変更なし"
+
+
+def record_stage(build_state: dict, stage: str, inputs: dict):
+    """
+    ステージの実行が完了したことを、入力のフィンガープリントとともに記録します。
+    
+    Args:
+        build_state: ビルド状態の辞書
+        stage: ステージ名
+        inputs: 入力名をキーとしたフィンガープリントの辞書
+    """
+    build_state.setdefault("stages", {})[stage] = {
+        "inputs": inputs,
+        "fingerprint": combine_fingerprints(inputs),
+        "updated_at": datetime.now().isoformat(),
+    }
+
+
+def load_stage_result(stage: str):
+    """
+    スキップしたステージの前回の結果をキャッシュから読み込みます。
+    
+    Args:
+        stage: ステージ名
+    
+    Returns:
+        前回の結果（キャッシュがなければ None）
+    """
+    cache_path = STAGE_CACHE_DIR / f"{stage}.json"
+    if not cache_path.exists():
+        return None
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"  ⚠️ {stage} の結果キャッシュの読み込みに失敗: {e}")
+        return None
+
+
+def save_stage_result(stage: str, result):
+    """
+    ステージの結果をキャッシュに保存します。
+    
+    Args:
+        stage: ステージ名
+        result: JSON に変換可能な結果
+    """
+    STAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(STAGE_CACHE_DIR / f"{stage}.json", 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+    except Exception as e:
+        print(f"  ⚠️ {stage} の結果キャッシュの保存に失敗: {e}")
+
+
+# 計測中のステージのカウンター（trace_stage() の実行中のみ辞書が入る）
+_stage_counters = None
+
+
+def count_stage(name: str, amount: int = 1):
+    """
+    計測中のステージのカウンターに加算します（計測中でなければ何もしません）。
+    
+    ダウンロード件数やエンコード件数、書き込みバイト数など、
+    ステージの処理量を各処理の中から記録するために使います。
+    メインスレッドから呼び出してください。
+    
+    Args:
+        name: カウンター名（例: "images_encoded", "bytes_written"）
+        amount: 加算する値
+    """
+    if _stage_counters is not None:
+        _stage_counters[name] = _stage_counters.get(name, 0) + amount
+
+
+@contextmanager
+def trace_stage(trace: dict, stage: str, profile: bool = False):
+    """
+    ステージの経過時間・CPU時間・カウンターを計測して trace に記録します。
+    
+    CPU時間はこのプロセスの分（cpu_s）と、終了済みの子プロセスの分（children_cpu_s）を
+    分けて記録します。画像エンコードをプロセスプールで行う場合は後者に含まれます。
+    
+    Args:
+        trace: 計測結果を追加する辞書（trace["stages"] にステージ名をキーとして記録）
+        stage: ステージ名
+        profile: True の場合は cProfile の結果を data/.profile/<stage>.pstats に保存
+    
+    Yields:
+        dict: このステージのカウンター（直接書き込むこともできます）
+    """
+    global _stage_counters
+    
+    counters = {}
+    previous_counters, _stage_counters = _stage_counters, counters
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+    
+    times_start = os.times()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        yield counters
+    finally:
+        if profiler:
+            profiler.disable()
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+        times_end = os.times()
+        _stage_counters = previous_counters
+        
+        entry = trace.setdefault("stages", {}).setdefault(stage, {})
+        entry.update({
+            "wall_s": round(wall, 4),
+            "cpu_s": round(cpu, 4),
+            "children_cpu_s": round(
+                (times_end.children_user - times_start.children_user)
+                + (times_end.children_system - times_start.children_system), 4),
+            "counters": counters,
+        })
+        if profiler:
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            profile_path = PROFILE_DIR / f"{stage}.pstats"
+            profiler.dump_stats(profile_path)
+            entry["profile"] = str(profile_path.relative_to(BASE_DIR)) if profile_path.is_relative_to(BASE_DIR) else str(profile_path)
+
+
+def save_trace(trace: dict):
+    """
+    ステージの計測結果を data/.build_trace.json に保存します。
+    
+    Args:
+        trace: trace_stage() で記録した辞書
+    """
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(TRACE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(trace, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"⚠️ 計測結果の保存に失敗: {e}")
+
+
+def create_download_session(pool_size: int = DOWNLOAD_WORKERS) -> requests.Session:
+    """
+    画像ダウンロード用の requests.Session を作成します。
+    スレッド間で keep-alive 接続を共有できるよう、接続プールをワーカー数に合わせて広げます。
+    
+    Args:
+        pool_size: ホストごとに保持する接続数
+    
+    Returns:
+        requests.Session: 接続プールを設定したセッション
+    """
+    from requests.adapters import HTTPAdapter
+    
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def sniff_image_type(head: bytes) -> str | None:
+    """
+    先頭バイト（マジックナンバー）から画像形式を判定します。
+    Content-Type が不正確な場合でも、実際の中身で画像かどうかを確認するために使います。
+    
+    Args:
+        head: ファイル先頭のバイト列（12バイト以上を推奨）
+    
+    Returns:
+        str | None: 画像形式（jpeg/png/gif/webp/bmp）、画像でなければ None
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"BM"):
+        return "bmp"
+    return None
+
+
+def save_image_response(resp: requests.Response, output_path: Path, max_bytes: int) -> bool:
+    """
+    ストリーミングのレスポンスを一時ファイルに分割して書き込み、検証後に配置します。
+    
+    - Content-Length または受信済みサイズが max_bytes を超えたら中断
+    - 先頭バイトが画像のマジックナンバーでなければ破棄
+    - 受信中にネットワーク予算を使い切ったら requests.Timeout で中断
+    - 検証に通った場合のみ os.replace で output_path に原子的にリネーム
+    
+    途中で中断しても output_path には何も書き込まれないため、
+    不完全なファイルが「ダウンロード済み」と誤判定されることはありません。
+    
+    Args:
+        resp: stream=True で取得したレスポンス
+        output_path: 最終的な保存先
+        max_bytes: 許容する最大バイト数
+    
+    Returns:
+        bool: 保存に成功した場合 True
+    """
+    import tempfile
+    
+    content_length = resp.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        print(f"  ✗ ファイルサイズが上限を超えています（{int(content_length):,} > {max_bytes:,} バイト）: {output_path.name}")
+        return False
+    
+    fd, tmp_name = tempfile.mkstemp(dir=output_path.parent, prefix=f".{output_path.name}.", suffix=".part")
+    tmp_path = Path(tmp_name)
+    try:
+        received = 0
+        head = b""
+        with os.fdopen(fd, "wb") as f:
+            for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                check_network_budget(output_path.name)
+                if not chunk:
+                    continue
+                received += len(chunk)
+                if received > max_bytes:
+                    print(f"  ✗ ファイルサイズが上限を超えたため中断しました（{max_bytes:,} バイト）: {output_path.name}")
+                    return False
+                if len(head) < 16:
+                    head += chunk[:16 - len(head)]
+                f.write(chunk)
+        
+        if sniff_image_type(head) is None:
+            print(f"  ✗ 画像ではないデータが返りました（アクセス権/URLを確認）: {output_path.name}")
+            return False
+        
+        os.replace(tmp_path, output_path)
+        return True
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def download_image_from_google_drive(url: str, output_path: Path, session: requests.Session | None = None, max_bytes: int | None = None) -> bool:
+    """Google DriveのURL（または直接画像URL）から画像をダウンロードします。
+
+    注意:
+      - Driveの共有設定が「リンクを知っている全員」等で公開されていない場合は取得できません。
+      - 大きいファイル等で Google のウイルススキャン確認（confirm=...）が必要な場合は2段階で取得します。
+      - session を渡すと接続を再利用します（省略時はこの呼び出し専用のセッションを作成）。
+      - レスポンスは一時ファイルへストリーミングし、画像と確認できた場合のみ output_path に配置します。
+      - max_bytes を超えるファイルは保存しません（省略時は MAX_DOWNLOAD_MB）。
+      - 接続エラーや 5xx は http_get() で再試行し、ネットワーク予算を使い切ると取得を諦めます。
+    """
+    # 呼び出し元からセッションを受け取らなかった場合は、作成したセッションを最後に閉じる
+    own_session = session is None
+    if own_session:
+        session = requests.Session()
+    try:
+        url = str(url).strip()
         if not url:
             return False
 
+        if max_bytes is None:
+            max_bytes = MAX_DOWNLOAD_MB * 1024 * 1024
+
         # 1) 直接画像URL（googleusercontent等）はそのままGET
         if "drive.google.com" not in url:
-            resp = requests.get(url, timeout=30)
-            resp.raise_for_status()
-            ct = (resp.headers.get("Content-Type") or "").lower()
-            if "text/html" in ct:
-                print(f"  ✗ 画像ではなくHTMLが返りました（アクセス権/URLを確認）: {url}")
-                return False
-            with open(output_path, "wb") as f:
-                f.write(resp.content)
-            return True
+            with http_get(url, session, stream=True) as resp:
+                resp.raise_for_status()
+                ct = (resp.headers.get("Content-Type") or "").lower()
+                if "text/html" in ct:
+                    print(f"  ✗ 画像ではなくHTMLが返りました（アクセス権/URLを確認）: {url}")
+                    return False
+                return save_image_response(resp, output_path, max_bytes)
 
         # 2) Google Drive URL から file_id を抽出
         file_id = None
@@ -326,8 +1582,6 @@ def download_image_from_google_drive(url: str, output_path: Path) -> bool:
             print(f"  ✗ URLからファイルIDを抽出できませんでした: {url}")
             return False
 
-        session = requests.Session()
-
         def _get_confirm_token(r: requests.Response) -> str | None:
             # cookie に confirm が付くことがある
             for k, v in r.cookies.items():
@@ -342,542 +1596,3270 @@ def download_image_from_google_drive(url: str, output_path: Path) -> bool:
 
         # まずは通常のダウンロードURLへ
         download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
-        r = session.get(download_url, timeout=30)
-        r.raise_for_status()
-
-        ct = (r.headers.get("Content-Type") or "").lower()
-
-        # confirm が必要な場合（ウイルススキャン/サイズ等）
-        if "text/html" in ct:
-            token = _get_confirm_token(r)
-            if token:
-                r = session.get(download_url + f"&confirm={token}", timeout=30)
-                r.raise_for_status()
-                ct = (r.headers.get("Content-Type") or "").lower()
-
-        # それでもHTMLなら、権限不足 or ログイン必須
-        if "text/html" in ct:
-            print(f"  ✗ Driveから画像を取得できません（共有設定/ログイン必須の可能性）: {url}")
-            return False
+        r = http_get(download_url, session, stream=True)
+        try:
+            r.raise_for_status()
+
+            ct = (r.headers.get("Content-Type") or "").lower()
+
+            # confirm が必要な場合（ウイルススキャン/サイズ等）
+            if "text/html" in ct:
+                token = _get_confirm_token(r)
+                if token:
+                    r.close()
+                    r = http_get(download_url + f"&confirm={token}", session, stream=True)
+                    r.raise_for_status()
+                    ct = (r.headers.get("Content-Type") or "").lower()
+
+            # それでもHTMLなら、権限不足 or ログイン必須
+            if "text/html" in ct:
+                print(f"  ✗ Driveから画像を取得できません（共有設定/ログイン必須の可能性）: {url}")
+                return False
+
+            return save_image_response(r, output_path, max_bytes)
+        finally:
+            r.close()
+
+    except requests.RequestException as e:
+        print(f"  ✗ ダウンロード失敗(HTTP): {e}")
+        return False
+    except Exception as e:
+        print(f"  ✗ ダウンロード失敗: {e}")
+        return False
+    finally:
+        if own_session:
+            session.close()
+
+
+def load_download_history() -> dict:
+    """
+    旧形式のダウンロード履歴を読み込みます。
+    
+    Returns:
+        dict: URLのハッシュ（MD5の先頭8文字）をキーとした履歴のエントリ
+              （url / filename / timestamp / downloaded_at）
+    """
+    try:
+        with state_db() as conn:
+            return {
+                url_hash: dict(zip(("url", "filename", "timestamp", "downloaded_at"), row))
+                for url_hash, *row in conn.execute(
+                    "SELECT url_hash, url, filename, timestamp, downloaded_at FROM download_history"
+                )
+            }
+    except Exception as e:
+        print(f"  ⚠️ ダウンロード履歴の読み込みに失敗: {e}")
+    return {}
+
+
+def load_photo_store() -> dict:
+    """
+    写真ストアを読み込みます。
+    
+    写真は内容の SHA-256 で管理し、同じ内容の写真は共有URLが違っても1つのファイルにまとめます。
+    
+    Returns:
+        dict: {"urls": {写真URL: SHA-256}, "contents": {SHA-256: {"filename": raw_images/ 内のファイル名, ...}}}
+    """
+    store = {"urls": {}, "contents": {}}
+    try:
+        with state_db() as conn:
+            for sha, filename, size, dhash, added_at in conn.execute("SELECT * FROM photo_contents"):
+                entry = {"filename": filename, "size": size, "added_at": added_at}
+                if dhash:
+                    entry["dhash"] = dhash
+                store["contents"][sha] = entry
+            store["urls"] = dict(conn.execute("SELECT url, sha256 FROM photo_urls"))
+    except Exception as e:
+        print(f"  ⚠️ 写真ストアの読み込みに失敗: {e}")
+    return store
+
+
+def save_photo_store(store: dict):
+    """
+    写真ストアを保存します。
+    
+    Args:
+        store: load_photo_store() で読み込んだ写真ストア
+    """
+    try:
+        with state_db() as conn:
+            write_photo_store(conn, store)
+    except Exception as e:
+        print(f"  ⚠️ 写真ストアの保存に失敗: {e}")
+
+
+def record_failed_urls(failures: dict, succeeded: list):
+    """
+    ダウンロードに失敗したURLを記録し、成功したURLの記録を消します。
+    
+    Args:
+        failures: 失敗したURLをキー、理由を値とした辞書
+        succeeded: 成功したURLのリスト
+    """
+    now = datetime.now().isoformat()
+    try:
+        with state_db() as conn:
+            conn.executemany(
+                "INSERT INTO failed_urls VALUES (?, ?, 1, ?) "
+                "ON CONFLICT (url) DO UPDATE SET error = excluded.error, attempts = attempts + 1, "
+                "last_failed_at = excluded.last_failed_at",
+                ((url, error, now) for url, error in failures.items()),
+            )
+            conn.executemany("DELETE FROM failed_urls WHERE url = ?", ((url,) for url in succeeded))
+    except Exception as e:
+        print(f"  ⚠️ 失敗したURLの記録に失敗: {e}")
+
+
+def load_photo_map() -> dict:
+    """
+    写真URLから、処理後の画像ファイル名（static/images/ 内）を引く辞書を作成します。
+    
+    Returns:
+        dict: 写真URLをキー、画像ファイル名を値とした辞書（ストアにないURLは含まない）
+    """
+    try:
+        with state_db() as conn:
+            rows = conn.execute("SELECT url, filename FROM photo_urls JOIN photo_contents USING (sha256)").fetchall()
+    except Exception as e:
+        print(f"  ⚠️ 写真ストアの読み込みに失敗: {e}")
+        return {}
+    return {url: f"{Path(filename).stem}.{OUTPUT_FORMAT}" for url, filename in rows}
+
+
+def compute_dhash(path: Path) -> str | None:
+    """
+    画像の差分ハッシュ（dHash、64ビット）を計算します。
+    
+    縮小・再圧縮された同じ写真はハミング距離が小さくなります。
+    
+    Args:
+        path: 画像ファイルのパス
+    
+    Returns:
+        str: 16桁の16進数（画像として開けない場合は None）
+    """
+    try:
+        with Image.open(path) as img:
+            img.draft("L", (64, 64))
+            small = img.convert("L").resize((9, 8), Image.LANCZOS)
+    except Exception as e:
+        print(f"  ⚠️ 類似判定用のハッシュを計算できませんでした: {path.name}: {e}")
+        return None
+    pixels = small.tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{value:016x}"
+
+
+def find_similar_photo(store: dict, dhash: str, max_distance: int) -> str | None:
+    """
+    dHash のハミング距離が max_distance 以内の登録済みの写真を探します。
+    
+    ハッシュが未計算の写真はここで計算してストアに記録します。
+    
+    Returns:
+        str: 見つかった写真の SHA-256（なければ None）
+    """
+    value = int(dhash, 16)
+    for sha, entry in store["contents"].items():
+        if "dhash" not in entry:
+            path = RAW_IMAGES_DIR / entry["filename"]
+            if not path.exists():
+                continue
+            entry["dhash"] = compute_dhash(path)
+        if entry["dhash"] and bin(value ^ int(entry["dhash"], 16)).count("1") <= max_distance:
+            return sha
+    return None
+
+
+def register_photo(store: dict, url: str, path: Path, keep_name: bool = False, similar_distance: int | None = None) -> tuple:
+    """
+    ダウンロードした写真を内容の SHA-256 で写真ストアに登録します。
+    
+    - 同じ内容の写真が登録済みなら path を削除し、URL を既存の写真に対応付けます
+      （旧形式のファイルを削除した場合は、static/images/ の出力も remove_image_outputs() で削除）
+    - similar_distance を指定すると、dHash が近い写真も同じ写真として扱います
+    - 新しい写真は raw_images/photo_<SHA-256>.jpg に配置します（keep_name なら path の名前のまま）
+    
+    Args:
+        store: 写真ストア（この関数が更新します）
+        url: 写真URL
+        path: raw_images/ 内のダウンロード済みファイル
+        keep_name: True の場合はファイル名を変えずに登録（旧形式のファイルの移行用）
+        similar_distance: 類似判定に使うハミング距離（None なら完全一致のみ）
+    
+    Returns:
+        (raw_images/ 内のファイル名, 新しい写真だったか) のタプル
+    """
+    sha = compute_file_hash(path)
+    entry = store["contents"].get(sha)
+    dhash = None
+    if entry is None and similar_distance is not None:
+        dhash = compute_dhash(path)
+        similar = find_similar_photo(store, dhash, similar_distance) if dhash else None
+        if similar:
+            print(f"  ≈ 類似の写真をまとめます: {url} → {store['contents'][similar]['filename']}")
+            sha, entry = similar, store["contents"][similar]
+    
+    if entry and (RAW_IMAGES_DIR / entry["filename"]).exists():
+        if path.name != entry["filename"]:
+            path.unlink(missing_ok=True)
+            if keep_name:
+                remove_image_outputs(path.name)
+        store["urls"][url] = sha
+        return entry["filename"], False
+    
+    filename = path.name if keep_name else f"photo_{sha}.jpg"
+    if path.name != filename:
+        os.replace(path, RAW_IMAGES_DIR / filename)
+    store["contents"][sha] = {
+        "filename": filename,
+        "size": (RAW_IMAGES_DIR / filename).stat().st_size,
+        "added_at": datetime.now().isoformat(),
+    }
+    if dhash:
+        store["contents"][sha]["dhash"] = dhash
+    store["urls"][url] = sha
+    return filename, True
+
+
+def download_images_from_csv(df: pd.DataFrame, workers: int = None, max_bytes: int | None = None, similar: bool = False) -> int:
+    """
+    CSVに含まれるGoogle Drive URLから画像をダウンロードします。
+    
+    ダウンロードはスレッドプールで並列に行い、接続は共有セッションで再利用します。
+    同じホストへの同時接続数は DOWNLOAD_PER_HOST_LIMIT 以内に制限されます。
+    ダウンロードした写真は内容の SHA-256 で写真ストアに登録され（register_photo()）、
+    別々の共有URLの同じ写真は1回だけ保存・エンコードされます。
+    写真ストアはすべて完了した後にまとめて保存されます。
+    
+    旧形式（photo_<タイムスタンプ>_<URLのMD5>.jpg）のファイルがあれば、
+    ダウンロードせずにそのままの名前でストアに登録します。
+    
+    Args:
+        df: コメントデータのDataFrame
+        workers: 同時ダウンロード数（None なら DOWNLOAD_WORKERS）
+        max_bytes: 1ファイルあたりの最大バイト数（None なら MAX_DOWNLOAD_MB）
+        similar: True の場合は dHash が近い写真も同じ写真としてまとめる
+    
+    Returns:
+        int: ダウンロードした新しい画像の数
+    """
+    import hashlib
+    import threading
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from urllib.parse import urlparse
+    
+    if df.empty:
+        return 0
+    
+    print(f"\n📥 CSV内の画像をダウンロード中...")
+    
+    if workers is None:
+        workers = DOWNLOAD_WORKERS
+    workers = max(1, workers)
+    similar_distance = PHOTO_SIMILAR_DISTANCE if similar else None
+    
+    # 写真URLのカラムを探す（正規化後は photo を優先）
+    if "photo" in df.columns:
+        photo_col_idx = list(df.columns).index("photo")
+    else:
+        photo_col_idx = None
+        photo_col_names = ['写真', 'photo', 'Photo', '画像', 'image', 'Image']
+        for idx, col_name in enumerate(df.columns):
+            if any(keyword in str(col_name) for keyword in photo_col_names):
+                photo_col_idx = idx
+                break
+    
+    # 写真列が見つからない場合
+    if photo_col_idx is None:
+        print(f"  ℹ️ CSVに写真列が見つかりませんでした。スキップします。")
+        return 0
+    
+    RAW_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+    
+    # 中断されたダウンロードの一時ファイルを削除
+    for pattern in (".*.part", ".*.download"):
+        for part_file in RAW_IMAGES_DIR.glob(pattern):
+            part_file.unlink(missing_ok=True)
+    
+    store = load_photo_store()
+    # 旧形式のファイル名を探すための履歴（行ごとに問い合わせず、まとめて読み込む）
+    download_history = load_download_history()
+    downloaded_count = 0
+    store_updated = False
+    jobs = {}
+    failures = {}
+    
+    for idx, row in df.iterrows():
+        # 写真URLのカラムにアクセス
+        if len(row) <= photo_col_idx:
+            continue
+
+        photo_url = row.iloc[photo_col_idx]
+
+        # URLが空でない場合で、実際にURLらしい文字列の場合のみダウンロード
+        if pd.notna(photo_url) and str(photo_url).strip() and str(photo_url) != "nan":
+            photo_url_str = str(photo_url).strip()
+            if not (photo_url_str.startswith('http') or 'drive.google.com' in photo_url_str):
+                # 共有URLではない値（ファイル名など）の可能性
+                continue
+            if photo_url_str in jobs:
+                continue
+            
+            # 写真ストアに登録済みで、ファイルも残っていればスキップ
+            entry = store["contents"].get(store["urls"].get(photo_url_str))
+            if entry:
+                if (RAW_IMAGES_DIR / entry["filename"]).exists():
+                    print(f"  ⊙ スキップ（取得済み）: {entry['filename']}")
+                    count_stage("images_skipped")
+                    continue
+                print(f"  ℹ️ ファイルが見つからないため再ダウンロード: {entry['filename']}")
+            
+            # 旧形式のファイル名（タイムスタンプ + URLのMD5の先頭8文字）で保存済みなら移行
+            timestamp = row.get("timestamp", "") if "timestamp" in df.columns else (row.iloc[0] if len(row) > 0 else "")
+            safe_timestamp = str(timestamp).replace("/", "").replace(":", "").replace(" ", "_")
+            url_hash = hashlib.md5(photo_url_str.encode('utf-8')).hexdigest()[:8]
+            legacy_entry = download_history.get(url_hash)
+            legacy_name = (legacy_entry or {}).get("filename") or f"photo_{safe_timestamp}_{url_hash}.jpg"
+            legacy_path = RAW_IMAGES_DIR / legacy_name
+            if legacy_path.exists():
+                filename, added = register_photo(store, photo_url_str, legacy_path, keep_name=True, similar_distance=similar_distance)
+                print(f"  ⊙ スキップ（既存）: {filename}" if added else f"  ⊙ 同じ写真をまとめました: {legacy_name} → {filename}")
+                count_stage("images_skipped" if added else "images_deduplicated")
+                store_updated = True
+                continue
+            
+            # URLごとに1回だけダウンロード（保存先は内容が分かるまでの一時ファイル）
+            url_key = hashlib.sha256(photo_url_str.encode('utf-8')).hexdigest()[:16]
+            jobs[photo_url_str] = RAW_IMAGES_DIR / f".{url_key}.download"
+    
+    if jobs:
+        print(f"  ⬇ {len(jobs)} 件を最大 {workers} 並列でダウンロードします")
+        session = create_download_session(workers)
+        host_slots = {}
+        host_slots_lock = threading.Lock()
+        
+        def download_job(photo_url_str: str, output_path: Path) -> bool:
+            # ホストごとの同時接続数を制限
+            host = urlparse(photo_url_str).netloc.lower()
+            with host_slots_lock:
+                slot = host_slots.setdefault(host, threading.BoundedSemaphore(DOWNLOAD_PER_HOST_LIMIT))
+            with slot:
+                print(f"  ⬇ ダウンロード中: {photo_url_str}")
+                return download_image_from_google_drive(photo_url_str, output_path, session=session, max_bytes=max_bytes)
+        
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(download_job, photo_url_str, output_path): photo_url_str
+                    for photo_url_str, output_path in jobs.items()
+                }
+                # ストアへの登録はこのスレッドだけで行う（同じ内容の写真が同時に届いても1つにまとまる）
+                for future in as_completed(futures):
+                    photo_url_str = futures[future]
+                    output_path = jobs[photo_url_str]
+                    try:
+                        ok = future.result()
+                    except Exception as e:
+                        print(f"  ✗ ダウンロード失敗: {photo_url_str}: {e}")
+                        failures[photo_url_str] = str(e)
+                        count_stage("images_failed")
+                        continue
+                    if not ok:
+                        failures[photo_url_str] = "画像を取得できませんでした"
+                        count_stage("images_failed")
+                        continue
+                    size = output_path.stat().st_size
+                    try:
+                        filename, added = register_photo(store, photo_url_str, output_path, similar_distance=similar_distance)
+                    finally:
+                        output_path.unlink(missing_ok=True)
+                    store_updated = True
+                    if added:
+                        print(f"  ✓ 保存完了: {filename}")
+                        downloaded_count += 1
+                        count_stage("images_downloaded")
+                        count_stage("bytes_written", size)
+                    else:
+                        print(f"  ⊙ 同じ写真が保存済みのため破棄: {photo_url_str} → {filename}")
+                        count_stage("images_deduplicated")
+        finally:
+            session.close()
+        record_failed_urls(failures, [url for url in jobs if url not in failures])
+    
+    # 写真ストアを保存（更新があった場合のみ）
+    if store_updated:
+        save_photo_store(store)
+        print(f"  ✓ 写真ストアを更新しました")
+    
+    if downloaded_count > 0:
+        print(f"  → {downloaded_count} 件の画像をダウンロードしました")
+    else:
+        print(f"  → ダウンロードする新しい画像はありませんでした")
+    
+    return downloaded_count
+
+
+def compute_file_hash(path: Path) -> str:
+    """
+    ファイル内容の SHA-256 ハッシュを計算します（大きなファイルも分割して読み込み）。
+    
+    Args:
+        path: 対象ファイルのパス
+    
+    Returns:
+        str: 16進数のハッシュ文字列
+    """
+    import hashlib
+    
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def image_settings() -> dict:
+    """
+    出力画像に影響するエンコード設定を辞書で返します。
+    ワーカープロセスにもこの辞書をそのまま渡します。
+    
+    Returns:
+        dict: エンコード設定
+    """
+    return {
+        "max_width": MAX_IMAGE_WIDTH,
+        "max_height": MAX_IMAGE_HEIGHT,
+        "quality": IMAGE_QUALITY,
+        "format": OUTPUT_FORMAT,
+        "variant_widths": sorted(set(IMAGE_VARIANT_WIDTHS)),
+        "avif": IMAGE_AVIF and is_avif_supported(),
+        "placeholder_width": IMAGE_PLACEHOLDER_WIDTH,
+        "fast_decode": IMAGE_FAST_DECODE,
+        "exif_transpose": True,
+        "max_source_pixels": MAX_SOURCE_PIXELS,
+    }
+
+
+def is_avif_supported() -> bool:
+    """
+    Pillow が AVIF の書き出しに対応しているかを確認します。
+    
+    Returns:
+        bool: 対応している場合 True
+    """
+    from PIL import features
+    
+    try:
+        return bool(features.check("avif"))
+    except Exception:
+        return False
+
+
+def image_settings_key() -> str:
+    """
+    出力画像に影響するエンコード設定を文字列化します。
+    設定が変わるとマニフェストのエントリが無効になり、再エンコードされます。
+    
+    Returns:
+        str: エンコード設定のキー
+    """
+    return json.dumps(image_settings(), sort_keys=True)
+
+
+def load_image_manifest() -> dict:
+    """
+    画像処理マニフェストを読み込みます。
+    
+    Returns:
+        dict: 元画像ファイル名をキーとしたマニフェスト辞書
+    """
+    try:
+        with state_db() as conn:
+            return {
+                filename: json.loads(entry)
+                for filename, entry in conn.execute("SELECT filename, entry FROM image_manifest ORDER BY filename")
+            }
+    except Exception as e:
+        print(f"  ⚠️ 画像マニフェストの読み込みに失敗: {e}")
+    return {}
+
+
+def save_image_manifest(manifest: dict):
+    """
+    画像処理マニフェストを保存します。
+    
+    Args:
+        manifest: 元画像ファイル名をキーとしたマニフェスト辞書
+    """
+    try:
+        with state_db() as conn:
+            write_image_manifest(conn, manifest)
+    except Exception as e:
+        print(f"  ⚠️ 画像マニフェストの保存に失敗: {e}")
+
+
+def is_image_output_current(entry: dict | None, source_hash: str, settings_key: str) -> bool:
+    """
+    マニフェストのエントリと static/images/ の出力が最新かどうかを判定します。
+    
+    Args:
+        entry: マニフェストのエントリ（未登録なら None）
+        source_hash: 元画像の SHA-256 ハッシュ
+        settings_key: 現在のエンコード設定キー
+    
+    Returns:
+        bool: 再エンコードが不要な場合 True
+    """
+    if not entry:
+        return False
+    if entry.get("source_hash") != source_hash or entry.get("settings") != settings_key:
+        return False
+    
+    # 出力ファイルが削除・差し替えされていないか確認
+    output_path = OUTPUT_IMAGES_DIR / entry.get("output", "")
+    if not output_path.is_file():
+        return False
+    if any(not (OUTPUT_IMAGES_DIR / v["file"]).is_file() for v in entry.get("variants", [])):
+        return False
+    return output_path.stat().st_size == entry.get("output_size")
+
+
+def image_output_files(entry: dict) -> set:
+    """
+    マニフェストのエントリが static/images/ に出力したファイル名を返します。
+    
+    Args:
+        entry: マニフェストのエントリ
+    
+    Returns:
+        set: 最大サイズの出力とすべてのバリアントのファイル名
+    """
+    files = {v["file"] for v in entry.get("variants", [])}
+    if entry.get("output"):
+        files.add(entry["output"])
+    return files
+
+
+def prune_image_outputs(manifest: dict, new_manifest: dict) -> int:
+    """
+    前回のマニフェストにあって新しいマニフェストにない出力ファイルを static/images/ から削除します。
+    
+    バリアントの幅や AVIF の設定を変えた場合の古いバリアントや、
+    削除された元画像の出力が対象です。マニフェストに記録されていないファイルには触れません。
+    
+    Args:
+        manifest: 前回のマニフェスト
+        new_manifest: 今回のマニフェスト
+    
+    Returns:
+        int: 削除したファイル数
+    """
+    kept = set()
+    for entry in new_manifest.values():
+        kept |= image_output_files(entry)
+    
+    removed = 0
+    for entry in manifest.values():
+        for filename in image_output_files(entry) - kept:
+            path = OUTPUT_IMAGES_DIR / filename
+            if path.is_file():
+                path.unlink()
+                removed += 1
+    return removed
+
+
+def remove_image_outputs(source_name: str) -> int:
+    """
+    削除した元画像の出力ファイルとマニフェストのエントリを削除します。
+    
+    Args:
+        source_name: raw_images/ から削除した元画像のファイル名
+    
+    Returns:
+        int: 削除した出力ファイル数
+    """
+    manifest = load_image_manifest()
+    entry = manifest.pop(source_name, None)
+    if entry is None:
+        return 0
+    removed = prune_image_outputs({source_name: entry}, manifest)
+    save_image_manifest(manifest)
+    return removed
+
+
+def image_variant_manifest(manifest: dict) -> dict:
+    """
+    画像マニフェストから、テンプレート用のバリアント情報を組み立てます。
+    
+    Args:
+        manifest: 元画像ファイル名をキーとしたマニフェスト辞書
+    
+    Returns:
+        dict: 出力ファイル名をキーとした辞書
+              （width / height: 最大サイズの寸法、srcset: 形式ごとの srcset 文字列、
+              color / placeholder: 代表色とぼかし画像の data URI（記録されている場合のみ））
+    """
+    variants = {}
+    for entry in manifest.values():
+        if "variants" not in entry:
+            continue
+        srcset = {}
+        for v in sorted(entry["variants"], key=lambda v: v["width"]):
+            srcset.setdefault(v["format"], []).append(f"static/images/{v['file']} {v['width']}w")
+        variants[entry["output"]] = {
+            "width": entry["width"],
+            "height": entry["height"],
+            "srcset": {fmt: ", ".join(items) for fmt, items in srcset.items()},
+        }
+        for key in ("color", "placeholder"):
+            if entry.get(key):
+                variants[entry["output"]][key] = entry[key]
+    return variants
+
+
+def save_encoded_image(img: Image.Image, path: Path, fmt: str, quality: int):
+    """
+    画像を指定した形式で保存します。
+    
+    Args:
+        img: 保存する画像
+        path: 保存先のパス
+        fmt: 出力形式（webp / jpg / avif）
+        quality: 品質（1-100）
+    """
+    if fmt == "webp":
+        img.save(path, "WEBP", quality=quality)
+    elif fmt == "avif":
+        img.save(path, "AVIF", quality=quality)
+    else:
+        img.save(path, "JPEG", quality=quality)
+
+
+def draft_source_image(img: Image.Image, settings: dict):
+    """
+    JPEG の場合、出力サイズ以上で最も小さい縮小率（1/2・1/4・1/8）でデコードするよう設定します。
+    
+    デコード前に呼び出す必要があります。EXIF の向きで縦横が入れ替わる画像は、
+    入れ替えた後に最大サイズに収まる大きさを基準にします。JPEG 以外では何もしません。
+    
+    Args:
+        img: Image.open() で開いただけの画像
+        settings: image_settings() のエンコード設定
+    """
+    import math
+    
+    if not settings.get("fast_decode") or img.format != "JPEG":
+        return
+    
+    box = (settings["max_width"], settings["max_height"])
+    if settings.get("exif_transpose") and img.getexif().get(0x0112) in (5, 6, 7, 8):
+        box = box[::-1]
+    scale = min(box[0] / img.width, box[1] / img.height, 1.0)
+    img.draft(None, (max(1, math.ceil(img.width * scale)), max(1, math.ceil(img.height * scale))))
+
+
+def image_placeholder(img: Image.Image, width: int) -> dict:
+    """
+    画像の読み込み中に表示する代表色と、小さなぼかし画像を作成します。
+    
+    Args:
+        img: 縮小済みの画像（RGB）
+        width: ぼかし画像の幅（0 の場合は代表色のみ）
+    
+    Returns:
+        dict: color（"#rrggbb"）と placeholder（WebP の data URI、width が 0 なら含まない）
+    """
+    import base64
+    import io
+    from PIL import ImageFilter
+    
+    # 代表色は 4 色に減色したうち最も面積の多い色
+    tiny = img.convert("RGB")
+    tiny.thumbnail((max(width, 16), max(width, 16)), Image.Resampling.BOX)
+    quantized = tiny.quantize(colors=4)
+    _, index = max(quantized.getcolors())
+    r, g, b = quantized.getpalette()[index * 3:index * 3 + 3]
+    result = {"color": f"#{r:02x}{g:02x}{b:02x}"}
+    
+    if width > 0:
+        height = max(1, round(img.height * width / img.width))
+        blurred = img.convert("RGB").resize((width, height), Image.Resampling.BOX).filter(ImageFilter.GaussianBlur(1))
+        buffer = io.BytesIO()
+        blurred.save(buffer, "WEBP", quality=40)
+        result["placeholder"] = "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+    return result
+
+
+def encode_image(source_path: str, output_path: str, settings: dict) -> dict:
+    """
+    1枚の画像をリサイズして出力形式で保存します。
+    ワーカープロセスからも呼び出せるよう、引数はすべて pickle 可能な値で受け取ります。
+    
+    元画像のデコードは1回だけ行い、最大サイズの出力に加えて
+    settings["variant_widths"] の各幅（最大サイズより小さいもの）のバリアントを
+    「{stem}-{幅}w.{形式}」として書き出します。settings["avif"] が True の場合は
+    それぞれの AVIF 版も出力します。読み込み中に表示する代表色とぼかし画像
+    （image_placeholder()）も、縮小済みの画像から同時に作成します。
+    
+    settings["fast_decode"] が True の場合、JPEG は draft_source_image() で縮小しながら
+    デコードされます。EXIF の向きは縮小したデコード結果に適用され、画素数が
+    settings["max_source_pixels"] を超える元画像はデコードせずに ValueError になります。
+    
+    Args:
+        source_path: 元画像のパス
+        output_path: 出力先のパス
+        settings: image_settings() のエンコード設定
+    
+    Returns:
+        dict: 出力結果（output_size: 出力ファイルのバイト数、width / height: 寸法、
+              variants: 出力したすべてのファイルの file / width / height / format、
+              color / placeholder: 代表色とぼかし画像）
+    """
+    from PIL import ImageOps
+    
+    output_path = Path(output_path)
+    formats = [settings["format"]] + (["avif"] if settings.get("avif") else [])
+    variants = []
+    
+    # 画像を開く（ヘッダーのみ読み込まれる）
+    with Image.open(source_path) as img:
+        if img.width * img.height > settings["max_source_pixels"]:
+            raise ValueError(f"画素数が多すぎます（{img.width}x{img.height}）")
+        
+        # 出力サイズに近い解像度でデコードし、EXIF の向きを適用
+        draft_source_image(img, settings)
+        if settings.get("exif_transpose"):
+            img = ImageOps.exif_transpose(img)
+        
+        # RGBAの場合はRGBに変換（WebP/JPEG用）
+        if img.mode in ("RGBA", "P"):
+            img = img.convert("RGB")
+        
+        # アスペクト比を維持してリサイズ
+        img.thumbnail((settings["max_width"], settings["max_height"]), Image.Resampling.LANCZOS)
+        
+        # 最大サイズ + 小さい幅のバリアント（縮小済みの画像から作成）
+        sizes = [(None, img)]
+        for width in settings.get("variant_widths", []):
+            if width < img.width:
+                height = max(1, round(img.height * width / img.width))
+                sizes.append((width, img.resize((width, height), Image.Resampling.LANCZOS)))
+        
+        # 保存
+        for width, sized in sizes:
+            for fmt in formats:
+                suffix = f"-{width}w" if width else ""
+                path = output_path.with_name(f"{output_path.stem}{suffix}.{fmt}")
+                save_encoded_image(sized, path, fmt, settings["quality"])
+                variants.append({"file": path.name, "width": sized.width, "height": sized.height, "format": fmt})
+        
+        width, height = img.size
+        placeholder = image_placeholder(img, settings.get("placeholder_width", 0))
+    
+    return {
+        "output_size": output_path.stat().st_size,
+        "width": width,
+        "height": height,
+        "variants": variants,
+        **placeholder,
+    }
+
+
+def estimate_decode_bytes(image_path: Path, settings: dict | None = None) -> int:
+    """
+    画像をデコードしたときのおおよそのメモリ使用量を見積もります。
+    ヘッダーのみを読むため、画像本体はデコードしません。
+    
+    Args:
+        image_path: 元画像のパス
+        settings: image_settings() のエンコード設定（指定すると縮小デコード後の大きさで見積もる）
+    
+    Returns:
+        int: 見積もりバイト数（読めない場合は 0）
+    """
+    try:
+        with Image.open(image_path) as img:
+            if settings:
+                draft_source_image(img, settings)
+            width, height = img.size
+            bands = max(len(img.getbands()), 3)
+        return width * height * bands
+    except Exception:
+        return 0
+
+
+def run_encode_jobs(jobs: list, settings: dict, workers: int = 1):
+    """
+    画像のエンコードジョブを実行し、完了したものから結果を返します。
+    
+    workers が 2 以上の場合はプロセスプールで並列に処理します。
+    同時にデコードされる画像の見積もりメモリが IMAGE_MEMORY_BUDGET_MB を
+    超えないよう、投入するジョブ数を調整します。
+    
+    Args:
+        jobs: (元画像パス, 出力パス) のタプルのリスト
+        settings: image_settings() のエンコード設定
+        workers: ワーカープロセス数（1 なら逐次処理）
+    
+    Yields:
+        tuple: (ジョブ, 結果の辞書, 例外) — 成功時は例外が None
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            try:
+                yield job, encode_image(str(job[0]), str(job[1]), settings), None
+            except Exception as e:
+                yield job, None, e
+        return
+    
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    
+    budget = IMAGE_MEMORY_BUDGET_MB * 1024 * 1024
+    # 見積もりはジョブごとに1回だけ行う（ヘッダーを読み直さない）
+    pending = deque((job, estimate_decode_bytes(job[0], settings)) for job in jobs)
+    in_flight = {}
+    in_flight_bytes = 0
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while pending or in_flight:
+            # 予算内（または実行中のジョブがない）なら次のジョブを投入
+            while pending and len(in_flight) < workers:
+                if in_flight and in_flight_bytes + pending[0][1] > budget:
+                    break
+                job, cost = pending.popleft()
+                future = executor.submit(encode_image, str(job[0]), str(job[1]), settings)
+                in_flight[future] = (job, cost)
+                in_flight_bytes += cost
+            
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, cost = in_flight.pop(future)
+                in_flight_bytes -= cost
+                try:
+                    yield job, future.result(), None
+                except Exception as e:
+                    yield job, None, e
+
+
+def process_images(force: bool = False, workers: int = None) -> list:
+    """
+    raw_images/ 内の画像をリサイズして static/images/ に出力します。
+    
+    画像マニフェスト（data/.state.db）に元画像のハッシュと
+    エンコード設定を記録し、出力が最新の画像は再エンコードをスキップします。
+    srcset 用のバリアント（IMAGE_VARIANT_WIDTHS）もマニフェストに記録され、
+    image_variant_manifest() でテンプレートに渡せる形に変換できます。
+    設定の変更や元画像の削除で使われなくなった出力は static/images/ から削除します。
+    処理に失敗した画像は、前回の出力とマニフェストのエントリをそのまま使います。
+    
+    Args:
+        force: True の場合はマニフェストを無視してすべて再エンコード
+        workers: エンコードに使うプロセス数（None なら IMAGE_WORKERS、0 なら CPU コア数）
+    
+    Returns:
+        list: 処理された画像ファイル名のリスト
+    """
+    print(f"\n🖼️ 画像を処理中...")
+    
+    # 対応する画像形式
+    supported_extensions = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
+    processed_images = []
+    
+    if not RAW_IMAGES_DIR.exists():
+        print(f"  → raw_images/ ディレクトリが見つかりません")
+        return processed_images
+    
+    if workers is None:
+        workers = IMAGE_WORKERS
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    
+    if IMAGE_AVIF and not is_avif_supported():
+        print("  ⚠️ この環境の Pillow は AVIF に対応していないため、AVIF の出力をスキップします")
+    
+    manifest = load_image_manifest()
+    settings = image_settings()
+    settings_key = image_settings_key()
+    new_manifest = {}
+    skipped_count = 0
+    jobs = []
+    job_info = {}
+    
+    def keep_previous_output(name: str):
+        # 失敗した画像は前回の出力を引き続き使い、元画像が削除されたときに出力も削除できるよう記録を残す
+        count_stage("images_failed")
+        entry = manifest.get(name)
+        if entry:
+            new_manifest[name] = entry
+            processed_images.append(entry["output"])
+    
+    # raw_images/ 内のすべての画像を確認し、エンコードが必要なものを集める
+    for image_path in RAW_IMAGES_DIR.iterdir():
+        if image_path.suffix.lower() not in supported_extensions:
+            continue
+        
+        try:
+            # サイズと更新日時が前回と同じならハッシュ計算も省略
+            stat = image_path.stat()
+            entry = manifest.get(image_path.name)
+            if entry and entry.get("source_size") == stat.st_size and entry.get("source_mtime_ns") == stat.st_mtime_ns:
+                source_hash = entry.get("source_hash", "")
+            else:
+                source_hash = compute_file_hash(image_path)
+            
+            if not force and is_image_output_current(entry, source_hash, settings_key):
+                new_manifest[image_path.name] = dict(entry, source_size=stat.st_size, source_mtime_ns=stat.st_mtime_ns)
+                processed_images.append(entry["output"])
+                skipped_count += 1
+                continue
+            
+            # 出力ファイル名を決定
+            output_filename = f"{image_path.stem}.{OUTPUT_FORMAT}"
+            job = (image_path, OUTPUT_IMAGES_DIR / output_filename)
+            jobs.append(job)
+            job_info[job] = (stat, source_hash, output_filename)
+                
+        except Exception as e:
+            print(f"  ✗ {image_path.name} の処理に失敗: {e}")
+            keep_previous_output(image_path.name)
+    
+    if jobs and workers > 1:
+        print(f"  ⚙ {min(workers, len(jobs))} プロセスで {len(jobs)} 件をエンコードします")
+    
+    # エンコード（1枚の失敗が他の画像に影響しないよう個別に結果を受け取る）
+    for job, result, error in run_encode_jobs(jobs, settings, workers):
+        image_path = job[0]
+        if error is not None:
+            print(f"  ✗ {image_path.name} の処理に失敗: {error}")
+            keep_previous_output(image_path.name)
+            continue
+        
+        stat, source_hash, output_filename = job_info[job]
+        new_manifest[image_path.name] = {
+            "source_hash": source_hash,
+            "source_size": stat.st_size,
+            "source_mtime_ns": stat.st_mtime_ns,
+            "settings": settings_key,
+            "output": output_filename,
+            "output_size": result["output_size"],
+            "width": result["width"],
+            "height": result["height"],
+            "variants": result["variants"],
+            "color": result.get("color"),
+            "placeholder": result.get("placeholder"),
+        }
+        processed_images.append(output_filename)
+        count_stage("images_encoded")
+        count_stage("bytes_written", sum(
+            (OUTPUT_IMAGES_DIR / variant["file"]).stat().st_size for variant in result["variants"]
+        ))
+        print(f"  ✓ {image_path.name} → {output_filename}")
+    
+    # 削除された元画像のエントリはマニフェストから除外され、使われなくなった出力も削除する
+    removed = prune_image_outputs(manifest, new_manifest)
+    count_stage("images_removed", removed)
+    if removed:
+        print(f"  🗑 使われなくなった出力を削除: {removed} 件")
+    if new_manifest != manifest:
+        save_image_manifest(new_manifest)
+    
+    count_stage("images_skipped", skipped_count)
+    if skipped_count > 0:
+        print(f"  ⊙ 変更のない画像をスキップ: {skipped_count} 件")
+    print(f"  → {len(processed_images)} 件の画像を処理しました")
+    return sorted(processed_images)
+
+
+def load_markdown_content(filename: str) -> str:
+    """
+    Markdownファイルを読み込んでHTMLに変換します。
+    
+    Args:
+        filename: content/ ディレクトリ内のファイル名
+    
+    Returns:
+        str: HTMLに変換された内容
+    """
+    filepath = CONTENT_DIR / filename
+    
+    if not filepath.exists():
+        print(f"⚠️ {filepath} が見つかりません")
+        return ""
+    
+    with open(filepath, "r", encoding="utf-8") as f:
+        md_content = f.read()
+    
+    # MarkdownをHTMLに変換（拡張機能付き）
+    html_content = markdown.markdown(
+        md_content,
+        extensions=["extra", "nl2br", "sane_lists"]
+    )
+    
+    return html_content
+
+
+def extract_store_history(about_html: str) -> tuple:
+    """
+    店舗の変遷情報をHTMLから抽出します。
+    
+    Args:
+        about_html: about.mdから変換されたHTML
+    
+    Returns:
+        tuple: (店舗変遷を除いたHTML, 店舗変遷のリスト)
+    """
+    import re
+    
+    # 「店舗の変遷」セクションを抽出
+    history_pattern = r'<h2>店舗の変遷</h2>(.*?)<hr\s*/>'
+    match = re.search(history_pattern, about_html, re.DOTALL)
+    
+    if not match:
+        return about_html, []
+    
+    history_section = match.group(1)
+    about_without_history = about_html.replace(match.group(0), '<hr />')
+    
+    # 各店舗の情報を抽出（h3とimgを別々に）
+    stores = []
+    
+    # h3タグを探す
+    h3_pattern = r'<h3>(.*?)</h3>'
+    img_pattern = r'<img\s+alt="(.*?)"\s+src="(.*?)"\s*/>'
+    
+    h3_matches = list(re.finditer(h3_pattern, history_section))
+    img_matches = list(re.finditer(img_pattern, history_section))
+    
+    # h3とimgを順番にマッチング
+    for idx, (h3_match, img_match) in enumerate(zip(h3_matches, img_matches)):
+        title = h3_match.group(1)
+        alt_text = img_match.group(1)
+        image_url = img_match.group(2)
+        
+        stores.append({
+            'id': f'store{idx}',
+            'title': title,
+            'alt': alt_text,
+            'image': image_url
+        })
+    
+    return about_without_history, stores
+
+
+# 「好きだったメニュー」の区切り文字
+# カンマ（,）、全角カンマ（、）、全角カンマ（，）、セミコロン（;）、改行（\n）など
+MENU_SEPARATOR_PATTERN = r'[,、，;；\n]+'
+
+# 旧来の列並びで写真URL列を探すためのキーワード
+LEGACY_PHOTO_COLUMN_KEYWORDS = ['写真', 'photo', 'Photo', '画像', 'image', 'Image']
+
+
+def as_str_series(series: pd.Series) -> pd.Series:
+    """
+    各要素に str() を適用した Series を返します。
+    
+    astype(str) は pandas のバージョンによって欠損値を "nan" にしないため、
+    行ごとに str() していた従来の処理と結果を揃える目的で使います。
+    iterrows() と同様に、None などの欠損値は NaN として扱います（"nan" になります）。
+    """
+    return series.map(str).astype(object).mask(series.isna(), "nan")
+
+
+def parse_timestamps(values: pd.Series) -> list:
+    """
+    タイムスタンプ列をまとめて pd.Timestamp に変換します。
+    
+    一括変換では先頭の値から推定した書式を全体に適用するため、
+    書式が異なる値は NaT になります。そうした値だけ1件ずつ変換し直すことで、
+    行ごとに pd.to_datetime() していた場合と同じ結果にします。
+    
+    Args:
+        values: タイムスタンプの Series
+    
+    Returns:
+        list: pd.Timestamp（変換できない場合は NaT）のリスト
+    """
+    import warnings
+    
+    raw = values.tolist()
+    try:
+        with warnings.catch_warnings():
+            # 書式を推定できない場合の UserWarning を抑制（その場合も1件ずつ変換される）
+            warnings.simplefilter("ignore")
+            parsed = pd.to_datetime(values, errors="coerce")
+        if not pd.api.types.is_datetime64_any_dtype(parsed):
+            raise ValueError("タイムゾーンが混在しています")
+        result = parsed.tolist()
+    except Exception:
+        result = [pd.NaT] * len(raw)
+    
+    for i, ts in enumerate(result):
+        if pd.isna(ts) and raw[i] != "":
+            result[i] = pd.to_datetime(raw[i], errors="coerce")
+    return result
+
+
+def photo_filenames(timestamps: pd.Series, photo_urls: pd.Series, photo_map: dict | None = None) -> pd.Series:
+    """
+    写真URLからダウンロード済み画像のファイル名を求めます。
+    
+    photo_map（load_photo_map()）にあるURLは写真ストアのファイル名、
+    ないURLは旧形式の「タイムスタンプ + URLのハッシュ」のファイル名になります。
+    URLらしい文字列でない行は None になります。
+    
+    Args:
+        timestamps: タイムスタンプの Series
+        photo_urls: 写真URLの Series
+        photo_map: 写真URLから画像ファイル名を引く辞書（省略時は旧形式のみ）
+    
+    Returns:
+        pd.Series: ファイル名（または None）の Series
+    """
+    import hashlib
+    
+    url_str = as_str_series(photo_urls)
+    stripped = url_str.str.strip()
+    is_url = (
+        photo_urls.notna()
+        & stripped.ne("")
+        & url_str.ne("nan")
+        & (stripped.str.startswith("http") | stripped.str.contains("drive.google.com", regex=False))
+    )
+    
+    filenames = pd.Series([None] * len(photo_urls), index=photo_urls.index, dtype=object)
+    if not is_url.any():
+        return filenames
+    
+    safe_timestamp = (
+        as_str_series(timestamps[is_url])
+        .str.replace("/", "", regex=False)
+        .str.replace(":", "", regex=False)
+        .str.replace(" ", "_", regex=False)
+    )
+    # 同じURLは1回だけハッシュする
+    urls = stripped[is_url]
+    url_hashes = {
+        url: hashlib.md5(url.encode('utf-8')).hexdigest()[:8]
+        for url in urls.unique()
+    }
+    names = "photo_" + safe_timestamp + "_" + urls.map(url_hashes) + ".webp"
+    if photo_map:
+        names = urls.map(photo_map).fillna(names)
+    filenames[is_url] = names
+    return filenames
+
+
+def menu_key(name: str) -> str:
+    """
+    別名の照合に使うメニュー名のキー（NFKC 正規化・大文字小文字の統一・空白の除去）を返します。
+    """
+    import unicodedata
+    
+    return "".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+
+def compile_menu_aliases(aliases: dict) -> dict:
+    """
+    config.json の "menu.aliases"（正式名 → 別名のリスト）を照合用の辞書に変換します。
+    
+    別名・正式名とも menu_key() で正規化したキーから正式名を引けるようにするため、
+    集計時はメニュー1件につき辞書を1回引くだけで正式名に揃えられます。
+    
+    Args:
+        aliases: 正式名をキー、別名のリストを値とした辞書
+    
+    Returns:
+        dict: menu_key() のキーから正式名（NFKC 正規化済み）を引く辞書
+    """
+    import unicodedata
+    
+    compiled = {}
+    for canonical, variants in (aliases or {}).items():
+        display = unicodedata.normalize("NFKC", canonical).strip()
+        for name in [canonical, *variants]:
+            compiled[menu_key(name)] = display
+    return compiled
+
+
+def menu_name(item: str, aliases: dict | None = None) -> str:
+    """
+    分割したメニュー名を NFKC 正規化し、別名であれば正式名に置き換えます。
+    
+    NFKC 正規化で半角カナ（ﾁｬｰｼｭｰ麺）や全角英数字が通常の表記に揃います。
+    
+    Args:
+        item: 分割したメニュー名
+        aliases: compile_menu_aliases() で作成した別名の辞書
+    
+    Returns:
+        str: 集計に使うメニュー名
+    """
+    import unicodedata
+    
+    name = unicodedata.normalize("NFKC", item).strip()
+    if aliases:
+        # NFKC 正規化は済んでいるため、menu_key() の残りの処理だけ行う
+        name = aliases.get("".join(name.casefold().split()), name)
+    return name
+
+
+def menu_token_version(aliases: dict | None = None) -> str:
+    """
+    メニューの分割結果のキャッシュのバージョンを返します。
+    
+    区切り文字のパターン・NFKC 正規化（Unicode のバージョン）・別名の辞書のいずれかが変わると
+    値が変わり、記録済みの分割結果は使われなくなります。
+    
+    Args:
+        aliases: compile_menu_aliases() で作成した別名の辞書
+    
+    Returns:
+        str: バージョン（16進数の文字列）
+    """
+    import hashlib
+    import unicodedata
+    
+    payload = json.dumps(
+        [MENU_SEPARATOR_PATTERN, unicodedata.unidata_version, aliases or {}],
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def load_menu_token_cache(version: str) -> dict:
+    """
+    メニューの分割結果のキャッシュを読み込みます（version が一致するものだけ）。
+    
+    Args:
+        version: menu_token_version() の値
+    
+    Returns:
+        dict: 行の fingerprint をキー、集計に使うメニュー名のリストを値とした辞書
+    """
+    try:
+        with state_db() as conn:
+            return {
+                fingerprint: json.loads(tokens)
+                for fingerprint, tokens in conn.execute(
+                    "SELECT fingerprint, tokens FROM menu_row_tokens WHERE version = ?", (version,)
+                )
+            }
+    except Exception as e:
+        print(f"  ⚠️ メニューの分割結果の読み込みに失敗: {e}")
+    return {}
+
+
+def save_menu_token_cache(token_cache: dict, known: set, version: str):
+    """
+    メニューの分割結果のキャッシュを更新します。
+    
+    新しく分割した行だけを追加し、データからなくなった行と別のバージョンの行を削除します。
+    
+    Args:
+        token_cache: aggregate_menu_items() に渡して更新されたキャッシュ
+        known: 読み込んだ時点のキャッシュのキー（load_menu_token_cache() の結果の set()）
+        version: menu_token_version() の値
+    """
+    try:
+        with state_db() as conn:
+            conn.execute("DELETE FROM menu_row_tokens WHERE version != ?", (version,))
+            conn.executemany(
+                "DELETE FROM menu_row_tokens WHERE fingerprint = ?",
+                ((fingerprint,) for fingerprint in known - token_cache.keys()),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO menu_row_tokens VALUES (?, ?, ?)",
+                ((fingerprint, version, json.dumps(token_cache[fingerprint], ensure_ascii=False))
+                 for fingerprint in token_cache.keys() - known),
+            )
+    except Exception as e:
+        print(f"  ⚠️ メニューの分割結果の保存に失敗: {e}")
+
+
+def count_menu_texts(text_counts: dict, aliases: dict | None = None, token_cache: dict | None = None) -> dict:
+    """
+    「好きだったメニュー」の値ごとの行数からメニューの出現回数を集計します。
+    
+    値ごとに1回だけ分割し、行数を重みとして数えます。
+    表記ゆれ（NFKC）と別名はメニュー名の種類ごとに1回だけ処理します。
+    token_cache を渡すと、行の fingerprint（値のハッシュ）をキーに分割結果を再利用し、
+    キャッシュにない行だけを分割します。今回のデータにない行はキャッシュから取り除かれます。
+    
+    Args:
+        text_counts: 値をキー、行数を値とした辞書（初出順）
+        aliases: compile_menu_aliases() で作成した別名の辞書
+        token_cache: 分割結果のキャッシュ（load_menu_token_cache()、この関数が更新します）
+    
+    Returns:
+        dict: メニュー名をキー、出現回数を値とした辞書（降順ソート済み、同数は初出順）
+    """
+    import hashlib
+    
+    separator = re.compile(MENU_SEPARATOR_PATTERN)
+    counts = {}
+    names = {}
+    seen = set()
+    for text, rows in text_counts.items():
+        tokens = None
+        if token_cache is not None:
+            fingerprint = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+            seen.add(fingerprint)
+            tokens = token_cache.get(fingerprint)
+        if tokens is None:
+            # 各メニュー項目の前後の空白（全角スペースを含む）を削除し、空文字列を除外
+            tokens = []
+            for item in separator.split(text.strip()):
+                item = item.strip()
+                if not item:
+                    continue
+                if item not in names:
+                    names[item] = menu_name(item, aliases)
+                tokens.append(names[item])
+            count_stage("menu_rows_tokenized")
+            if token_cache is not None:
+                token_cache[fingerprint] = tokens
+        for name in tokens:
+            counts[name] = counts.get(name, 0) + rows
+    
+    if token_cache is not None:
+        for fingerprint in token_cache.keys() - seen:
+            del token_cache[fingerprint]
+    
+    # 出現回数で降順ソートして辞書に変換
+    return dict(sorted(counts.items(), key=lambda x: x[1], reverse=True))
+
+
+def aggregate_menu_items(df: pd.DataFrame, aliases: dict | None = None, token_cache: dict | None = None) -> dict:
+    """
+    「好きだったメニュー」を集計します。
+    カンマ区切り、全角カンマ、その他の区切り文字に対応します。
+    
+    メニュー名は NFKC 正規化され、aliases を渡すと別名が正式名にまとめられます。
+    
+    Args:
+        df: コメントデータのDataFrame（行の辞書のリストの場合は aggregate_menu_records() で処理）
+        aliases: compile_menu_aliases() で作成した別名の辞書
+        token_cache: 行ごとの分割結果のキャッシュ（load_menu_token_cache()）
+    
+    Returns:
+        dict: メニュー名をキー、出現回数を値とした辞書（降順ソート済み）
+    """
+    if isinstance(df, list):
+        return aggregate_menu_records(df, aliases, token_cache)
+    
+    if df.empty:
+        return {}
+    
+    # 正規化済みスキーマがあればそれを優先
+    has_normalized = all(c in df.columns for c in ["timestamp", "comment", "name", "menu", "photo"])
+    
+    if has_normalized:
+        menus = df["menu"]
+    elif df.shape[1] > 3:
+        # 旧来の列並び（フォールバック）
+        menus = df.iloc[:, 3]
+    else:
+        return {}
+    
+    # 空の場合はスキップ
+    menus = as_str_series(menus[menus.notna()])
+    menus = menus[menus.str.strip().ne("") & menus.ne("nan")]
+    
+    # 同じ内容の行はまとめて1回だけ分割する（初出順のまま数え、同数のメニューは初出順に並べる）
+    text_counts = {text: int(rows) for text, rows in menus.value_counts(sort=False).items()}
+    return count_menu_texts(text_counts, aliases, token_cache)
+
+
+def aggregate_menu_records(records: list, aliases: dict | None = None, token_cache: dict | None = None) -> dict:
+    """
+    aggregate_menu_items() の csv エンジン版です。
+    
+    Args:
+        records: 行の辞書のリスト
+        aliases: compile_menu_aliases() で作成した別名の辞書
+        token_cache: 行ごとの分割結果のキャッシュ（load_menu_token_cache()）
+    
+    Returns:
+        dict: メニュー名をキー、出現回数を値とした辞書（降順ソート済み、同数は初出順）
+    """
+    if not records:
+        return {}
+    
+    cols = list(records[0])
+    if all(c in cols for c in ["timestamp", "comment", "name", "menu", "photo"]):
+        menu_col = "menu"
+    elif len(cols) > 3:
+        # 旧来の列並び（フォールバック）
+        menu_col = cols[3]
+    else:
+        return {}
+    
+    text_counts = {}
+    for row in records:
+        menus = row[menu_col]
+        if not menus.strip() or menus == "nan":
+            continue
+        text_counts[menus] = text_counts.get(menus, 0) + 1
+    
+    return count_menu_texts(text_counts, aliases, token_cache)
+
+
+def prepare_comments_data(df: pd.DataFrame, photo_map: dict | None = None) -> list:
+    """
+    DataFrameをテンプレート用の辞書リストに変換します。
+    
+    Args:
+        df: コメントデータのDataFrame（行の辞書のリストの場合は prepare_comments_records() で処理）
+        photo_map: 写真URLから画像ファイル名を引く辞書（load_photo_map()、省略時は旧形式のファイル名）
+    
+    Returns:
+        list: コメントの辞書リスト
+    """
+    if isinstance(df, list):
+        return prepare_comments_records(df, photo_map)
+    
+    # データが空の場合は空のリストを返す
+    if df.empty:
+        return []
+    
+    # 正規化済みスキーマがあればそれを優先
+    has_normalized = all(c in df.columns for c in ["timestamp", "comment", "name", "menu", "photo"])
+    
+    if has_normalized:
+        timestamps = df["timestamp"]
+        contents = df["comment"]
+        names = df["name"]
+        menus = df["menu"]
+        photo_urls = df["photo"]
+    else:
+        # 旧来の列並び（フォールバック）
+        def column_or(i: int, default: str) -> pd.Series:
+            if df.shape[1] > i:
+                return df.iloc[:, i]
+            return pd.Series([default] * len(df), index=df.index, dtype=object)
+        
+        timestamps = column_or(0, "")
+        contents = column_or(1, "")
+        names = column_or(2, "匿名")
+        menus = column_or(3, "")
+        
+        # 写真URLのカラムを探す
+        photo_col_idx = next(
+            (c_idx for c_idx, col_name in enumerate(df.columns)
+             if any(keyword in str(col_name) for keyword in LEGACY_PHOTO_COLUMN_KEYWORDS)),
+            None,
+        )
+        photo_urls = df.iloc[:, photo_col_idx] if photo_col_idx is not None else column_or(df.shape[1], "")
+    
+    # 名前が空の場合は「匿名」に
+    name_str = as_str_series(names)
+    name_str = name_str.mask(name_str.str.strip().eq("") | name_str.eq("nan"), "匿名")
+    
+    # メニュー情報をコンテンツに追加
+    content_str = as_str_series(contents)
+    menu_str = as_str_series(menus)
+    has_menu = menu_str.str.strip().ne("") & menu_str.ne("nan")
+    content_str = content_str.mask(has_menu, content_str + "\n\n【好きだったメニュー】\n" + menu_str)
+    
+    # コメントが空でない場合のみ追加
+    keep = (content_str.str.strip().ne("") & content_str.ne("nan")).tolist()
+    
+    # 写真のローカルパスを特定（ダウンロード済みの画像）
+    filenames = photo_filenames(timestamps, photo_urls, photo_map)
+    ts_dts = parse_timestamps(timestamps)
+    
+    comments = [
+        {
+            "timestamp": timestamp,
+            "_ts_dt": ts_dt,
+            "content": content,
+            "menu": menu,
+            "photo_url": photo_url,
+            "photo_filename": photo_filename,  # ローカル画像ファイル名を追加
+            "name": name,
+        }
+        for timestamp, ts_dt, content, menu, photo_url, photo_filename, name, kept in zip(
+            timestamps.astype(object).where(timestamps.notna(), float("nan")).tolist(), ts_dts, content_str.tolist(), menu_str.tolist(),
+            as_str_series(photo_urls).tolist(), filenames.tolist(), name_str.tolist(), keep,
+        )
+        if kept
+    ]
+    
+    # 新しい順にソート（Timestampがある場合）
+    # 日付でソート（新しい順）。パースできない場合はそのまま。
+    try:
+        comments.sort(key=lambda x: (x.get("_ts_dt") or pd.Timestamp.min), reverse=True)
+    except Exception:
+        pass
+
+    # ソート用の一時キーを削除
+    for c in comments:
+        c.pop("_ts_dt", None)
+    
+    return comments
+
+
+# csv エンジンで解釈するタイムスタンプの書式（Googleフォームは "2026/01/11 8:32:53"）
+TIMESTAMP_FORMATS = ["%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"]
+
+
+def parse_timestamp_text(text: str) -> datetime | None:
+    """
+    タイムスタンプの文字列を datetime に変換します（csv エンジン用）。
+    タイムゾーン付きの値は UTC に揃えてから比較できるようにタイムゾーン情報を外します。
+    
+    Returns:
+        datetime: 変換結果（変換できない場合は None）
+    """
+    from datetime import timezone
+    
+    text = text.strip()
+    if not text:
+        return None
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def photo_filename(timestamp: str, photo_url: str, photo_map: dict | None = None) -> str | None:
+    """
+    写真URLからダウンロード済み画像のファイル名を求めます（photo_filenames() の1行分、csv エンジン用）。
+    URLらしい文字列でない場合は None を返します。
+    """
+    import hashlib
+    
+    stripped = photo_url.strip()
+    if not stripped or photo_url == "nan" or not (stripped.startswith("http") or "drive.google.com" in stripped):
+        return None
+    if photo_map and stripped in photo_map:
+        return photo_map[stripped]
+    safe_timestamp = timestamp.replace("/", "").replace(":", "").replace(" ", "_")
+    return f"photo_{safe_timestamp}_{hashlib.md5(stripped.encode('utf-8')).hexdigest()[:8]}.webp"
+
+
+def prepare_comments_records(records: list, photo_map: dict | None = None) -> list:
+    """
+    prepare_comments_data() の csv エンジン版です。
+    
+    空欄は空文字として扱います（pandas では欠損値になるため、タイムスタンプが空の行の
+    "timestamp" が NaN ではなく空文字になる点だけが異なります）。
+    日時として解釈できないタイムスタンプのコメントは末尾に並びます。
+    
+    Args:
+        records: 行の辞書のリスト
+        photo_map: 写真URLから画像ファイル名を引く辞書（省略時は旧形式のファイル名）
+    
+    Returns:
+        list: コメントの辞書リスト
+    """
+    if not records:
+        return []
+    
+    cols = list(records[0])
+    if all(c in cols for c in ["timestamp", "comment", "name", "menu", "photo"]):
+        keys = {field: field for field in ("timestamp", "comment", "name", "menu", "photo")}
+        defaults = {}
+    else:
+        # 旧来の列並び（フォールバック）
+        keys = {field: (cols[i] if len(cols) > i else None)
+                for i, field in enumerate(("timestamp", "comment", "name", "menu"))}
+        keys["photo"] = next(
+            (col for col in cols if any(keyword in col for keyword in LEGACY_PHOTO_COLUMN_KEYWORDS)),
+            None,
+        )
+        defaults = {"name": "匿名"}
+    
+    comments = []
+    for row in records:
+        values = {field: (row[col] if col else defaults.get(field, "")) for field, col in keys.items()}
+        
+        # 名前が空の場合は「匿名」に
+        name = values["name"]
+        if not name.strip() or name == "nan":
+            name = "匿名"
+        
+        # メニュー情報をコンテンツに追加
+        content, menu = values["comment"], values["menu"]
+        if menu.strip() and menu != "nan":
+            content = content + "\n\n【好きだったメニュー】\n" + menu
+        
+        # コメントが空でない場合のみ追加
+        if not content.strip() or content == "nan":
+            continue
+        
+        timestamp = values["timestamp"]
+        comments.append({
+            "timestamp": timestamp,
+            "_ts_dt": parse_timestamp_text(timestamp),
+            "content": content,
+            "menu": menu,
+            "photo_url": values["photo"],
+            "photo_filename": photo_filename(timestamp, values["photo"], photo_map),
+            "name": name,
+        })
+    
+    # 新しい順にソート（日時として解釈できないものは末尾）
+    comments.sort(key=lambda x: x["_ts_dt"] or datetime.min, reverse=True)
+    for c in comments:
+        c.pop("_ts_dt")
+    
+    return comments
+
+
+def timeline_settings(config: dict) -> tuple:
+    """
+    タイムラインの分割設定を返します。
+    
+    Args:
+        config: 設定情報の辞書
+    
+    Returns:
+        (index.html に埋め込む件数, 1ページあたりの件数) のタプル。
+        埋め込み件数が 0 の場合は分割しません。
+    """
+    timeline = config.get("timeline", {})
+    initial_items = max(int(timeline.get("initial_items", TIMELINE_INITIAL_ITEMS)), 0)
+    chunk_size = max(int(timeline.get("chunk_size", TIMELINE_CHUNK_SIZE)), 1)
+    return initial_items, chunk_size
+
+
+def write_timeline_pages(env: jinja2.Environment, comments: list, initial_items: int, chunk_size: int, context: dict) -> int:
+    """
+    index.html に埋め込まない残りのコメントを public/timeline/page-N.html に出力します。
+    
+    前回のビルドで出力したページは削除してから書き直します。
+    
+    Args:
+        env: Jinja2環境
+        comments: コメントの辞書リスト（全件）
+        initial_items: index.html に埋め込んだ件数
+        chunk_size: 1ページあたりの件数
+        context: テンプレートに渡す共通データ
+    
+    Returns:
+        出力したページ数
+    """
+    import shutil
+    
+    timeline_dir = PUBLIC_DIR / "timeline"
+    if timeline_dir.exists():
+        shutil.rmtree(timeline_dir)
+    
+    rest = comments[initial_items:] if initial_items else []
+    if not rest:
+        return 0
+    
+    timeline_dir.mkdir(parents=True, exist_ok=True)
+    template = env.get_template("timeline_page.html")
+    page_count = 0
+    for offset in range(0, len(rest), chunk_size):
+        page_count += 1
+        written = render_to_file(
+            template, timeline_dir / f"page-{page_count}.html",
+            comments=rest[offset:offset + chunk_size],
+            # 左右の振り分けを index.html と揃えるため、全体での通し番号（1始まり）を渡す
+            start_index=initial_items + offset + 1,
+            ui=context["ui"],
+            image_variants=context["image_variants"],
+        )
+        count_stage("bytes_written", written)
+    
+    print(f"✓ タイムラインを分割: {initial_items} 件 + {len(rest)} 件（{page_count} ページ）")
+    return page_count
+
+
+def search_tokens(text: str) -> set:
+    """
+    検索用に文字列をトークン（文字 n-gram）に分割します。
+    
+    NFKC 正規化（全角英数字・半角カナの統一）と小文字化の後、文字・数字の連続ごとに
+    1文字（ユニグラム）と2文字（バイグラム）を取り出します。分かち書きのない日本語でも
+    辞書なしで部分一致の検索ができます。public/search/ の検索スクリプトも同じ方法で分割します。
+    
+    Args:
+        text: 対象の文字列
+    
+    Returns:
+        set: トークンの集合
+    """
+    import unicodedata
+    
+    tokens = set()
+    for run in re.findall(r"\w+", unicodedata.normalize("NFKC", text).lower()):
+        tokens.update(run)
+        tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def search_shard(token: str) -> int:
+    """
+    トークンを格納するシャード番号を返します（FNV-1a 32ビット。検索スクリプトと同じ計算）。
+    """
+    h = 0x811c9dc5
+    for ch in token:
+        h = ((h ^ ord(ch)) * 0x01000193) & 0xffffffff
+    return h % SEARCH_SHARD_COUNT
+
+
+def write_search_index(comments: list) -> dict:
+    """
+    コメントの本文・お名前・メニューから検索インデックスを作成し、public/search/ に出力します。
+    
+    - meta.json: シャード数・件数とキャッシュ用のバージョン
+    - index-N.json: トークン → コメント番号（差分で符号化）の転置インデックスを SEARCH_SHARD_COUNT 個に分割
+    - docs-N.json: 検索結果に表示するお名前・日時・本文の冒頭（SEARCH_DOCS_PER_FILE 件ずつ）
+    
+    ブラウザは検索語のトークンを含むシャードと、表示する結果の docs だけを読み込みます。
+    コメント番号は comments の並び（タイムラインの通し番号 - 1）です。
+    前回のビルドで出力したファイルは削除してから書き直します。
+    
+    Args:
+        comments: コメントの辞書リスト（prepare_comments_data() の結果）
+    
+    Returns:
+        dict: {"docs": 件数, "tokens": トークン数, "bytes": 書き込んだバイト数}
+    """
+    import hashlib
+    import shutil
+    
+    print(f"\n🔎 検索インデックスを作成中...")
+    
+    postings = {}
+    docs = []
+    for doc_id, comment in enumerate(comments):
+        fields = [comment.get("content"), comment.get("name"), comment.get("menu")]
+        text = "\n".join(str(field) for field in fields if isinstance(field, str))
+        for token in search_tokens(text):
+            postings.setdefault(token, []).append(doc_id)
+        content = " ".join(str(comment.get("content", "")).split())
+        snippet = content[:SEARCH_SNIPPET_LENGTH] + ("…" if len(content) > SEARCH_SNIPPET_LENGTH else "")
+        timestamp = comment.get("timestamp")
+        docs.append([comment.get("name", ""), timestamp if isinstance(timestamp, str) else "", snippet])
+    
+    shards = [{} for _ in range(SEARCH_SHARD_COUNT)]
+    for token in sorted(postings):
+        previous = 0
+        deltas = []
+        for doc_id in postings[token]:
+            deltas.append(doc_id - previous)
+            previous = doc_id
+        shards[search_shard(token)][token] = deltas
+    
+    files = {f"index-{n}.json": shard for n, shard in enumerate(shards)}
+    for n, offset in enumerate(range(0, len(docs), SEARCH_DOCS_PER_FILE)):
+        files[f"docs-{n}.json"] = docs[offset:offset + SEARCH_DOCS_PER_FILE]
+    encoded = {
+        name: json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        for name, data in files.items()
+    }
+    version = hashlib.sha256(b"".join(encoded[name] for name in sorted(encoded))).hexdigest()[:12]
+    encoded["meta.json"] = json.dumps({
+        "version": version,
+        "count": len(docs),
+        "shards": SEARCH_SHARD_COUNT,
+        "docs_per_file": SEARCH_DOCS_PER_FILE,
+    }).encode("utf-8")
+    
+    search_dir = PUBLIC_DIR / "search"
+    if search_dir.exists():
+        shutil.rmtree(search_dir)
+    search_dir.mkdir(parents=True)
+    for name, data in encoded.items():
+        (search_dir / name).write_bytes(data)
+    
+    written = sum(len(data) for data in encoded.values())
+    print(f"✓ 検索インデックスを出力: {len(docs)} 件, {len(postings)} トークン（{written:,} バイト）")
+    return {"docs": len(docs), "tokens": len(postings), "bytes": written}
+
+
+def create_jinja_env() -> jinja2.Environment:
+    """
+    templates/ を読み込む Jinja2 環境を作成します。
+    
+    読み込んだテンプレートは環境ごとにキャッシュされ、ファイルの更新日時が
+    変わった場合だけ読み直されます（--watch では同じ環境を使い回します）。
+    コンパイル結果は data/.jinja_cache/ にも保存され、次回のビルドでは
+    テンプレートが変わっていなければコンパイルを省略します。
+    """
+    JINJA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader(TEMPLATES_DIR),
+        autoescape=True,
+        bytecode_cache=jinja2.FileSystemBytecodeCache(str(JINJA_CACHE_DIR)),
+    )
+
+
+def render_to_file(template: jinja2.Template, path: Path, **context) -> int:
+    """
+    テンプレートの出力を少しずつファイルに書き込みます。
+    
+    ページ全体を1つの文字列にせず template.generate() の出力を RENDER_BUFFER_SIZE 件ずつ
+    書き込むため、コメントが増えてもメモリ使用量がページの大きさに比例しません。
+    一時ファイルに書いてから置き換えるので、途中で失敗しても前回の出力が残ります。
+    
+    Args:
+        template: 出力するテンプレート
+        path: 出力先のパス
+        **context: テンプレートに渡すデータ
+    
+    Returns:
+        int: 書き込んだバイト数
+    """
+    tmp = path.with_name(f".{path.name}.tmp")
+    written = 0
+    try:
+        with open(tmp, "wb") as f:
+            buffer = []
+            for chunk in template.generate(**context):
+                buffer.append(chunk)
+                if len(buffer) >= RENDER_BUFFER_SIZE:
+                    written += f.write("".join(buffer).encode("utf-8"))
+                    buffer.clear()
+            written += f.write("".join(buffer).encode("utf-8"))
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return written
+
+
+def generate_html(comments: list, images: list, about_html: str, config: dict, store_history: list = None, menu_stats: dict = None, copy_static: bool = True, image_variants: dict = None, env: jinja2.Environment = None):
+    """
+    Jinja2テンプレートを使用してHTMLを生成します。
+    
+    Args:
+        comments: コメントの辞書リスト
+        images: 画像ファイル名のリスト
+        about_html: 「店主について」のHTML
+        config: 設定情報の辞書
+        store_history: 店舗変遷データのリスト
+        menu_stats: メニュー集計結果の辞書（メニュー名: 出現回数）
+        copy_static: False の場合は static/ のコピーを行わない（ビルドの static ステージで別途実行）
+        image_variants: 画像ファイル名をキーとしたバリアント情報（image_variant_manifest() の結果）
+        env: 使い回す Jinja2 環境（省略時は create_jinja_env() で作成）
+    """
+    print(f"\n📝 HTMLを生成中...")
+    
+    # Jinja2環境を設定
+    if env is None:
+        env = create_jinja_env()
+    
+    # テンプレートを読み込み
+    template = env.get_template("index.html")
+    
+    # テンプレートに渡すデータ
+    context = {
+        "site_title": config.get("site", {}).get("title", "想い出のラーメン - メモリアルサイト"),
+        "site_description": config.get("site", {}).get("description", "故人を偲ぶメモリアルサイト"),
+        "shop_name": config.get("site", {}).get("shop_name", "想い出のラーメン"),
+        "hero": config.get("hero", {}),
+        "navigation": config.get("navigation", {}),
+        "sections": config.get("sections", {}),
+        "footer": config.get("footer", {}),
+        "ui": config.get("ui", {}),
+        "config": config,
+        "comments": comments,
+        "images": images,
+        "about_html": about_html,
+        "store_history": store_history or [],
+        "menu_stats": menu_stats or {},
+        "image_variants": image_variants or {},
+        "generated_at": datetime.now().strftime("%Y年%m月%d日 %H:%M"),
+        "comment_count": len(comments),
+        "image_count": len(images),
+    }
+    
+    # タイムラインの残りを分割ページとして出力
+    initial_items, chunk_size = timeline_settings(config)
+    context["timeline_pages"] = write_timeline_pages(env, comments, initial_items, chunk_size, context)
+    context["timeline_initial"] = initial_items if context["timeline_pages"] else len(comments)
+    
+    # HTMLを生成して index.html を public/ に出力
+    output_path = PUBLIC_DIR / "index.html"
+    count_stage("bytes_written", render_to_file(template, output_path, **context))
+    count_stage("timeline_pages", context["timeline_pages"])
+    print(f"✓ HTMLを出力: {output_path}")
+    
+    # static/ ディレクトリを public/ にコピー
+    if copy_static:
+        copy_static_files()
+
+
+def clone_file(src: Path, dst: Path) -> bool:
+    """
+    reflink（コピーオンライト）で src を dst に複製します（Linux の FICLONE）。
+    
+    Returns:
+        bool: 複製できた場合は True（非対応のファイルシステムでは False）
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    
+    FICLONE = 0x40049409
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        dst.unlink(missing_ok=True)
+        return False
+    import shutil
+    shutil.copystat(src, dst)
+    return True
+
+
+def is_synced(src: Path, src_stat: os.stat_result, dst: Path) -> bool:
+    """
+    dst が src と同じ内容かどうかを判定します。
+    
+    同じ inode（ハードリンク）、またはサイズと更新日時が一致すれば同じとみなします。
+    サイズだけが一致する場合はハッシュを比較し、同じなら dst の更新日時を揃えて
+    次回からはハッシュ計算を省略できるようにします。
+    """
+    try:
+        dst_stat = dst.stat()
+    except FileNotFoundError:
+        return False
+    
+    if (dst_stat.st_dev, dst_stat.st_ino) == (src_stat.st_dev, src_stat.st_ino):
+        return True
+    if dst_stat.st_size != src_stat.st_size:
+        return False
+    if dst_stat.st_mtime_ns == src_stat.st_mtime_ns:
+        return True
+    if compute_file_hash(dst) != compute_file_hash(src):
+        return False
+    os.utime(dst, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+    return True
+
+
+def sync_directory(src_dir: Path, dst_dir: Path, pattern: str = "*", mode: str = None) -> dict:
+    """
+    src_dir のファイルを dst_dir に差分同期します。
+    
+    内容が同じファイルはスキップし、src_dir にないファイルは dst_dir から削除します。
+    配置は reflink → ハードリンク → コピーの順に試し（mode="auto"）、
+    一時ファイルに作成してから os.replace() で置き換えるため、途中で中断しても
+    壊れたファイルが残りません。
+    
+    ハードリンクの場合は public/ と static/ で同じファイルを共有するため、
+    public/ 側のファイルを書き換える処理は、必ず別ファイルに書いてから置き換えてください。
+    
+    Args:
+        src_dir: 同期元ディレクトリ
+        dst_dir: 同期先ディレクトリ
+        pattern: 対象ファイルの glob パターン
+        mode: "auto"（reflink / ハードリンク / コピー）または "copy"（None なら STATIC_SYNC_MODE）
+    
+    Returns:
+        dict: copied / linked / skipped / removed の件数と、コピーしたバイト数（bytes）
+    """
+    import shutil
+    
+    if mode is None:
+        mode = STATIC_SYNC_MODE
+    stats = {"copied": 0, "linked": 0, "skipped": 0, "removed": 0, "bytes": 0}
+    dst_dir.mkdir(parents=True, exist_ok=True)
+    
+    sources = {path.name: path for path in src_dir.glob(pattern) if path.is_file()}
+    
+    # 同期元にないファイルを削除
+    for path in dst_dir.glob(pattern):
+        if path.is_file() and path.name not in sources:
+            path.unlink()
+            stats["removed"] += 1
+    
+    # reflink / ハードリンクが使えないと分かったら以降は試さない
+    can_clone = can_link = (mode == "auto")
+    for name, src in sorted(sources.items()):
+        src_stat = src.stat()
+        dst = dst_dir / name
+        if is_synced(src, src_stat, dst):
+            stats["skipped"] += 1
+            continue
+        
+        tmp = dst_dir / f".{name}.tmp"
+        tmp.unlink(missing_ok=True)
+        if can_clone and clone_file(src, tmp):
+            stats["linked"] += 1
+        else:
+            can_clone = False
+            try:
+                if not can_link:
+                    raise OSError("hardlink disabled")
+                os.link(src, tmp)
+                stats["linked"] += 1
+            except OSError:
+                can_link = False
+                shutil.copy2(src, tmp)
+                stats["copied"] += 1
+                stats["bytes"] += src_stat.st_size
+        os.replace(tmp, dst)
+    
+    return stats
 
-        with open(output_path, "wb") as f:
-            f.write(r.content)
 
-        return True
+def copy_static_files():
+    """
+    static/ ディレクトリの内容を public/ に差分同期します。
+    
+    変更のないファイルはスキップし、static/ から削除されたファイルは public/ からも削除します。
+    """
+    targets = [
+        ("CSS", STATIC_DIR / "css", PUBLIC_DIR / "static" / "css", "*.css"),
+        ("画像", OUTPUT_IMAGES_DIR, PUBLIC_DIR / "static" / "images", "*"),
+    ]
+    for label, src_dir, dst_dir, pattern in targets:
+        if not src_dir.exists():
+            continue
+        stats = sync_directory(src_dir, dst_dir, pattern)
+        count_stage("files_copied", stats["copied"])
+        count_stage("files_linked", stats["linked"])
+        count_stage("files_skipped", stats["skipped"])
+        count_stage("files_removed", stats["removed"])
+        count_stage("bytes_written", stats["bytes"])
+        print(
+            f"✓ {label}を同期: コピー {stats['copied']} / リンク {stats['linked']} / "
+            f"変更なし {stats['skipped']} / 削除 {stats['removed']}"
+        )
 
-    except requests.RequestException as e:
-        print(f"  ✗ ダウンロード失敗(HTTP): {e}")
-        return False
-    except Exception as e:
-        print(f"  ✗ ダウンロード失敗: {e}")
-        return False
+
+def compress_file(path: Path, brotli_module=None) -> dict:
+    """
+    1つのファイルの .gz（と brotli が使える場合は .br）を出力します。
+    
+    出力したファイルの更新日時は元ファイルと同じにするため、
+    次回は更新日時の比較だけで最新かどうかを判定できます。
+    gzip ヘッダーの日時は 0 に固定し、同じ入力からは同じ出力になるようにします。
+    
+    Args:
+        path: 元ファイルのパス
+        brotli_module: brotli モジュール（None なら .br は出力しない）
+    
+    Returns:
+        dict: size（元のバイト数）と、出力した形式ごとのバイト数（gz / br）
+    """
+    import gzip
+    
+    stat = path.stat()
+    data = path.read_bytes()
+    result = {"size": len(data)}
+    encoders = {"gz": lambda d: gzip.compress(d, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli_module is not None:
+        encoders["br"] = lambda d: brotli_module.compress(d, quality=BROTLI_QUALITY)
+    
+    for ext, encode in encoders.items():
+        sibling = path.with_name(f"{path.name}.{ext}")
+        compressed = encode(data)
+        if len(compressed) >= len(data):
+            # 圧縮しても小さくならない場合は出力しない
+            sibling.unlink(missing_ok=True)
+            continue
+        tmp = sibling.with_name(f".{sibling.name}.tmp")
+        tmp.write_bytes(compressed)
+        os.utime(tmp, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(tmp, sibling)
+        result[ext] = len(compressed)
+    return result
 
 
-def load_download_history() -> dict:
+def load_compress_no_gain() -> dict:
     """
-    ダウンロード履歴を読み込みます。
+    圧縮しても小さくならなかったため出力しなかった .gz / .br の記録を読み込みます。
     
     Returns:
-        dict: URLハッシュをキーとした履歴辞書
+        dict: public/ からの相対パス（例: "index.html.gz"）をキー、
+              そのときの元ファイルの (サイズ, 更新日時) を値とした辞書
     """
-    if DOWNLOAD_HISTORY_FILE.exists():
-        try:
-            with open(DOWNLOAD_HISTORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"  ⚠️ ダウンロード履歴の読み込みに失敗: {e}")
+    try:
+        with state_db() as conn:
+            return {file: (size, mtime_ns) for file, size, mtime_ns in conn.execute("SELECT * FROM compress_no_gain")}
+    except Exception as e:
+        print(f"  ⚠️ 圧縮結果の記録の読み込みに失敗: {e}")
     return {}
 
 
-def save_download_history(history: dict):
+def save_compress_no_gain(no_gain: dict):
     """
-    ダウンロード履歴を保存します。
+    出力しなかった .gz / .br の記録を保存します（記録にないものは削除）。
     
     Args:
-        history: URLハッシュをキーとした履歴辞書
+        no_gain: load_compress_no_gain() と同じ形式の辞書
     """
     try:
-        with open(DOWNLOAD_HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
+        with state_db() as conn:
+            sync_state_table(conn, "compress_no_gain", no_gain)
     except Exception as e:
-        print(f"  ⚠️ ダウンロード履歴の保存に失敗: {e}")
+        print(f"  ⚠️ 圧縮結果の記録の保存に失敗: {e}")
 
 
-def download_images_from_csv(df: pd.DataFrame) -> int:
+def compress_public_files(workers: int = None) -> dict:
     """
-    CSVに含まれるGoogle Drive URLから画像をダウンロードします。
+    public/ のテキストファイル（HTML / CSS / JS など）を事前圧縮します。
+    
+    元ファイルと同じ更新日時の .gz（/ .br）があるファイルはスキップし、
+    元ファイルがなくなった .gz / .br は削除します。圧縮しても小さくならず出力しなかった形式は
+    元ファイルのサイズと更新日時を状態データベースに記録し、変わっていなければ次回もスキップします。
+    brotli はインストールされている場合のみ使用します（pip install brotli）。
     
     Args:
-        df: コメントデータのDataFrame
+        workers: 並列に圧縮するスレッド数（None なら CPU コア数）
     
     Returns:
-        int: ダウンロードした画像の数
+        dict: compressed / skipped / removed の件数と、出力したバイト数（bytes）
     """
-    import hashlib
+    from concurrent.futures import ThreadPoolExecutor
     
-    if df.empty:
-        return 0
+    print(f"\n🗜️ public/ のファイルを事前圧縮中...")
     
-    print(f"\n📥 CSV内の画像をダウンロード中...")
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print("  ℹ️ brotli がインストールされていないため、.gz のみ出力します")
     
-    # 写真URLのカラムを探す（正規化後は photo を優先）
-    if "photo" in df.columns:
-        photo_col_idx = list(df.columns).index("photo")
-    else:
-        photo_col_idx = None
-        photo_col_names = ['写真', 'photo', 'Photo', '画像', 'image', 'Image']
-        for idx, col_name in enumerate(df.columns):
-            if any(keyword in str(col_name) for keyword in photo_col_names):
-                photo_col_idx = idx
-                break
+    suffixes = ["gz"] + (["br"] if brotli else [])
+    stats = {"compressed": 0, "skipped": 0, "removed": 0, "bytes": 0}
+    if not PUBLIC_DIR.exists():
+        return stats
     
-    # 写真列が見つからない場合
-    if photo_col_idx is None:
-        print(f"  ℹ️ CSVに写真列が見つかりませんでした。スキップします。")
-        return 0
+    no_gain = load_compress_no_gain()
+    new_no_gain = {}
+    targets = []
+    for path in PUBLIC_DIR.rglob("*"):
+        if not path.is_file():
+            continue
+        if path.suffix in (".gz", ".br"):
+            # 元ファイルがなくなった圧縮ファイルを削除
+            source = path.with_suffix("")
+            if source.suffix.lower() in COMPRESS_EXTENSIONS and not source.exists():
+                path.unlink()
+                stats["removed"] += 1
+            continue
+        if path.suffix.lower() not in COMPRESS_EXTENSIONS:
+            continue
+        stat = path.stat()
+        if stat.st_size < COMPRESS_MIN_SIZE:
+            continue
+        siblings = [path.with_name(f"{path.name}.{ext}") for ext in suffixes]
+        # 圧縮済み（同じ更新日時）か、同じ元ファイルで圧縮効果がなかった形式なら最新
+        source_key = (stat.st_size, stat.st_mtime_ns)
+        no_gain_files = []
+        current = True
+        for sibling in siblings:
+            file = str(sibling.relative_to(PUBLIC_DIR))
+            if no_gain.get(file) == source_key:
+                no_gain_files.append(file)
+            elif not (sibling.exists() and sibling.stat().st_mtime_ns == stat.st_mtime_ns):
+                current = False
+        if current:
+            stats["skipped"] += 1
+            new_no_gain.update((file, source_key) for file in no_gain_files)
+            continue
+        targets.append(path)
     
-    RAW_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        results = list(executor.map(lambda p: compress_file(p, brotli), targets))
     
-    # ダウンロード履歴を読み込み
-    download_history = load_download_history()
-    downloaded_count = 0
-    history_updated = False
+    for path, result in sorted(zip(targets, results)):
+        stat = path.stat()
+        for ext in suffixes:
+            if ext not in result:
+                new_no_gain[f"{path.relative_to(PUBLIC_DIR)}.{ext}"] = (stat.st_size, stat.st_mtime_ns)
+        stats["compressed"] += 1
+        stats["bytes"] += sum(result.get(ext, 0) for ext in suffixes)
+        ratios = " / ".join(
+            f"{ext} {result[ext] / 1024:.1f} KB ({result[ext] / result['size'] * 100:.0f}%)"
+            for ext in suffixes if ext in result
+        )
+        print(f"  ✓ {path.relative_to(PUBLIC_DIR)}: {result['size'] / 1024:.1f} KB → {ratios or '圧縮効果なし'}")
     
-    for idx, row in df.iterrows():
-        # 写真URLのカラムにアクセス
-        if len(row) <= photo_col_idx:
-            continue
+    if new_no_gain != no_gain:
+        save_compress_no_gain(new_no_gain)
+    
+    if stats["skipped"]:
+        print(f"  ⊙ 圧縮済みのファイルをスキップ: {stats['skipped']} 件")
+    if stats["removed"]:
+        print(f"  ✓ 不要になった圧縮ファイルを削除: {stats['removed']} 件")
+    return stats
 
-        photo_url = row.iloc[photo_col_idx]
 
-        # URLが空でない場合で、実際にURLらしい文字列の場合のみダウンロード
-        if pd.notna(photo_url) and str(photo_url).strip() and str(photo_url) != "nan":
-            photo_url_str = str(photo_url).strip()
-            if not (photo_url_str.startswith('http') or 'drive.google.com' in photo_url_str):
-                # 共有URLではない値（ファイル名など）の可能性
+def remove_stale_compressed() -> int:
+    """
+    元ファイルが書き換えられて古くなった public/ の .gz / .br を削除します（--watch の再ビルド用）。
+    
+    compress_public_files() は圧縮ファイルの更新日時を元ファイルと同じにするため、
+    更新日時が一致しないものは元ファイルが書き換えられたあとの古い内容です。
+    残しておくとプレビューサーバーやデプロイ先が古い内容を配信するため削除し、次のビルドで作り直します。
+    
+    Returns:
+        int: 削除したファイル数
+    """
+    removed = 0
+    if not PUBLIC_DIR.exists():
+        return removed
+    for sibling in PUBLIC_DIR.rglob("*"):
+        if sibling.suffix not in (".gz", ".br"):
+            continue
+        source = sibling.with_suffix("")
+        if source.suffix.lower() not in COMPRESS_EXTENSIONS:
+            continue
+        try:
+            if source.exists() and source.stat().st_mtime_ns == sibling.stat().st_mtime_ns:
                 continue
+            sibling.unlink()
+            removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
 
-            # ファイル名を生成（タイムスタンプ + URLのハッシュ）
-            # URLのハッシュを使用することで、同じ写真は常に同じファイル名になる
-            timestamp = row.get("timestamp", "") if "timestamp" in df.columns else (row.iloc[0] if len(row) > 0 else "")
-            safe_timestamp = str(timestamp).replace("/", "").replace(":", "").replace(" ", "_")
-            
-            # URLのハッシュを計算（最初の8文字のみ使用）
-            url_hash = hashlib.md5(photo_url_str.encode('utf-8')).hexdigest()[:8]
-            filename = f"photo_{safe_timestamp}_{url_hash}.jpg"
-            output_path = RAW_IMAGES_DIR / filename
-
-            # ダウンロード履歴でチェック
-            if url_hash in download_history:
-                # 履歴にあるが、ファイルが削除されている場合は再ダウンロード
-                if output_path.exists():
-                    print(f"  ⊙ スキップ（履歴あり）: {filename}")
-                    continue
-                else:
-                    print(f"  ℹ️ ファイルが見つからないため再ダウンロード: {filename}")
-            
-            # 既にダウンロード済みならスキップ
-            if output_path.exists():
-                print(f"  ⊙ スキップ（既存）: {filename}")
-                # 履歴に追加
-                download_history[url_hash] = {
-                    "url": photo_url_str,
-                    "filename": filename,
-                    "timestamp": safe_timestamp,
-                    "downloaded_at": datetime.now().isoformat()
-                }
-                history_updated = True
-                continue
 
-            print(f"  ⬇ ダウンロード中: {filename}")
-            if download_image_from_google_drive(str(photo_url), output_path):
-                print(f"  ✓ 保存完了: {filename}")
-                downloaded_count += 1
-                # ダウンロード履歴に追加
-                download_history[url_hash] = {
-                    "url": photo_url_str,
-                    "filename": filename,
-                    "timestamp": safe_timestamp,
-                    "downloaded_at": datetime.now().isoformat()
-                }
-                history_updated = True
+HTML_VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "source", "track", "wbr",
+}
+HTML_RAW_ELEMENTS = ("script", "style", "pre", "textarea")
+
+# HTML をトークン（コメント / 生テキスト要素 / タグ / テキスト）に分割する正規表現
+HTML_TOKEN_PATTERN = re.compile(
+    r"(?P<comment><!--.*?-->)"
+    r"|(?P<raw><(?P<raw_tag>script|style|pre|textarea)\b[^>]*>.*?</(?P=raw_tag)\s*>)"
+    r"|(?P<tag></?[a-zA-Z][^>]*>|<![^>]*>)"
+    r"|(?P<text>[^<]+|<)",
+    re.DOTALL | re.IGNORECASE,
+)
+CSS_AT_STATEMENT_PATTERN = re.compile(r"\s*@")
+
+
+def parse_simple_selector(selector: str) -> list:
+    """
+    子孫結合子だけからなるセレクタを (タグ, クラスの集合) のリストに分解します。
+    擬似クラス・属性セレクタは無視し、子結合子（>）なども子孫結合子として扱います。
+    """
+    parts = []
+    for compound in re.split(r"[\s>+~]+", re.sub(r"::?[\w-]+(\([^)]*\))?|\[[^\]]*\]", "", selector).strip()):
+        if not compound:
+            continue
+        tag = re.match(r"[a-zA-Z][\w-]*", compound)
+        classes = set(re.findall(r"\.([\w-]+)", compound))
+        parts.append((tag.group(0).lower() if tag else None, classes))
+    return parts
+
+
+def selector_matches_stack(parts: list, stack: list) -> bool:
+    """
+    parse_simple_selector() の結果が、開いている要素のスタックのいずれかの要素に一致するか判定します。
+    （white-space は継承されるため、祖先の要素が一致すればその中のテキストも対象になります）
+    """
+    def match(compound, element):
+        tag, classes = compound
+        return (tag is None or tag == element[0]) and classes <= element[1]
     
-    # ダウンロード履歴を保存（更新があった場合のみ）
-    if history_updated:
-        save_download_history(download_history)
-        print(f"  ✓ ダウンロード履歴を更新しました")
+    for end in range(len(stack)):
+        if not match(parts[-1], stack[end]):
+            continue
+        # 残りのセレクタを祖先の要素に順に当てはめる
+        remaining = parts[:-1]
+        for element in reversed(stack[:end]):
+            if remaining and match(remaining[-1], element):
+                remaining = remaining[:-1]
+        if not remaining:
+            return True
+    return False
+
+
+def preserved_whitespace_selectors(css_text: str) -> list:
+    """
+    CSS から white-space: pre / pre-wrap / pre-line / break-spaces を指定したセレクタを集めます。
+    これらに一致する要素の中のテキストは、HTML の圧縮で空白を詰めません。
+    """
+    selectors = []
+    css_text = re.sub(r"/\*.*?\*/", "", css_text, flags=re.DOTALL)
+    for prelude, body in re.findall(r"([^{}]+)\{([^{}]*)\}", css_text):
+        if re.search(r"white-space\s*:\s*(pre|break-spaces)", body):
+            selectors.extend(parse_simple_selector(s) for s in prelude.split(",") if s.strip())
+    return [s for s in selectors if s]
+
+
+def minify_js(script: str) -> str:
+    """
+    インラインスクリプトのコメントとインデントを取り除きます。
     
-    if downloaded_count > 0:
-        print(f"  → {downloaded_count} 件の画像をダウンロードしました")
-    else:
-        print(f"  → ダウンロードする新しい画像はありませんでした")
+    文字列・テンプレートリテラル・正規表現リテラルの中は変更しません。
+    改行を含む空白は改行1つに、それ以外の空白は空白1つにまとめるため、
+    自動セミコロン挿入の挙動は変わりません。
+    """
+    out = []
+    i = 0
+    n = len(script)
+    last = ""  # 直前の空白以外の文字（正規表現リテラルの判定に使用）
+    while i < n:
+        c = script[i]
+        if c in "'\"`":
+            # 文字列リテラル
+            j = i + 1
+            while j < n and script[j] != c:
+                j += 2 if script[j] == "\\" else 1
+            out.append(script[i:j + 1])
+            last = c
+            i = j + 1
+        elif c == "/" and script.startswith("//", i):
+            j = script.find("\n", i)
+            i = n if j < 0 else j
+        elif c == "/" and script.startswith("/*", i):
+            j = script.find("*/", i + 2)
+            i = n if j < 0 else j + 2
+            out.append(" ")
+        elif c == "/" and (last == "" or last in "(,=:[!&|?{};+-*%<>~^"):
+            # 正規表現リテラル
+            j = i + 1
+            in_class = False
+            while j < n and (script[j] != "/" or in_class) and script[j] != "\n":
+                if script[j] == "\\":
+                    j += 1
+                elif script[j] == "[":
+                    in_class = True
+                elif script[j] == "]":
+                    in_class = False
+                j += 1
+            m = re.match(r"/[a-z]*", script[j:])
+            end = j + (len(m.group(0)) if m else 0)
+            out.append(script[i:end])
+            last = "/"
+            i = end
+        elif c.isspace():
+            j = i
+            while j < n and script[j].isspace():
+                j += 1
+            out.append("\n" if "\n" in script[i:j] else " ")
+            i = j
+        else:
+            out.append(c)
+            last = c
+            i += 1
     
-    return downloaded_count
+    # 行頭・行末の空白と空行を除去
+    lines = (line.strip() for line in "".join(out).split("\n"))
+    return "\n".join(line for line in lines if line)
+
 
+def minify_tag(tag: str) -> str:
+    """タグ内の属性間の空白をまとめます（引用符で囲まれた属性値はそのまま）"""
+    tag = collapse_whitespace(tag)
+    return re.sub(r"\s+(/?>)$", r"\1", tag)
 
-def process_images() -> list:
+
+def minify_html(html: str, preserve_selectors: list = ()) -> str:
     """
-    raw_images/ 内の画像をリサイズして static/images/ に出力します。
+    HTML からコメントと余分な空白を取り除きます。
     
-    Returns:
-        list: 処理された画像ファイル名のリスト
-    """
-    print(f"\n🖼️ 画像を処理中...")
+    - コメントは削除（条件付きコメント <!--[if ...]> は残す）
+    - pre / textarea / style の中身と、preserve_selectors に一致する要素の中のテキストはそのまま
+    - インライン <script> は minify_js() で圧縮
+    - それ以外のテキストは、連続する空白を1つにまとめる（表示は変わりません）
     
-    # 対応する画像形式
-    supported_extensions = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
-    processed_images = []
+    同じ入力からは常に同じ出力になり、圧縮済みの HTML に再度適用しても変化しません。
     
-    if not RAW_IMAGES_DIR.exists():
-        print(f"  → raw_images/ ディレクトリが見つかりません")
-        return processed_images
+    Args:
+        html: HTML文字列
+        preserve_selectors: preserved_whitespace_selectors() の結果
     
-    # raw_images/ 内のすべての画像を処理
-    for image_path in RAW_IMAGES_DIR.iterdir():
-        if image_path.suffix.lower() not in supported_extensions:
+    Returns:
+        str: 圧縮したHTML
+    """
+    out = []
+    stack = []
+    trailing_space = False  # 直前に出力したテキストが空白で終わっているか
+    for m in HTML_TOKEN_PATTERN.finditer(html):
+        token = m.group(0)
+        if m.group("text") is not None:
+            if any(selector_matches_stack(parts, stack) for parts in preserve_selectors):
+                out.append(token)
+                trailing_space = False
+            else:
+                text = re.sub(r"\s+", lambda w: "\n" if "\n" in w.group(0) else " ", token)
+                if trailing_space:
+                    # コメントを削除して隣り合った空白は1つにまとめる
+                    text = text.lstrip()
+                out.append(text)
+                trailing_space = text[-1:].isspace() if text else trailing_space
             continue
-        
-        try:
-            # 画像を開く
-            with Image.open(image_path) as img:
-                # RGBAの場合はRGBに変換（WebP/JPEG用）
-                if img.mode in ("RGBA", "P"):
-                    img = img.convert("RGB")
-                
-                # アスペクト比を維持してリサイズ
-                img.thumbnail((MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT), Image.Resampling.LANCZOS)
-                
-                # 出力ファイル名を決定
-                output_filename = f"{image_path.stem}.{OUTPUT_FORMAT}"
-                output_path = OUTPUT_IMAGES_DIR / output_filename
-                
-                # 保存
-                if OUTPUT_FORMAT == "webp":
-                    img.save(output_path, "WEBP", quality=IMAGE_QUALITY)
-                else:
-                    img.save(output_path, "JPEG", quality=IMAGE_QUALITY)
-                
-                processed_images.append(output_filename)
-                print(f"  ✓ {image_path.name} → {output_filename}")
-                
-        except Exception as e:
-            print(f"  ✗ {image_path.name} の処理に失敗: {e}")
-    
-    print(f"  → {len(processed_images)} 件の画像を処理しました")
-    return sorted(processed_images)
+        if m.group("comment") is not None:
+            if token.startswith("<!--[if"):
+                out.append(token)
+                trailing_space = False
+            continue
+        trailing_space = False
+        if m.group("raw") is not None:
+            tag_name = m.group("raw_tag").lower()
+            open_end = token.index(">") + 1
+            close_start = token.lower().rindex("</")
+            open_tag, body, close_tag = token[:open_end], token[open_end:close_start], token[close_start:]
+            type_attr = re.search(r"\btype\s*=\s*[\"']?([^\"'\s>]+)", open_tag, re.IGNORECASE)
+            if tag_name == "script" and "src=" not in open_tag.lower() and (
+                    not type_attr or "javascript" in type_attr.group(1).lower() or type_attr.group(1).lower() == "module"):
+                body = minify_js(body)
+            out.append(minify_tag(open_tag) + body + close_tag)
+        elif m.group("tag") is not None:
+            out.append(minify_tag(token))
+            name_match = re.match(r"</?([a-zA-Z][\w-]*)", token)
+            if not name_match:
+                continue
+            name = name_match.group(1).lower()
+            if token.startswith("</"):
+                # 対応する開始タグまでスタックを戻す
+                for k in range(len(stack) - 1, -1, -1):
+                    if stack[k][0] == name:
+                        del stack[k:]
+                        break
+            elif name not in HTML_VOID_ELEMENTS and not token.endswith("/>"):
+                class_attr = re.search(r"\bclass\s*=\s*(\"[^\"]*\"|'[^']*'|[^\s>]+)", token, re.IGNORECASE)
+                classes = set(class_attr.group(1).strip("\"'").split()) if class_attr else set()
+                stack.append((name, classes))
+    return "".join(out)
 
 
-def load_markdown_content(filename: str) -> str:
+def collect_used_selectors(html_texts: list, script_texts: list = ()) -> dict:
     """
-    Markdownファイルを読み込んでHTMLに変換します。
+    生成した HTML で使われているタグ名・クラス名・ID を集めます。
     
-    Args:
-        filename: content/ ディレクトリ内のファイル名
+    スクリプト（インライン・外部ファイル）の文字列リテラルに含まれる単語も
+    JavaScript から追加されるクラスの候補として含め、CSS_PURGE_SAFELIST も加えます。
     
     Returns:
-        str: HTMLに変換された内容
+        dict: {"tags": set, "classes": set, "ids": set}
     """
-    filepath = CONTENT_DIR / filename
-    
-    if not filepath.exists():
-        print(f"⚠️ {filepath} が見つかりません")
-        return ""
+    used = {"tags": set(), "classes": set(CSS_PURGE_SAFELIST), "ids": set()}
+    scripts = list(script_texts)
+    for html in html_texts:
+        used["tags"].update(t.lower() for t in re.findall(r"<([a-zA-Z][\w-]*)", html))
+        for value in re.findall(r"\bclass\s*=\s*[\"']([^\"']*)[\"']", html, re.IGNORECASE):
+            used["classes"].update(value.split())
+        used["ids"].update(re.findall(r"\bid\s*=\s*[\"']([^\"']*)[\"']", html, re.IGNORECASE))
+        scripts.extend(re.findall(r"<script\b[^>]*>(.*?)</script\s*>", html, re.DOTALL | re.IGNORECASE))
+    for script in scripts:
+        for literal in re.findall(r"'([^'\n]*)'|\"([^\"\n]*)\"|`([^`]*)`", script):
+            words = re.findall(r"[\w-]+", "".join(literal))
+            used["classes"].update(words)
+            used["ids"].update(words)
+    return used
+
+
+def selector_is_used(selector: str, used: dict) -> bool:
+    """
+    セレクタに含まれるタグ名・クラス名・ID がすべて HTML に存在するか判定します。
+    擬似クラス・擬似要素・属性セレクタは判定に使わないため、判断できない場合は残す側に倒れます。
+    """
+    stripped = re.sub(r"::?[\w-]+(\([^)]*\))?|\[[^\]]*\]", " ", selector)
+    classes = re.findall(r"\.([\w-]+)", stripped)
+    ids = re.findall(r"#([\w-]+)", stripped)
+    tags = [t.lower() for t in re.findall(r"(?:^|[\s>+~(])([a-zA-Z][\w-]*)", stripped)]
+    return (
+        all(c in used["classes"] for c in classes)
+        and all(i in used["ids"] for i in ids)
+        and all(t in used["tags"] for t in tags)
+    )
+
+
+def split_top_level(text: str, sep: str) -> list:
+    """括弧・引用符の外側にある区切り文字で分割します"""
+    parts, depth, quote, start = [], 0, "", 0
+    for k, c in enumerate(text):
+        if quote:
+            if c == quote:
+                quote = ""
+        elif c in "'\"":
+            quote = c
+        elif c in "([":
+            depth += 1
+        elif c in ")]":
+            depth -= 1
+        elif c == sep and depth == 0:
+            parts.append(text[start:k])
+            start = k + 1
+    parts.append(text[start:])
+    return parts
+
+
+def collapse_whitespace(text: str) -> str:
+    """引用符の外側にある連続した空白を1つにまとめます"""
+    parts = re.split(r"(\"[^\"]*\"|'[^']*')", text)
+    for k in range(0, len(parts), 2):
+        parts[k] = re.sub(r"\s+", " ", parts[k])
+    return "".join(parts)
+
+
+def minify_css_declarations(body: str) -> str:
+    """宣言ブロックの空白を詰め、最後のセミコロンを取り除きます"""
+    declarations = []
+    for declaration in split_top_level(body, ";"):
+        declaration = collapse_whitespace(declaration).strip()
+        if not declaration:
+            continue
+        prop, _, value = declaration.partition(":")
+        value = ",".join(v.strip() for v in split_top_level(value, ","))
+        declarations.append(f"{prop.strip()}:{value.strip()}")
+    return ";".join(declarations)
+
+
+def minify_css(css_text: str, used: dict = None) -> str:
+    """
+    CSS を圧縮し、used が指定された場合は HTML で使われていないセレクタを取り除きます。
     
-    with open(filepath, "r", encoding="utf-8") as f:
-        md_content = f.read()
+    - @media / @supports の中は再帰的に処理し、空になったブロックは削除
+    - @keyframes / @font-face などはセレクタの判定をせずに圧縮のみ
     
-    # MarkdownをHTMLに変換（拡張機能付き）
-    html_content = markdown.markdown(
-        md_content,
-        extensions=["extra", "nl2br", "sane_lists"]
-    )
+    Args:
+        css_text: CSS文字列
+        used: collect_used_selectors() の結果（None なら削除しない）
     
-    return html_content
+    Returns:
+        str: 圧縮したCSS
+    """
+    css_text = re.sub(r"/\*.*?\*/", "", css_text, flags=re.DOTALL)
+    out = []
+    i = 0
+    n = len(css_text)
+    while i < n:
+        brace = css_text.find("{", i)
+        semicolon = css_text.find(";", i)
+        if brace < 0:
+            break
+        if CSS_AT_STATEMENT_PATTERN.match(css_text, i) and 0 <= semicolon < brace:
+            # @import などの文
+            out.append(re.sub(r"\s+", " ", css_text[i:semicolon]).strip() + ";")
+            i = semicolon + 1
+            continue
+        prelude = re.sub(r"\s+", " ", css_text[i:brace]).strip()
+        # 対応する閉じ括弧を探す
+        depth, j = 1, brace + 1
+        while j < n and depth:
+            if css_text[j] == "{":
+                depth += 1
+            elif css_text[j] == "}":
+                depth -= 1
+            j += 1
+        body = css_text[brace + 1:j - 1]
+        i = j
+        
+        if prelude.startswith("@"):
+            keyword = re.match(r"@([\w-]+)", prelude).group(1).lower()
+            if "{" in body:
+                inner = minify_css(body, used if keyword in ("media", "supports", "container", "layer") else None)
+            else:
+                inner = minify_css_declarations(body)
+            if inner:
+                out.append(f"{prelude}{{{inner}}}")
+            continue
+        
+        selectors = [re.sub(r"\s*([>+~])\s*", r"\1", s.strip()) for s in split_top_level(prelude, ",")]
+        if used is not None:
+            selectors = [s for s in selectors if selector_is_used(s, used)]
+        declarations = minify_css_declarations(body)
+        if selectors and declarations:
+            out.append(f"{','.join(selectors)}{{{declarations}}}")
+    return "".join(out)
 
 
-def extract_store_history(about_html: str) -> tuple:
+def minify_targets() -> tuple:
+    """--minify の対象となる public/ の HTML と CSS のパス"""
+    html_files = [PUBLIC_DIR / "index.html"] + sorted((PUBLIC_DIR / "timeline").glob("*.html"))
+    css_files = sorted((PUBLIC_DIR / "static" / "css").glob("*.css"))
+    return [p for p in html_files if p.exists()], css_files
+
+
+def write_text_atomic(path: Path, text: str):
     """
-    店舗の変遷情報をHTMLから抽出します。
+    一時ファイルに書いてから置き換えます。
+    public/ のファイルは static/ とハードリンクを共有している場合があるため、直接書き換えません。
+    """
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def optimize_public_files() -> dict:
+    """
+    public/ の HTML を圧縮し、CSS から使われていないセレクタを取り除いて圧縮します。
     
-    Args:
-        about_html: about.mdから変換されたHTML
+    CSS は static/css/ の元ファイルから毎回作り直すため、HTML の変更で
+    新しく使われるようになったセレクタが失われることはありません。
     
     Returns:
-        tuple: (店舗変遷を除いたHTML, 店舗変遷のリスト)
+        dict: ファイルの相対パスをキーとした (処理前のバイト数, 処理後のバイト数) の辞書
     """
-    import re
+    print(f"\n✂️ HTML / CSS を最適化中...")
     
-    # 「店舗の変遷」セクションを抽出
-    history_pattern = r'<h2>店舗の変遷</h2>(.*?)<hr\s*/>'
-    match = re.search(history_pattern, about_html, re.DOTALL)
+    html_files, css_files = minify_targets()
+    results = {}
     
-    if not match:
-        return about_html, []
+    css_sources = {path.name: (STATIC_DIR / "css" / path.name) for path in css_files}
+    css_texts = {
+        name: src.read_text(encoding="utf-8")
+        for name, src in css_sources.items() if src.exists()
+    }
+    preserve = []
+    for text in css_texts.values():
+        preserve.extend(preserved_whitespace_selectors(text))
     
-    history_section = match.group(1)
-    about_without_history = about_html.replace(match.group(0), '<hr />')
+    html_texts = []
+    for path in html_files:
+        html = path.read_text(encoding="utf-8")
+        minified = minify_html(html, preserve)
+        html_texts.append(minified)
+        if minified != html:
+            write_text_atomic(path, minified)
+        results[str(path.relative_to(PUBLIC_DIR))] = (len(html.encode("utf-8")), len(minified.encode("utf-8")))
     
-    # 各店舗の情報を抽出（h3とimgを別々に）
-    stores = []
+    scripts = [p.read_text(encoding="utf-8") for p in sorted((PUBLIC_DIR / "static" / "js").glob("*.js"))]
+    used = collect_used_selectors(html_texts, scripts)
+    for path in css_files:
+        source = css_texts.get(path.name)
+        if source is None:
+            continue
+        minified = minify_css(source, used)
+        if path.read_text(encoding="utf-8") != minified:
+            write_text_atomic(path, minified)
+        results[str(path.relative_to(PUBLIC_DIR))] = (len(source.encode("utf-8")), len(minified.encode("utf-8")))
     
-    # h3タグを探す
-    h3_pattern = r'<h3>(.*?)</h3>'
-    img_pattern = r'<img\s+alt="(.*?)"\s+src="(.*?)"\s*/>'
+    for name, (before, after) in results.items():
+        print(f"  ✓ {name}: {before / 1024:.1f} KB → {after / 1024:.1f} KB ({after / before * 100:.0f}%)")
+    return results
+
+
+# =============================================================================
+# ウォッチモード
+# =============================================================================
+
+def watch_targets() -> dict:
+    """
+    --watch で監視する入力（名前: (パス, glob パターン)）。
+    パターンが None の場合はファイル1つを監視します。
+    """
+    return {
+        "templates": (TEMPLATES_DIR, "**/*"),
+        "content": (CONTENT_DIR, "**/*"),
+        "config": (CONFIG_FILE, None),
+        "css": (STATIC_DIR / "css", "*.css"),
+        "images": (RAW_IMAGES_DIR, "*"),
+    }
+
+
+def snapshot_watch_targets() -> dict:
+    """
+    監視対象のファイルの更新日時とサイズを取得します。
+    エディタの一時ファイル（. で始まる、~ で終わる）は除きます。
     
-    h3_matches = list(re.finditer(h3_pattern, history_section))
-    img_matches = list(re.finditer(img_pattern, history_section))
+    Returns:
+        dict: {入力名: {ファイルパス: (更新日時ns, サイズ)}}
+    """
+    snapshot = {}
+    for name, (path, pattern) in watch_targets().items():
+        if pattern is None:
+            files = [path]
+        else:
+            files = sorted(path.glob(pattern)) if path.exists() else []
+        entries = {}
+        for file in files:
+            if file.name.startswith(".") or file.name.endswith("~"):
+                continue
+            try:
+                st = file.stat()
+            except OSError:
+                continue
+            if file.is_file():
+                entries[str(file)] = (st.st_mtime_ns, st.st_size)
+        snapshot[name] = entries
+    return snapshot
+
+
+def changed_watch_areas(before: dict, after: dict) -> set:
+    """2つのスナップショットを比べて、変更があった入力名を返します。"""
+    return {name for name in set(before) | set(after) if before.get(name) != after.get(name)}
+
+
+def load_watch_session() -> dict:
+    """
+    --watch で使い回すデータを読み込みます。
     
-    # h3とimgを順番にマッチング
-    for idx, (h3_match, img_match) in enumerate(zip(h3_matches, img_matches)):
-        title = h3_match.group(1)
-        alt_text = img_match.group(1)
-        image_url = img_match.group(2)
-        
-        stores.append({
-            'id': f'store{idx}',
-            'title': title,
-            'alt': alt_text,
-            'image': image_url
-        })
+    直前の run_build() で保存したステージの結果を使うため、CSVの読み込みや
+    コメントデータの変換はやり直しません。Jinja2 環境もここで作成して使い回します。
     
-    return about_without_history, stores
+    Returns:
+        dict: 再ビルドに必要なデータ
+    """
+    images, image_variants = load_stage_result("images") or [[], {}]
+    about_html, store_history = load_stage_result("store_history") or ["", []]
+    return {
+        "env": create_jinja_env(),
+        "config": load_config(),
+        "comments": load_stage_result("comments") or [],
+        "menu_stats": load_stage_result("menu_stats") or {},
+        "images": images,
+        "image_variants": image_variants,
+        "about_html": about_html,
+        "store_history": store_history,
+    }
 
 
-def aggregate_menu_items(df: pd.DataFrame) -> dict:
+def rebuild_changed(session: dict, areas: set) -> list:
     """
-    「好きだったメニュー」を集計します。
-    カンマ区切り、全角カンマ、その他の区切り文字に対応します。
+    変更された入力に応じて、影響する出力だけを作り直します。
+    
+      - config:    config.json を読み直して HTML を再生成
+      - content:   about.md を変換し直して HTML を再生成
+      - templates: HTML を再生成（変更されたテンプレートだけ Jinja2 が読み直す）
+      - css:       static/css/ を public/ に同期
+      - images:    変更された画像だけエンコードし、public/ に同期して HTML を再生成
+    
+    事前圧縮は行わず、書き換えられた出力の古い .gz / .br は削除します。
     
     Args:
-        df: コメントデータのDataFrame
+        session: load_watch_session() のデータ（更新した内容で書き換えます）
+        areas: 変更があった入力名の集合
     
     Returns:
-        dict: メニュー名をキー、出現回数を値とした辞書（降順ソート済み）
+        list: 実行した処理の名前のリスト
     """
-    import re
-    from collections import Counter
-    
-    menu_counter = Counter()
+    steps = []
+    if "config" in areas:
+        session["config"] = load_config()
+        steps.append("config")
+    if "content" in areas:
+        session["about_html"], session["store_history"] = extract_store_history(load_markdown_content("about.md"))
+        steps.append("markdown")
+    if "images" in areas:
+        session["images"] = process_images()
+        session["image_variants"] = image_variant_manifest(load_image_manifest())
+        steps.append("images")
+    if areas & {"css", "images"}:
+        copy_static_files()
+        steps.append("static")
+    if areas & {"config", "content", "templates", "images"}:
+        generate_html(
+            session["comments"], session["images"], session["about_html"], session["config"],
+            session["store_history"], session["menu_stats"], copy_static=False,
+            image_variants=session["image_variants"], env=session["env"],
+        )
+        steps.append("html")
+    # 書き換えた出力の事前圧縮ファイルは古い内容のままになるため削除する
+    if steps and remove_stale_compressed():
+        steps.append("precompressed")
+    return steps
+
+
+# ライブリロードの世代番号（再ビルドのたびに増え、接続中のブラウザに通知する）
+_reload_generation = 0
+_reload_condition = threading.Condition()
+
+
+def notify_live_reload():
+    """接続中のブラウザにリロードを通知します。"""
+    global _reload_generation
+    with _reload_condition:
+        _reload_generation += 1
+        _reload_condition.notify_all()
+
+
+def inject_live_reload(html: str) -> str:
+    """
+    HTML の </body> の直前にライブリロード用のスクリプトを挿入します。
+    public/ のファイルは変更せず、プレビューサーバーの応答にだけ挿入します。
+    </body> のない断片（public/timeline/ のページなど）はそのまま返します。
+    """
+    index = html.lower().rfind("</body>")
+    if index < 0:
+        return html
+    snippet = f'<script>new EventSource("{LIVE_RELOAD_PATH}").onmessage=function(){{location.reload()}};</script>'
+    return html[:index] + snippet + html[index:]
+
+
+def create_preview_server(port: int):
+    """
+    public/ を配信し、HTML にライブリロード用のスクリプトを挿入するサーバーを作成します（--watch 用）。
     
-    if df.empty:
-        return {}
+    Args:
+        port: 待ち受けるポート
     
-    # 正規化済みスキーマがあればそれを優先
-    has_normalized = all(c in df.columns for c in ["timestamp", "comment", "name", "menu", "photo"])
+    Returns:
+        ThreadingHTTPServer: 起動前のサーバー
+    """
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
     
-    for idx, row in df.iterrows():
-        if has_normalized:
-            menu = row.get("menu", "")
-        else:
-            # 旧来の列並び（フォールバック）
-            menu = row.iloc[3] if len(row) > 3 else ""
+    class PreviewRequestHandler(SimpleHTTPRequestHandler):
+        """public/ を配信するハンドラ"""
         
-        # 空の場合はスキップ
-        if pd.isna(menu) or str(menu).strip() == "" or str(menu) == "nan":
-            continue
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=str(PUBLIC_DIR), **kwargs)
         
-        menu_str = str(menu).strip()
+        def log_message(self, format, *args):
+            # アクセスログは再ビルドのログが読みにくくなるため表示しない
+            pass
         
-        # 複数の区切り文字に対応: カンマ、全角カンマ、セミコロンなど
-        # 正規表現で複数の区切り文字を一度に分割
-        # カンマ（,）、全角カンマ（、）、全角カンマ（，）、セミコロン（;）、改行（\n）などで分割
-        # 区切り文字の前後の空白も削除
-        menu_items = re.split(r'[,、，;；\n]+', menu_str)
+        def end_headers(self):
+            self.send_header("Cache-Control", "no-store")
+            super().end_headers()
         
-        # 各メニュー項目を正規化（前後の空白を削除、空文字列を除外）
-        for item in menu_items:
-            normalized = item.strip()
-            # 全角スペースや通常のスペースのみの項目は除外
-            if normalized and normalized not in ['', ' ', '　']:
-                menu_counter[normalized] += 1
-    
-    # 出現回数で降順ソートして辞書に変換
-    sorted_menus = dict(sorted(menu_counter.items(), key=lambda x: x[1], reverse=True))
+        def do_GET(self):
+            path = self.path.split("?", 1)[0].split("#", 1)[0]
+            if path == LIVE_RELOAD_PATH:
+                self.send_live_reload_events()
+                return
+        
+            file_path = Path(self.translate_path(path))
+            if path.endswith("/") and file_path.is_dir():
+                file_path = file_path / "index.html"
+            if file_path.suffix != ".html" or not file_path.is_file():
+                super().do_GET()
+                return
+        
+            body = inject_live_reload(file_path.read_text(encoding="utf-8")).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def send_live_reload_events(self):
+            """再ビルドが完了するたびに reload イベントを送ります（接続が切れるまで続けます）。"""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            with _reload_condition:
+                seen = _reload_generation
+            try:
+                while True:
+                    with _reload_condition:
+                        _reload_condition.wait_for(lambda: _reload_generation != seen, timeout=15)
+                        current = _reload_generation
+                    if current != seen:
+                        seen = current
+                        self.wfile.write(b"data: reload\n\n")
+                    else:
+                        # 切断を検知するための空のイベント
+                        self.wfile.write(b": ping\n\n")
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
     
-    return sorted_menus
+    server = ThreadingHTTPServer(("", port), PreviewRequestHandler)
+    server.daemon_threads = True
+    return server
 
 
-def prepare_comments_data(df: pd.DataFrame) -> list:
+def watch(args: argparse.Namespace):
     """
-    DataFrameをテンプレート用の辞書リストに変換します。
+    ビルドしたあと public/ をライブリロード付きで配信し、入力の変更を監視して
+    影響する出力だけを再生成します（Ctrl+C で終了）。
     
-    Args:
-        df: コメントデータのDataFrame
+    監視する入力: templates/、content/、config.json、static/css/、raw_images/
+    CSV はビルド時に読み込んだものを使い続けます。再ビルドでは --minify と事前圧縮は行わず、
+    書き換えた出力の古い .gz / .br は削除します。
     
-    Returns:
-        list: コメントの辞書リスト
+    Args:
+        args: コマンドライン引数
     """
-    comments = []
+    run_build(args)
+    session = load_watch_session()
     
-    # データが空の場合は空のリストを返す
-    if df.empty:
-        return comments
+    try:
+        server = create_preview_server(args.port)
+    except OSError as e:
+        print(f"\n⚠️ ポート {args.port} でサーバーを起動できません: {e}")
+        sys.exit(1)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
     
-    # 正規化済みスキーマがあればそれを優先
-    has_normalized = all(c in df.columns for c in ["timestamp", "comment", "name", "menu", "photo"])
-
-    for idx, row in df.iterrows():
-        if has_normalized:
-            timestamp = row.get("timestamp", "")
-            content = row.get("comment", "")
-            name = row.get("name", "")
-            menu = row.get("menu", "")
-            photo_url = row.get("photo", "")
-            ts_dt = pd.to_datetime(timestamp, errors="coerce")
-        else:
-            # 旧来の列並び（フォールバック）
-            timestamp = row.iloc[0] if len(row) > 0 else ""
-            content = row.iloc[1] if len(row) > 1 else ""
-            name = row.iloc[2] if len(row) > 2 else "匿名"
-            menu = row.iloc[3] if len(row) > 3 else ""
-            ts_dt = pd.to_datetime(timestamp, errors="coerce")
-
-            # 写真URLのカラムを探す
-            photo_url = ""
-            photo_col_idx = None
-            photo_col_names = ['写真', 'photo', 'Photo', '画像', 'image', 'Image']
-            for c_idx, col_name in enumerate(df.columns):
-                if any(keyword in str(col_name) for keyword in photo_col_names):
-                    photo_col_idx = c_idx
-                    break
-            if photo_col_idx is not None and len(row) > photo_col_idx:
-                photo_url = row.iloc[photo_col_idx]
-
-        # 写真のローカルパスを特定（ダウンロード済みの画像）
-        photo_filename = None
-        if pd.notna(photo_url) and str(photo_url).strip() and str(photo_url) != "nan":
-            import hashlib
-            photo_url_str = str(photo_url).strip()
-            # URLらしい文字列の場合のみファイル名を生成
-            if photo_url_str.startswith('http') or 'drive.google.com' in photo_url_str:
-                # タイムスタンプ + URLのハッシュでファイル名を生成（ダウンロード時と同じロジック）
-                safe_timestamp = str(timestamp).replace("/", "").replace(":", "").replace(" ", "_")
-                url_hash = hashlib.md5(photo_url_str.encode('utf-8')).hexdigest()[:8]
-                photo_filename = f"photo_{safe_timestamp}_{url_hash}.webp"
-        
-        comment = {
-            "timestamp": timestamp,
-            "_ts_dt": ts_dt,
-            "content": str(content),
-            "menu": str(menu),
-            "photo_url": str(photo_url),
-            "photo_filename": photo_filename,  # ローカル画像ファイル名を追加
-            "name": str(name)
-        }
-        
-        # 名前が空の場合は「匿名」に
-        if pd.isna(comment["name"]) or comment["name"].strip() == "" or comment["name"] == "nan":
-            comment["name"] = "匿名"
-        
-        # メニュー情報をコンテンツに追加
-        if comment.get("menu") and not pd.isna(comment["menu"]) and comment["menu"].strip() and comment["menu"] != "nan":
-            menu_text = f"\n\n【好きだったメニュー】\n{comment['menu']}"
-            comment["content"] = comment["content"] + menu_text
-        
-        # コメントが空でない場合のみ追加
-        if not pd.isna(comment["content"]) and comment["content"].strip() and comment["content"] != "nan":
-            comments.append(comment)
+    print(f"\n👀 変更を監視中: templates/, content/, config.json, static/css/, raw_images/")
+    print(f"   URL: http://localhost:{args.port}")
+    print("   終了するには Ctrl+C を押してください")
     
-    # 新しい順にソート（Timestampがある場合）
-    # 日付でソート（新しい順）。パースできない場合はそのまま。
+    snapshot = snapshot_watch_targets()
     try:
-        comments.sort(key=lambda x: (x.get("_ts_dt") or pd.Timestamp.min), reverse=True)
-    except Exception:
-        pass
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            current = snapshot_watch_targets()
+            if current == snapshot:
+                continue
+            # 保存途中のファイルを読まないよう、変更が落ち着くまで待つ
+            while True:
+                time.sleep(WATCH_INTERVAL)
+                settled = snapshot_watch_targets()
+                if settled == current:
+                    break
+                current = settled
+            areas = changed_watch_areas(snapshot, current)
+            snapshot = current
+            
+            print(f"\n🔄 変更を検出: {', '.join(sorted(areas))}")
+            started = time.perf_counter()
+            try:
+                steps = rebuild_changed(session, areas)
+            except Exception as e:
+                print(f"⚠️ 再ビルドに失敗: {e}")
+                continue
+            notify_live_reload()
+            print(f"✓ 再ビルド完了: {', '.join(steps) or '出力の変更なし'}（{time.perf_counter() - started:.2f}s）")
+    except KeyboardInterrupt:
+        print("\n👋 監視を終了しました")
+    finally:
+        server.shutdown()
+        server.server_close()
 
-    # ソート用の一時キーを削除
-    for c in comments:
-        c.pop("_ts_dt", None)
-    
-    return comments
 
+# =============================================================================
+# メイン処理
+# =============================================================================
 
-def generate_html(comments: list, images: list, about_html: str, config: dict, store_history: list = None, menu_stats: dict = None):
+def run_build(args: argparse.Namespace) -> dict:
     """
-    Jinja2テンプレートを使用してHTMLを生成します。
+    ビルドの各ステージを依存関係の順に実行します。
+    
+    各ステージの入力（CSV、config.json、about.md、テンプレート、CSS、画像など）の
+    フィンガープリントを data/.build_state.json に記録し、前回から入力が変わっていない
+    ステージはスキップして data/.stage_cache/ に保存した結果を再利用します。
+    
+    ステージと入力:
+      - fetch:         Google スプレッドシート（条件付き取得）
+      - download:      CSVデータ
+      - images:        raw_images/、エンコード設定、static/images/（結果にバリアント情報を含む）
+      - markdown:      content/about.md
+      - store_history: markdown の結果
+      - comments:      CSVデータ
+      - menu_stats:    CSVデータ
+      - html:          config.json、templates/、comments、images、store_history、menu_stats
+      - static:        static/css/、static/images/
+      - minify:        public/ の HTML / CSS、static/css/（--minify 指定時のみ）
+      - compress:      public/ のテキストファイル（更新日時で .gz / .br の再生成を判定）
+    
+    すべてのステージに build.py 自体のハッシュが入力として含まれるため、
+    スクリプトを更新した場合はすべて再実行されます。
+    
+    各ステージの経過時間・CPU時間・処理件数は data/.build_trace.json に保存されます。
+    --profile を指定した場合は、ステージごとの cProfile の結果も data/.profile/ に保存されます。
     
     Args:
-        comments: コメントの辞書リスト
-        images: 画像ファイル名のリスト
-        about_html: 「店主について」のHTML
-        config: 設定情報の辞書
-        store_history: 店舗変遷データのリスト
-        menu_stats: メニュー集計結果の辞書（メニュー名: 出現回数）
+        args: コマンドライン引数
+    
+    Returns:
+        dict: ステージ名をキーとした (実行したか, 理由) の辞書
     """
-    print(f"\n📝 HTMLを生成中...")
+    build_started = time.perf_counter()
+    print("=" * 60)
+    print("🍜 メモリアルサイト ビルドスクリプト")
+    print("=" * 60)
     
-    # Jinja2環境を設定
-    env = Environment(
-        loader=FileSystemLoader(TEMPLATES_DIR),
-        autoescape=True
-    )
+    # 1. ディレクトリ構成を確認
+    ensure_directories()
     
-    # テンプレートを読み込み
-    template = env.get_template("index.html")
+    # 2. 設定ファイルを読み込み
+    config = load_config()
     
-    # テンプレートに渡すデータ
-    context = {
-        "site_title": config.get("site", {}).get("title", "想い出のラーメン - メモリアルサイト"),
-        "site_description": config.get("site", {}).get("description", "故人を偲ぶメモリアルサイト"),
-        "shop_name": config.get("site", {}).get("shop_name", "想い出のラーメン"),
-        "hero": config.get("hero", {}),
-        "navigation": config.get("navigation", {}),
-        "sections": config.get("sections", {}),
-        "footer": config.get("footer", {}),
-        "ui": config.get("ui", {}),
-        "config": config,
-        "comments": comments,
-        "images": images,
-        "about_html": about_html,
-        "store_history": store_history or [],
-        "menu_stats": menu_stats or {},
-        "generated_at": datetime.now().strftime("%Y年%m月%d日 %H:%M"),
-        "comment_count": len(comments),
-        "image_count": len(images),
+    build_state = load_build_state()
+    code_fp = compute_file_hash(Path(__file__).resolve())
+    report = {}
+    profile = getattr(args, "profile", False)
+    trace = {"started_at": datetime.now().isoformat(), "profile": profile, "stages": {}}
+    if profile:
+        # 前回のプロファイル結果と混ざらないように削除
+        import shutil
+        shutil.rmtree(PROFILE_DIR, ignore_errors=True)
+    results = {}
+    df = None
+    # ネットワーク予算はビルドごとに数え直す（使い切った後はキャッシュを使用）
+    reset_network_state(getattr(args, "network_budget", NETWORK_BUDGET_SECONDS))
+    
+    def cached_result(stage: str):
+        # スキップしたステージの結果を必要になった時点で読み込む
+        if stage not in results:
+            results[stage] = load_stage_result(stage)
+        return results[stage]
+    
+    def stage_fresh(stage: str, inputs: dict, outputs: list = (), cached: bool = False, force: bool = False) -> bool:
+        if args.force or force:
+            fresh, reason = False, "強制実行の指定あり"
+        else:
+            fresh, reason = check_stage(build_state, stage, inputs, outputs)
+        if fresh and cached and cached_result(stage) is None:
+            fresh, reason = False, "結果キャッシュなし"
+        report[stage] = (not fresh, reason)
+        return fresh
+    
+    engine = getattr(args, "engine", INGEST_ENGINE)
+    stream_ingest = getattr(args, "stream_ingest", False)
+    
+    def get_df():
+        nonlocal df
+        if df is None:
+            df = load_local_csv(engine)
+            print(f"\n📂 ローカルキャッシュを使用: {len(df)} 件")
+        return df
+    
+    # 3. CSVデータを取得（またはローカルキャッシュを使用）
+    with trace_stage(trace, "fetch", profile) as counters:
+        if args.skip_fetch:
+            report["fetch"] = (False, "--skip-fetch 指定")
+            data_source = "local"
+        else:
+            # CSV URLが設定されているか確認
+            if not args.csv_url:
+                print("\n⚠️ エラー: CSV URLが設定されていません")
+                print("   以下のいずれかの方法で設定してください:")
+                print("   1. 環境変数: export CSV_URL='https://docs.google.com/...'")
+                print("   2. コマンドライン: python build.py --csv-url 'https://docs.google.com/...'")
+                print("   3. ローカルキャッシュを使用: python build.py --skip-fetch")
+                sys.exit(1)
+            
+            # コメントと写真投稿の両方のCSVを取得してマージ（変更がなければキャッシュを使用）
+            fetch_state = load_fetch_state()
+            if stream_ingest:
+                # merged.csv に書き出すだけで、DataFrame は必要になったステージで読み込む
+                rows = fetch_and_merge_csv_stream(args.csv_url, args.photo_url, fetch_state)
+                if rows >= 0:
+                    counters["rows"] = rows
+            else:
+                df = fetch_and_merge_csv_data(args.csv_url, args.photo_url, fetch_state)
+                counters["rows"] = len(df)
+            save_fetch_state(fetch_state)
+            changed = any(entry.get("changed") for entry in fetch_state.values())
+            report["fetch"] = (changed, "CSVに変更あり" if changed else "CSVに変更なし（条件付き取得）")
+            data_source = "fetch+photos" if args.photo_url and args.photo_url.strip() else "fetch"
+            if stream_ingest:
+                data_source += "+stream"
+        
+        data_fp = combine_fingerprints({
+            "source": data_source,
+            "csv": fingerprint_files([DATA_DIR / name for name in ("comments.csv", "photos.csv", "merged.csv")]),
+        })
+    
+    # 4. CSV内の画像をダウンロード（オプション）
+    dedupe_similar = getattr(args, "dedupe_similar", False)
+    download_inputs = {"code": code_fp, "data": data_fp, "similar": dedupe_similar}
+    with trace_stage(trace, "download", profile):
+        if args.skip_download:
+            report["download"] = (False, "--skip-download 指定")
+        elif not stage_fresh("download", download_inputs):
+            # ダウンロードは pandas の DataFrame で行う（csv エンジンの場合は変換）
+            source = get_df()
+            if isinstance(source, list):
+                source = pd.DataFrame(source)
+            download_images_from_csv(
+                source, workers=args.download_workers, max_bytes=args.max_download_mb * 1024 * 1024, similar=dedupe_similar,
+            )
+    
+    # 5. 画像を処理
+    def images_inputs() -> dict:
+        return {
+            "code": code_fp,
+            "settings": image_settings_key(),
+            "raw_images": fingerprint_tree_stat(RAW_IMAGES_DIR),
+            "static_images": fingerprint_tree_stat(OUTPUT_IMAGES_DIR),
+        }
+    
+    with trace_stage(trace, "images", profile):
+        if stage_fresh("images", images_inputs(), cached=True, force=args.force_images):
+            images, image_variants = cached_result("images")
+        else:
+            images = process_images(force=args.force_images, workers=args.image_workers)
+            image_variants = image_variant_manifest(load_image_manifest())
+            save_stage_result("images", [images, image_variants])
+            # 出力先も入力に含むため、処理後の状態を記録する
+            record_stage(build_state, "images", images_inputs())
+    
+    # 6. Markdownコンテンツを読み込み
+    markdown_inputs = {"code": code_fp, "about": fingerprint_files([CONTENT_DIR / "about.md"])}
+    with trace_stage(trace, "markdown", profile):
+        if stage_fresh("markdown", markdown_inputs, cached=True):
+            about_html = cached_result("markdown")
+        else:
+            about_html = load_markdown_content("about.md")
+            save_stage_result("markdown", about_html)
+            record_stage(build_state, "markdown", markdown_inputs)
+    
+    # 7. 店舗変遷を抽出
+    store_history_inputs = {"code": code_fp, "markdown": combine_fingerprints(markdown_inputs)}
+    with trace_stage(trace, "store_history", profile):
+        if stage_fresh("store_history", store_history_inputs, cached=True):
+            about_html, store_history = cached_result("store_history")
+        else:
+            about_html, store_history = extract_store_history(about_html)
+            save_stage_result("store_history", [about_html, store_history])
+            record_stage(build_state, "store_history", store_history_inputs)
+    
+    # 8. コメントデータを準備
+    comments_inputs = {"code": code_fp, "data": data_fp, "engine": engine, "photos": combine_fingerprints(load_photo_map())}
+    with trace_stage(trace, "comments", profile) as counters:
+        if stage_fresh("comments", comments_inputs, cached=True):
+            comments = cached_result("comments")
+        else:
+            comments = prepare_comments_data(get_df(), load_photo_map())
+            save_stage_result("comments", comments)
+            record_stage(build_state, "comments", comments_inputs)
+            counters["rows"] = len(get_df())
+        counters["comments"] = len(comments)
+    
+    # 8-1. メニュー集計
+    menu_stats_inputs = {
+        "code": code_fp, "data": data_fp, "engine": engine,
+        "aliases": combine_fingerprints(config.get("menu", {}).get("aliases", {})),
     }
+    with trace_stage(trace, "menu_stats", profile) as counters:
+        if stage_fresh("menu_stats", menu_stats_inputs, cached=True):
+            menu_stats = cached_result("menu_stats")
+        else:
+            menu_aliases = compile_menu_aliases(config.get("menu", {}).get("aliases", {}))
+            # 前回までに分割した行は分割結果を再利用し、新しい行だけを分割する
+            token_version = menu_token_version(menu_aliases)
+            token_cache = load_menu_token_cache(token_version)
+            known_tokens = set(token_cache)
+            menu_stats = aggregate_menu_items(get_df(), menu_aliases, token_cache)
+            save_menu_token_cache(token_cache, known_tokens, token_version)
+            save_stage_result("menu_stats", menu_stats)
+            record_stage(build_state, "menu_stats", menu_stats_inputs)
+            counters["rows"] = len(get_df())
+        counters["menus"] = len(menu_stats)
     
-    # HTMLを生成
-    html_output = template.render(**context)
+    # 8-2. 検索インデックスを作成
+    search_inputs = {"code": code_fp, "comments": combine_fingerprints(comments_inputs)}
+    with trace_stage(trace, "search", profile) as counters:
+        if not stage_fresh("search", search_inputs, [PUBLIC_DIR / "search" / "meta.json"]):
+            stats = write_search_index(comments)
+            counters.update({"tokens": stats["tokens"], "bytes_written": stats["bytes"]})
+            record_stage(build_state, "search", search_inputs)
     
-    # index.html を public/ に出力
-    output_path = PUBLIC_DIR / "index.html"
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(html_output)
-    print(f"✓ HTMLを出力: {output_path}")
+    # 前回 --minify でビルドしていて今回は指定がない場合、最適化前の出力に戻す
+    minify = getattr(args, "minify", False)
+    if not minify and build_state.get("stages", {}).pop("minify", None):
+        for stage in ("html", "static"):
+            build_state["stages"].pop(stage, None)
     
-    # static/ ディレクトリを public/ にコピー
-    copy_static_files()
-
-
-def copy_static_files():
-    """
-    static/ ディレクトリの内容を public/ にコピーします。
-    """
-    import shutil
+    # 9. HTMLを生成
+    html_inputs = {
+        "code": code_fp,
+        "config": fingerprint_files([CONFIG_FILE]),
+        "templates": fingerprint_tree(TEMPLATES_DIR),
+        "comments": combine_fingerprints(comments_inputs),
+        "images": build_state.get("stages", {}).get("images", {}).get("fingerprint", ""),
+        "store_history": combine_fingerprints(store_history_inputs),
+        "menu_stats": combine_fingerprints(menu_stats_inputs),
+    }
+    html_outputs = [PUBLIC_DIR / "index.html"]
+    initial_items, _ = timeline_settings(config)
+    if initial_items and len(comments) > initial_items:
+        html_outputs.append(PUBLIC_DIR / "timeline" / "page-1.html")
+    with trace_stage(trace, "html", profile):
+        if not stage_fresh("html", html_inputs, html_outputs):
+            generate_html(comments, images, about_html, config, store_history, menu_stats, copy_static=False, image_variants=image_variants)
+            record_stage(build_state, "html", html_inputs)
+    
+    # 9-1. static/ を public/ にコピー
+    with trace_stage(trace, "static", profile):
+        static_inputs = {
+            "code": code_fp,
+            "css": fingerprint_tree(STATIC_DIR / "css", "*.css"),
+            "static_images": fingerprint_tree_stat(OUTPUT_IMAGES_DIR),
+        }
+        if not stage_fresh("static", static_inputs, [PUBLIC_DIR / "static" / "css", PUBLIC_DIR / "static" / "images"]):
+            copy_static_files()
+            record_stage(build_state, "static", static_inputs)
+    
+    # 9-2. HTML / CSS の最適化（--minify 指定時のみ）
+    def minify_inputs() -> dict:
+        html_files, css_files = minify_targets()
+        return {
+            "code": code_fp,
+            "public": fingerprint_files(html_files + css_files),
+            "css": fingerprint_tree(STATIC_DIR / "css", "*.css"),
+            "js": fingerprint_tree(PUBLIC_DIR / "static" / "js", "*.js"),
+        }
+    
+    with trace_stage(trace, "minify", profile) as counters:
+        if not minify:
+            report["minify"] = (False, "--minify 未指定")
+        elif not stage_fresh("minify", minify_inputs()):
+            results = optimize_public_files()
+            counters["files_minified"] = len(results)
+            counters["bytes_saved"] = sum(before - after for before, after in results.values())
+            # 出力を入力に含むため、処理後の状態を記録する
+            record_stage(build_state, "minify", minify_inputs())
+    
+    # 9-3. public/ のテキストファイルを事前圧縮
+    with trace_stage(trace, "compress", profile) as counters:
+        if getattr(args, "no_compress", False):
+            report["compress"] = (False, "--no-compress 指定")
+        else:
+            stats = compress_public_files()
+            counters.update({
+                "files_compressed": stats["compressed"],
+                "files_skipped": stats["skipped"],
+                "files_removed": stats["removed"],
+                "bytes_written": stats["bytes"],
+            })
+            ran = bool(stats["compressed"] or stats["removed"])
+            report["compress"] = (ran, f"{stats['compressed']} 件を圧縮" if ran else "圧縮済み")
+    
+    # 10. 写真が揃っていれば download ステージを完了として記録
+    # 揃っていない場合は、次回もダウンロードを再試行できるよう記録しない
+    if report.get("download", (False, ""))[0]:
+        missing_photos = [
+            c["photo_filename"] for c in comments
+            if c["photo_filename"] and not (OUTPUT_IMAGES_DIR / c["photo_filename"]).exists()
+        ]
+        if missing_photos:
+            build_state.get("stages", {}).pop("download", None)
+            print(f"\n⚠️ 未取得の写真が {len(missing_photos)} 件あるため、次回もダウンロードを再試行します")
+        else:
+            record_stage(build_state, "download", download_inputs)
     
-    # CSS をコピー
-    css_src = STATIC_DIR / "css"
-    css_dst = PUBLIC_DIR / "static" / "css"
-    if css_src.exists():
-        css_dst.mkdir(parents=True, exist_ok=True)
-        for css_file in css_src.glob("*.css"):
-            shutil.copy2(css_file, css_dst / css_file.name)
-            print(f"✓ CSSをコピー: {css_file.name}")
-    
-    # 画像をコピー
-    img_src = OUTPUT_IMAGES_DIR
-    img_dst = PUBLIC_DIR / "static" / "images"
-    if img_src.exists():
-        img_dst.mkdir(parents=True, exist_ok=True)
-        for img_file in img_src.iterdir():
-            if img_file.is_file():
-                shutil.copy2(img_file, img_dst / img_file.name)
-        print(f"✓ 画像をコピー: {len(list(img_src.iterdir()))} ファイル")
+    build_state["built_at"] = datetime.now().isoformat()
+    save_build_state(build_state)
+    
+    # 計測結果を保存
+    trace["total_wall_s"] = round(time.perf_counter() - build_started, 4)
+    for stage, (ran, reason) in report.items():
+        trace["stages"][stage].update({"ran": ran, "reason": reason})
+    save_trace(trace)
+    
+    # ステージごとの実行結果
+    print("\n📋 ステージ実行結果:")
+    for stage, (ran, reason) in report.items():
+        mark = "▶ 実行  " if ran else "⊙ スキップ"
+        print(f"  {mark} {stage:<14} {trace['stages'][stage]['wall_s']:7.2f}s  {reason}")
+    print(f"  ⏱ 合計 {trace['total_wall_s']:.2f}s（詳細: {TRACE_FILE.name}）")
+    if profile:
+        print(f"  🔍 プロファイル: {PROFILE_DIR}/<ステージ名>.pstats（python -m pstats で表示できます）")
+    
+    print("\n" + "=" * 60)
+    if not any(ran for ran, _ in report.values()):
+        print("⊙ 前回のビルドから入力に変更がないため、すべてのステージをスキップしました")
+        print("   強制的にビルドする場合は --force を指定してください")
+    else:
+        print("✨ ビルド完了!")
+    print(f"   コメント: {len(comments)} 件")
+    print(f"   画像: {len(images)} 件")
+    print(f"   出力先: {PUBLIC_DIR}")
+    print("=" * 60)
+    
+    return report
 
 
-# =============================================================================
-# メイン処理
-# =============================================================================
 
 def main():
     """
@@ -908,63 +4890,88 @@ def main():
         action="store_true",
         help="画像のダウンロードをスキップ"
     )
+    parser.add_argument(
+        "--force-images",
+        action="store_true",
+        help="画像マニフェストを無視してすべての画像を再エンコード"
+    )
+    parser.add_argument(
+        "--image-workers",
+        type=int,
+        default=IMAGE_WORKERS,
+        help="画像エンコードに使うプロセス数（0 で CPU コア数）"
+    )
+    parser.add_argument(
+        "--download-workers",
+        type=int,
+        default=DOWNLOAD_WORKERS,
+        help="画像の同時ダウンロード数"
+    )
+    parser.add_argument(
+        "--dedupe-similar",
+        action="store_true",
+        help="縮小・再圧縮された同じ写真（dHash が近い写真）も1枚にまとめる"
+    )
+    parser.add_argument(
+        "--max-download-mb",
+        type=int,
+        default=MAX_DOWNLOAD_MB,
+        help="1ファイルあたりの最大ダウンロードサイズ（MB）"
+    )
+    parser.add_argument(
+        "--network-budget",
+        type=float,
+        default=NETWORK_BUDGET_SECONDS,
+        help="ビルド全体でネットワークに使える時間（秒、0 で無制限。使い切るとキャッシュを使用）"
+    )
+    parser.add_argument(
+        "--stream-ingest",
+        action="store_true",
+        help="CSVを少しずつ保存・正規化してタイムスタンプ順にマージ（大きなスプレッドシート向け）"
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["pandas", "csv"],
+        default=INGEST_ENGINE,
+        help="--skip-fetch 時のCSVの読み込み方法（csv は pandas を使わずに標準ライブラリで処理）"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="入力に変更がなくてもすべての処理を実行"
+    )
+    parser.add_argument(
+        "--minify",
+        action="store_true",
+        help="HTML / インラインスクリプトを圧縮し、CSS から使われていないセレクタを削除"
+    )
+    parser.add_argument(
+        "--no-compress",
+        action="store_true",
+        help="public/ の .gz / .br を出力しない"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="ステージごとに cProfile の結果を data/.profile/ に保存"
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="ビルド後に入力の変更を監視して再ビルドし、public/ をライブリロード付きで配信"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=WATCH_PORT,
+        help="--watch のプレビューサーバーのポート"
+    )
     args = parser.parse_args()
     
-    print("=" * 60)
-    print("🍜 メモリアルサイト ビルドスクリプト")
-    print("=" * 60)
-    
-    # 1. ディレクトリ構成を確認
-    ensure_directories()
-    
-    # 2. 設定ファイルを読み込み
-    config = load_config()
-    
-    # 3. CSVデータを取得（またはローカルキャッシュを使用）
-    if args.skip_fetch:
-        df = load_local_csv()
-        print(f"\n📂 ローカルキャッシュを使用: {len(df)} 件")
+    if args.watch:
+        watch(args)
     else:
-        # CSV URLが設定されているか確認
-        if not args.csv_url:
-            print("\n⚠️ エラー: CSV URLが設定されていません")
-            print("   以下のいずれかの方法で設定してください:")
-            print("   1. 環境変数: export CSV_URL='https://docs.google.com/...'")
-            print("   2. コマンドライン: python build.py --csv-url 'https://docs.google.com/...'")
-            print("   3. ローカルキャッシュを使用: python build.py --skip-fetch")
-            sys.exit(1)
-        
-        # コメントと写真投稿の両方のCSVを取得してマージ
-        df = fetch_and_merge_csv_data(args.csv_url, args.photo_url)
-    
-    # 4. CSV内の画像をダウンロード（オプション）
-    if not args.skip_download:
-        download_images_from_csv(df)
-    
-    # 5. 画像を処理
-    images = process_images()
-    
-    # 6. Markdownコンテンツを読み込み
-    about_html = load_markdown_content("about.md")
-    
-    # 7. 店舗変遷を抽出
-    about_html, store_history = extract_store_history(about_html)
-    
-    # 8. コメントデータを準備
-    comments = prepare_comments_data(df)
-    
-    # 8-1. メニュー集計
-    menu_stats = aggregate_menu_items(df)
-    
-    # 9. HTMLを生成
-    generate_html(comments, images, about_html, config, store_history, menu_stats)
-    
-    print("\n" + "=" * 60)
-    print("✨ ビルド完了!")
-    print(f"   コメント: {len(comments)} 件")
-    print(f"   画像: {len(images)} 件")
-    print(f"   出力先: {PUBLIC_DIR}")
-    print("=" * 60)
+        run_build(args)
 
 
 if __name__ == "__main__":
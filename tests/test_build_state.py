@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_build_state.py - ビルド状態（ステージ単位のキャッシュ）のユニットテスト
+
+ステージの入力フィンガープリントによるスキップ判定をテストします。
+- 入力が変わっていないステージのスキップ
+- 変更された入力名の報告
+- 出力ファイルが消えた場合の再実行
+- ステージごとの計測（時間・カウンター・プロファイル）
+"""
+
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+# プロジェクトルートをパスに追加
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import build
+
+
+class TestBuildState(unittest.TestCase):
+    """ビルド状態のテストクラス"""
+
+    def setUp(self):
+        """一時ディレクトリをプロジェクトルートとして使用"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.patches = [
+            mock.patch.object(build, "BASE_DIR", self.root),
+            mock.patch.object(build, "STAGE_CACHE_DIR", self.root / ".stage_cache"),
+            mock.patch.object(build, "PROFILE_DIR", self.root / ".profile"),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def test_first_run_is_not_fresh(self):
+        """記録がないステージは実行対象になることを確認"""
+        fresh, reason = build.check_stage({}, "html", {"config": "a"})
+
+        self.assertFalse(fresh)
+        self.assertEqual(reason, "前回の記録なし")
+
+    def test_unchanged_inputs_are_fresh(self):
+        """入力が同じならスキップできることを確認"""
+        state = {}
+        build.record_stage(state, "html", {"config": "a", "templates": "b"})
+
+        fresh, _ = build.check_stage(state, "html", {"config": "a", "templates": "b"})
+
+        self.assertTrue(fresh)
+
+    def test_changed_inputs_are_reported(self):
+        """変更された入力名が理由に含まれることを確認"""
+        state = {}
+        build.record_stage(state, "html", {"config": "a", "templates": "b"})
+
+        fresh, reason = build.check_stage(state, "html", {"config": "a", "templates": "c", "comments": "d"})
+
+        self.assertFalse(fresh)
+        self.assertEqual(reason, "入力が変更: comments, templates")
+
+    def test_missing_output_is_not_fresh(self):
+        """出力ファイルが消えていたら再実行されることを確認"""
+        state = {}
+        build.record_stage(state, "html", {"config": "a"})
+
+        fresh, reason = build.check_stage(state, "html", {"config": "a"}, [self.root / "public" / "index.html"])
+
+        self.assertFalse(fresh)
+        self.assertIn("public/index.html", reason)
+
+    def test_fingerprint_tracks_file_content(self):
+        """ファイル内容が変わるとフィンガープリントが変わることを確認"""
+        path = self.root / "config.json"
+        path.write_text("{}", encoding="utf-8")
+        before = build.fingerprint_files([path])
+
+        path.write_text('{"site": {}}', encoding="utf-8")
+
+        self.assertNotEqual(build.fingerprint_files([path]), before)
+
+    def test_stage_result_round_trip(self):
+        """ステージ結果のキャッシュを保存・読み込みできることを確認"""
+        menu_stats = {"焦がしガーリック": 6, "塩ラーメン": 3}
+        build.save_stage_result("menu_stats", menu_stats)
+
+        loaded = build.load_stage_result("menu_stats")
+
+        self.assertEqual(list(loaded.items()), list(menu_stats.items()))
+        self.assertIsNone(build.load_stage_result("comments"))
+
+    def test_trace_stage_records_counters(self):
+        """計測中のステージに count_stage() の値が記録されることを確認"""
+        trace = {}
+        with build.trace_stage(trace, "images") as counters:
+            build.count_stage("images_encoded")
+            build.count_stage("images_encoded")
+            build.count_stage("bytes_written", 1024)
+            counters["rows"] = 3
+
+        entry = trace["stages"]["images"]
+        self.assertEqual(entry["counters"], {"images_encoded": 2, "bytes_written": 1024, "rows": 3})
+        self.assertGreaterEqual(entry["wall_s"], 0)
+        self.assertIn("cpu_s", entry)
+        self.assertNotIn("profile", entry)
+
+    def test_count_outside_stage_is_ignored(self):
+        """計測中でなければ count_stage() は何もしないことを確認"""
+        trace = {}
+        with build.trace_stage(trace, "html"):
+            pass
+        build.count_stage("bytes_written", 100)
+
+        self.assertEqual(trace["stages"]["html"]["counters"], {})
+
+    def test_trace_stage_profile(self):
+        """profile=True の場合に pstats ファイルが保存されることを確認"""
+        import pstats
+
+        trace = {}
+        with build.trace_stage(trace, "menu_stats", profile=True):
+            sorted(range(1000), reverse=True)
+
+        path = self.root / ".profile" / "menu_stats.pstats"
+        self.assertTrue(path.exists())
+        self.assertGreater(pstats.Stats(str(path)).total_calls, 0)
+        self.assertTrue(trace["stages"]["menu_stats"]["profile"].endswith("menu_stats.pstats"))
+
+
+if __name__ == "__main__":
+    # テストを実行
+    unittest.main(verbosity=2)
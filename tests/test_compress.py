@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_compress.py - 事前圧縮のユニットテスト
+
+public/ のテキストファイルの .gz / .br 出力をテストします。
+- 圧縮ファイルの内容と再現性
+- 圧縮済みファイルのスキップと、変更されたファイルの再圧縮
+- 元ファイルがなくなった圧縮ファイルの削除
+- 圧縮効果のなかったファイルの記録とスキップ
+"""
+
+import gzip
+import os
+import unittest
+import sys
+import tempfile
+import zlib
+from pathlib import Path
+from unittest import mock
+
+# プロジェクトルートをパスに追加
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import build
+
+HTML = ("<!DOCTYPE html><html><body>" + "<p>想い出</p>" * 200 + "</body></html>").encode("utf-8")
+
+
+class FakeBrotli:
+    """brotli モジュールの代わり（compress だけを持つ）"""
+
+    @staticmethod
+    def compress(data, quality=11):
+        return b"BR" + zlib.compress(data)
+
+
+class TestCompressPublicFiles(unittest.TestCase):
+    """事前圧縮のテストクラス"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.public_dir = Path(self.tmp.name)
+        self.patches = [
+            mock.patch.object(build, "PUBLIC_DIR", self.public_dir),
+            mock.patch.object(build, "STATE_DB_FILE", Path(self.tmp.name) / "data" / ".state.db"),
+        ]
+        for p in self.patches:
+            p.start()
+        self.index = self.public_dir / "index.html"
+        self.index.write_bytes(HTML)
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def test_gzip_sibling_is_written(self):
+        """.gz が出力され、展開すると元の内容になることを確認"""
+        stats = build.compress_public_files()
+
+        gz = self.public_dir / "index.html.gz"
+        self.assertEqual(stats["compressed"], 1)
+        self.assertEqual(gzip.decompress(gz.read_bytes()), HTML)
+        self.assertEqual(gz.stat().st_mtime_ns, self.index.stat().st_mtime_ns)
+
+    def test_output_is_deterministic(self):
+        """同じ入力からは同じ .gz が出力されることを確認"""
+        build.compress_public_files()
+        first = (self.public_dir / "index.html.gz").read_bytes()
+        (self.public_dir / "index.html.gz").unlink()
+
+        build.compress_public_files()
+
+        self.assertEqual((self.public_dir / "index.html.gz").read_bytes(), first)
+
+    def test_current_files_are_skipped(self):
+        """圧縮済みのファイルはスキップされ、変更されたファイルは再圧縮されることを確認"""
+        build.compress_public_files()
+        self.assertEqual(build.compress_public_files()["skipped"], 1)
+
+        self.index.write_bytes(HTML + b"<!-- updated -->")
+        os.utime(self.index, ns=(0, self.index.stat().st_mtime_ns + 10**9))
+        stats = build.compress_public_files()
+
+        self.assertEqual(stats["compressed"], 1)
+        self.assertTrue(gzip.decompress((self.public_dir / "index.html.gz").read_bytes()).endswith(b"updated -->"))
+
+    def test_orphaned_siblings_are_removed(self):
+        """元ファイルがなくなった .gz は削除されることを確認"""
+        page = self.public_dir / "timeline" / "page-1.html"
+        page.parent.mkdir()
+        page.write_bytes(HTML)
+        build.compress_public_files()
+
+        page.unlink()
+        stats = build.compress_public_files()
+
+        self.assertEqual(stats["removed"], 1)
+        self.assertFalse((self.public_dir / "timeline" / "page-1.html.gz").exists())
+
+    def test_small_and_binary_files_are_ignored(self):
+        """小さいファイルと画像は圧縮しないことを確認"""
+        (self.public_dir / "small.css").write_text("body{}", encoding="utf-8")
+        (self.public_dir / "photo.webp").write_bytes(b"RIFF" + b"\x00" * 1000)
+
+        build.compress_public_files()
+
+        self.assertFalse((self.public_dir / "small.css.gz").exists())
+        self.assertFalse((self.public_dir / "photo.webp.gz").exists())
+
+    def test_no_gain_files_are_skipped_next_time(self):
+        """圧縮しても小さくならなかったファイルは記録され、変わるまで再圧縮されないことを確認"""
+        noise = (self.public_dir / "noise.js")
+        noise.write_bytes(os.urandom(2048))
+
+        build.compress_public_files()
+        self.assertFalse((self.public_dir / "noise.js.gz").exists())
+
+        with mock.patch.object(build, "compress_file", wraps=build.compress_file) as compress:
+            stats = build.compress_public_files()
+
+        compress.assert_not_called()
+        self.assertEqual(stats["skipped"], 2)
+
+        noise.write_bytes(os.urandom(4096))
+        self.assertEqual(build.compress_public_files()["compressed"], 1)
+
+    def test_brotli_sibling(self):
+        """brotli が使える場合は .br も出力されることを確認"""
+        result = build.compress_file(self.index, FakeBrotli)
+
+        br = self.public_dir / "index.html.br"
+        self.assertEqual(result["br"], br.stat().st_size)
+        self.assertEqual(zlib.decompress(br.read_bytes()[2:]), HTML)
+
+
+if __name__ == "__main__":
+    # テストを実行
+    unittest.main(verbosity=2)
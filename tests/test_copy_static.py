@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_copy_static.py - 静的ファイル同期のユニットテスト
+
+static/ → public/static/ の差分同期をテストします。
+- 変更のないファイルのスキップ
+- 変更されたファイルの置き換え
+- 削除されたファイルの public/ からの削除
+- コピーモードとリンクモード
+"""
+
+import os
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+# プロジェクトルートをパスに追加
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import build
+
+
+class TestSyncDirectory(unittest.TestCase):
+    """差分同期のテストクラス"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.src = root / "static" / "images"
+        self.dst = root / "public" / "static" / "images"
+        self.src.mkdir(parents=True)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, data):
+        path = self.src / name
+        path.write_bytes(data)
+        return path
+
+    def test_first_sync_places_all_files(self):
+        """初回はすべてのファイルが配置されることを確認"""
+        self.write("a.webp", b"aaa")
+        self.write("b.webp", b"bbbb")
+
+        stats = build.sync_directory(self.src, self.dst)
+
+        self.assertEqual(stats["copied"] + stats["linked"], 2)
+        self.assertEqual((self.dst / "b.webp").read_bytes(), b"bbbb")
+        self.assertEqual(sorted(p.name for p in self.dst.iterdir()), ["a.webp", "b.webp"])
+
+    def test_unchanged_files_are_skipped(self):
+        """2回目は変更のないファイルをスキップすることを確認"""
+        self.write("a.webp", b"aaa")
+        build.sync_directory(self.src, self.dst, mode="copy")
+
+        stats = build.sync_directory(self.src, self.dst, mode="copy")
+
+        self.assertEqual(stats, {"copied": 0, "linked": 0, "skipped": 1, "removed": 0, "bytes": 0})
+
+    def test_changed_file_is_replaced(self):
+        """内容が変わったファイルは置き換えられることを確認"""
+        path = self.write("a.webp", b"aaa")
+        build.sync_directory(self.src, self.dst, mode="copy")
+
+        path.write_bytes(b"xyz")
+        os.utime(path, ns=(0, path.stat().st_mtime_ns + 10**9))
+        stats = build.sync_directory(self.src, self.dst, mode="copy")
+
+        self.assertEqual(stats["copied"], 1)
+        self.assertEqual((self.dst / "a.webp").read_bytes(), b"xyz")
+
+    def test_same_content_with_new_mtime_is_skipped(self):
+        """更新日時だけが変わった場合はハッシュ比較でスキップされることを確認"""
+        path = self.write("a.webp", b"aaa")
+        build.sync_directory(self.src, self.dst, mode="copy")
+        os.utime(path, ns=(0, path.stat().st_mtime_ns + 10**9))
+
+        stats = build.sync_directory(self.src, self.dst, mode="copy")
+
+        self.assertEqual(stats["skipped"], 1)
+        self.assertEqual((self.dst / "a.webp").stat().st_mtime_ns, path.stat().st_mtime_ns)
+
+    def test_removed_source_is_pruned(self):
+        """static/ から削除されたファイルが public/ からも削除されることを確認"""
+        self.write("a.webp", b"aaa")
+        path = self.write("b.webp", b"bbb")
+        build.sync_directory(self.src, self.dst)
+
+        path.unlink()
+        stats = build.sync_directory(self.src, self.dst)
+
+        self.assertEqual(stats["removed"], 1)
+        self.assertFalse((self.dst / "b.webp").exists())
+
+    def test_copy_mode_does_not_share_files(self):
+        """コピーモードでは同期元と別のファイルになることを確認"""
+        path = self.write("a.webp", b"aaa")
+
+        build.sync_directory(self.src, self.dst, mode="copy")
+
+        self.assertNotEqual(path.stat().st_ino, (self.dst / "a.webp").stat().st_ino)
+
+    def test_falls_back_to_copy_when_link_fails(self):
+        """reflink もハードリンクも使えない場合はコピーされることを確認"""
+        self.write("a.webp", b"aaa")
+
+        with mock.patch.object(build, "clone_file", return_value=False), \
+             mock.patch.object(build.os, "link", side_effect=OSError("cross-device link")):
+            stats = build.sync_directory(self.src, self.dst, mode="auto")
+
+        self.assertEqual(stats["copied"], 1)
+        self.assertEqual((self.dst / "a.webp").read_bytes(), b"aaa")
+        self.assertEqual([p.name for p in self.dst.iterdir()], ["a.webp"])
+
+
+if __name__ == "__main__":
+    # テストを実行
+    unittest.main(verbosity=2)
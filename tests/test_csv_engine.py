@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_csv_engine.py - csv エンジン（pandas を使わない読み込み）のユニットテスト
+
+--engine csv で使う標準ライブラリ版の処理をテストします。
+- CSV の読み込み（空行・BOM・重複した列名・足りない列）
+- pandas 版と同じコメントデータ・メニュー集計になること
+- build.py の import 時に pandas などを読み込まないこと
+"""
+
+import subprocess
+import unittest
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+# プロジェクトルートをパスに追加
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import build
+
+COMMENTS_CSV = (
+    "タイムスタンプ,想い出（必須）,公開可能なお名前（ニックネーム、任意）,好きだったメニュー（複数可、任意）\n"
+    "2026/01/11 8:32:53,塩ラーメンが好きでした,太郎,\"塩ラーメン, 焦がしガーリック\"\n"
+    "2026/01/12 9:00:00,\"改行を\n含む想い出\",,焦がしガーリック、わさび塩\n"
+    "2026/1/10 7:05:09,,花子,塩ラーメン\n"
+    "\n"
+    "2026/01/13 10:00:00,メニューなし,　,\n"
+)
+
+MERGED_CSV = (
+    "timestamp,comment,name,menu,photo\n"
+    "2026/01/13 10:00:00,写真の想い出,太郎,,https://drive.google.com/open?id=abc\n"
+    "2026/01/12 9:00:00,コメント,,焦がしガーリック;塩ラーメン,\n"
+    "2026/01/11 8:00:00,URLではない,,,写真なし\n"
+)
+
+
+class TestReadCsvRecords(unittest.TestCase):
+    """CSV 読み込みのテストクラス"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "test.csv"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_blank_lines_and_bom(self):
+        """空行を読み飛ばし、BOM を列名に含めないことを確認"""
+        self.path.write_text("﻿a,b\n1,2\n\n3,4\n", encoding="utf-8")
+
+        self.assertEqual(build.read_csv_records(self.path), [{"a": "1", "b": "2"}, {"a": "3", "b": "4"}])
+
+    def test_duplicate_and_missing_columns(self):
+        """重複した列名に番号が付き、足りない列は空文字になることを確認"""
+        self.path.write_text("a,a,b\n1,2\n", encoding="utf-8")
+
+        self.assertEqual(build.read_csv_records(self.path), [{"a": "1", "a.1": "2", "b": ""}])
+
+    def test_empty_file(self):
+        """空のファイルは空のリストになることを確認"""
+        self.path.write_text("", encoding="utf-8")
+
+        self.assertEqual(build.read_csv_records(self.path), [])
+
+
+class TestCsvEngineParity(unittest.TestCase):
+    """pandas 版との一致のテストクラス"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = Path(self.tmp.name)
+        (self.data_dir / "comments.csv").write_text(COMMENTS_CSV, encoding="utf-8")
+        self.patch = mock.patch.object(build, "DATA_DIR", self.data_dir)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmp.cleanup()
+
+    def both_engines(self):
+        """pandas 版と csv 版で読み込んだデータ"""
+        return build.load_local_csv("pandas"), build.load_local_csv("csv")
+
+    def test_comments_match_pandas(self):
+        """comments.csv から作ったコメントデータが pandas 版と一致することを確認"""
+        df, records = self.both_engines()
+
+        self.assertIsInstance(records, list)
+        self.assertEqual(build.prepare_comments_data(records), build.prepare_comments_data(df))
+
+    def test_merged_comments_match_pandas(self):
+        """merged.csv から作ったコメントデータ（写真のファイル名を含む）が pandas 版と一致することを確認"""
+        (self.data_dir / "merged.csv").write_text(MERGED_CSV, encoding="utf-8")
+        df, records = self.both_engines()
+
+        expected = build.prepare_comments_data(df)
+        comments = build.prepare_comments_data(records)
+
+        fields = ["timestamp", "content", "name", "photo_filename"]
+        self.assertEqual([[c[k] for k in fields] for c in comments], [[c[k] for k in fields] for c in expected])
+        self.assertTrue(comments[0]["photo_filename"].startswith("photo_20260113_100000_"))
+
+    def test_menu_stats_match_pandas(self):
+        """メニュー集計の件数と並び順が pandas 版と一致することを確認"""
+        df, records = self.both_engines()
+
+        menu_stats = build.aggregate_menu_items(records)
+
+        self.assertEqual(list(menu_stats.items()), list(build.aggregate_menu_items(df).items()))
+        self.assertEqual(menu_stats["焦がしガーリック"], 2)
+
+    def test_normalize_photos_requires_photo_column(self):
+        """写真フォームに写真列がない場合は pandas 版と同じく KeyError になることを確認"""
+        with self.assertRaises(KeyError):
+            build.normalize_form_df([{"タイムスタンプ": "2026/01/11 8:00:00"}], "photos")
+
+
+class TestParseTimestampText(unittest.TestCase):
+    """タイムスタンプ解釈のテストクラス"""
+
+    def test_formats(self):
+        """Googleフォームの書式と ISO 形式を解釈できることを確認"""
+        self.assertEqual(build.parse_timestamp_text("2026/1/11 8:32:53"), datetime(2026, 1, 11, 8, 32, 53))
+        self.assertEqual(build.parse_timestamp_text("2026-01-11"), datetime(2026, 1, 11))
+        self.assertEqual(build.parse_timestamp_text("2026-01-11T09:00:00+09:00"), datetime(2026, 1, 11, 0, 0))
+        self.assertIsNone(build.parse_timestamp_text("不明"))
+        self.assertIsNone(build.parse_timestamp_text(""))
+
+
+class TestLazyImports(unittest.TestCase):
+    """遅延 import のテストクラス"""
+
+    def test_import_does_not_load_heavy_modules(self):
+        """build.py の import だけでは pandas などが読み込まれないことを確認"""
+        code = (
+            "import sys, build; "
+            "print([m for m in ('pandas', 'PIL.Image', 'requests', 'jinja2', 'markdown') if m in sys.modules])"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+        )
+
+        self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_patched_attribute_is_used(self):
+        """遅延 import したモジュールの属性を mock.patch.object で差し替えられることを確認"""
+        with mock.patch.object(build.pd, "read_csv", return_value=pd.DataFrame()) as read_csv:
+            build.pd.read_csv("dummy.csv")
+
+        read_csv.assert_called_once()
+        self.assertIs(build.pd.read_csv, pd.read_csv)
+
+
+if __name__ == "__main__":
+    # テストを実行
+    unittest.main(verbosity=2)
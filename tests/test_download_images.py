@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_download_images.py - 写真ダウンロードのユニットテスト
+
+CSV内の写真URLから raw_images/ へのダウンロード処理をテストします。
+- 並列ダウンロードとホストごとの同時接続数制限
+- 写真ストアの一括保存と、内容の SHA-256 による重複の排除
+- 旧形式のファイル名で保存された写真の移行
+- ストリーミング保存（サイズ上限・マジックナンバー判定・原子的な配置・ネットワーク予算）
+- 1件ずつのダウンロードで作成したセッションの後始末
+"""
+
+import hashlib
+import unittest
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+from PIL import Image
+
+# プロジェクトルートをパスに追加
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import build
+
+
+class FakeResponse:
+    """iter_content と headers だけを持つテスト用のレスポンス"""
+
+    def __init__(self, chunks, headers=None):
+        self.chunks = chunks
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size=1):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class TestDownloadImages(unittest.TestCase):
+    """写真ダウンロードのテストクラス"""
+
+    def setUp(self):
+        """一時ディレクトリに raw_images/ と data/ を用意"""
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.raw_dir = root / "raw_images"
+        self.data_dir = root / "data"
+        self.data_dir.mkdir(parents=True)
+
+        self.patches = [
+            mock.patch.object(build, "RAW_IMAGES_DIR", self.raw_dir),
+            mock.patch.object(build, "DATA_DIR", self.data_dir),
+            mock.patch.object(build, "DOWNLOAD_HISTORY_FILE", self.data_dir / ".download_history.json"),
+            mock.patch.object(build, "PHOTO_STORE_FILE", self.data_dir / ".photo_store.json"),
+            mock.patch.object(build, "STATE_DB_FILE", self.data_dir / ".state.db"),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def make_df(self, urls):
+        """正規化済みスキーマのDataFrameを作成"""
+        return pd.DataFrame({
+            "timestamp": [f"2026/01/11 8:00:{i:02d}" for i in range(len(urls))],
+            "comment": ["コメント"] * len(urls),
+            "name": [""] * len(urls),
+            "menu": [""] * len(urls),
+            "photo": urls,
+        })
+
+    def test_downloads_run_concurrently_with_host_limit(self):
+        """並列にダウンロードされ、同一ホストへの同時接続数が制限されることを確認"""
+        urls = [f"https://example.com/{i}.jpg" for i in range(6)]
+        urls += [f"https://example.org/{i}.jpg" for i in range(2)]
+        active = {}
+        peak = {}
+        lock = threading.Lock()
+
+        def fake_download(url, output_path, session=None, max_bytes=None):
+            host = url.split("/")[2]
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), active[host])
+            time.sleep(0.05)
+            output_path.write_bytes(b"\xff\xd8\xff" + url.encode("utf-8"))
+            with lock:
+                active[host] -= 1
+            return True
+
+        with mock.patch.object(build, "download_image_from_google_drive", side_effect=fake_download), \
+             mock.patch.object(build, "DOWNLOAD_PER_HOST_LIMIT", 2):
+            count = build.download_images_from_csv(self.make_df(urls), workers=8)
+
+        self.assertEqual(count, 8)
+        self.assertEqual(peak["example.com"], 2)
+        self.assertEqual(len(build.load_photo_store()["urls"]), 8)
+
+    def test_store_is_saved_once(self):
+        """写真ストアが最後に1回だけ保存されることを確認"""
+        urls = [f"https://example.com/{i}.jpg" for i in range(3)] + [""]
+
+        def fake_download(url, output_path, session=None, max_bytes=None):
+            output_path.write_bytes(b"\xff\xd8\xff" + url.encode("utf-8"))
+            return True
+
+        with mock.patch.object(build, "download_image_from_google_drive", side_effect=fake_download), \
+             mock.patch.object(build, "save_photo_store", wraps=build.save_photo_store) as saved:
+            build.download_images_from_csv(self.make_df(urls))
+
+        saved.assert_called_once()
+
+    def test_same_content_is_stored_once(self):
+        """別々のURLの同じ写真は1つのファイルにまとめられ、どちらのURLからも引けることを確認"""
+        urls = ["https://example.com/a.jpg", "https://drive.google.com/open?id=b", "https://example.com/c.jpg"]
+        body = b"\xff\xd8\xff" + b"same" * 10
+        other = b"\xff\xd8\xffother"
+
+        def fake_download(url, output_path, session=None, max_bytes=None):
+            output_path.write_bytes(other if url.endswith("c.jpg") else body)
+            return True
+
+        with mock.patch.object(build, "download_image_from_google_drive", side_effect=fake_download):
+            count = build.download_images_from_csv(self.make_df(urls))
+
+        sha = hashlib.sha256(body).hexdigest()
+        self.assertEqual(count, 2)
+        self.assertEqual(
+            sorted(p.name for p in self.raw_dir.iterdir()),
+            sorted([f"photo_{sha}.jpg", f"photo_{hashlib.sha256(other).hexdigest()}.jpg"]),
+        )
+        photo_map = build.load_photo_map()
+        self.assertEqual(photo_map[urls[0]], f"photo_{sha}.webp")
+        self.assertEqual(photo_map[urls[1]], photo_map[urls[0]])
+
+        # 2回目はダウンロードしない
+        with mock.patch.object(build, "download_image_from_google_drive") as download:
+            self.assertEqual(build.download_images_from_csv(self.make_df(urls)), 0)
+        download.assert_not_called()
+
+    def test_legacy_files_are_adopted(self):
+        """旧形式のファイル名の写真はダウンロードせずに名前のまま登録されることを確認"""
+        url = "https://example.com/old.jpg"
+        self.raw_dir.mkdir()
+        legacy_name = f"photo_20260111_80000_{hashlib.md5(url.encode('utf-8')).hexdigest()[:8]}.jpg"
+        (self.raw_dir / legacy_name).write_bytes(b"\xff\xd8\xffold")
+
+        with mock.patch.object(build, "download_image_from_google_drive") as download:
+            build.download_images_from_csv(self.make_df([url]))
+
+        download.assert_not_called()
+        self.assertEqual(build.load_photo_map()[url], legacy_name.replace(".jpg", ".webp"))
+
+    def test_duplicate_legacy_file_outputs_are_removed(self):
+        """重複していた旧形式のファイルを削除すると、エンコード済みの出力も削除されることを確認"""
+        urls = ["https://example.com/new.jpg", "https://example.com/old.jpg"]
+        body = b"\xff\xd8\xffsame"
+
+        def fake_download(url, output_path, session=None, max_bytes=None):
+            output_path.write_bytes(body)
+            return True
+
+        with mock.patch.object(build, "download_image_from_google_drive", side_effect=fake_download):
+            build.download_images_from_csv(self.make_df(urls[:1]))
+
+        # 前回までに旧形式の名前で保存・エンコードされていた同じ写真
+        legacy_name = f"photo_20260111_80001_{hashlib.md5(urls[1].encode('utf-8')).hexdigest()[:8]}.jpg"
+        (self.raw_dir / legacy_name).write_bytes(body)
+        out_dir = self.data_dir / "images"
+        out_dir.mkdir()
+        legacy_outputs = [legacy_name.replace(".jpg", ".webp"), legacy_name.replace(".jpg", "-480w.webp")]
+        for name in legacy_outputs:
+            (out_dir / name).write_bytes(b"encoded")
+        build.save_image_manifest({legacy_name: {
+            "output": legacy_outputs[0],
+            "variants": [{"file": legacy_outputs[1], "width": 480, "height": 360, "format": "webp"}],
+        }})
+
+        with mock.patch.object(build, "OUTPUT_IMAGES_DIR", out_dir):
+            build.download_images_from_csv(self.make_df(urls))
+
+        self.assertFalse((self.raw_dir / legacy_name).exists())
+        self.assertEqual(list(out_dir.iterdir()), [])
+        self.assertEqual(build.load_image_manifest(), {})
+
+    def test_failed_download_is_not_recorded(self):
+        """失敗したダウンロードが履歴に残らないことを確認"""
+        urls = ["https://example.com/ok.jpg", "https://example.com/ng.jpg"]
+
+        def fake_download(url, output_path, session=None, max_bytes=None):
+            if url.endswith("ng.jpg"):
+                return False
+            output_path.write_bytes(b"\xff\xd8\xff")
+            return True
+
+        with mock.patch.object(build, "download_image_from_google_drive", side_effect=fake_download):
+            count = build.download_images_from_csv(self.make_df(urls))
+
+        self.assertEqual(count, 1)
+        self.assertEqual(list(build.load_photo_store()["urls"]), ["https://example.com/ok.jpg"])
+        self.assertEqual(list(self.raw_dir.glob(".*")), [])
+
+    def test_similar_photos_are_merged(self):
+        """--dedupe-similar で縮小された同じ写真が1枚にまとめられることを確認"""
+        urls = ["https://example.com/large.jpg", "https://example.com/small.jpg"]
+        img = Image.linear_gradient("L").convert("RGB")
+
+        def fake_download(url, output_path, session=None, max_bytes=None):
+            size = (256, 256) if url.endswith("large.jpg") else (128, 128)
+            img.resize(size).save(output_path, "JPEG", quality=90 if size[0] == 256 else 60)
+            return True
+
+        with mock.patch.object(build, "download_image_from_google_drive", side_effect=fake_download):
+            count = build.download_images_from_csv(self.make_df(urls), workers=1, similar=True)
+
+        self.assertEqual(count, 1)
+        self.assertEqual(len(list(self.raw_dir.iterdir())), 1)
+        photo_map = build.load_photo_map()
+        self.assertEqual(photo_map[urls[0]], photo_map[urls[1]])
+
+
+class TestSaveImageResponse(unittest.TestCase):
+    """ストリーミング保存のテストクラス"""
+
+    JPEG_HEAD = b"\xff\xd8\xff\xe0" + b"\x00" * 12
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.output_path = self.dir / "photo.jpg"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_valid_image_is_saved(self):
+        """画像データが分割して書き込まれ、最終パスに配置されることを確認"""
+        resp = FakeResponse([self.JPEG_HEAD, b"a" * 100, b"b" * 100])
+
+        self.assertTrue(build.save_image_response(resp, self.output_path, max_bytes=1024))
+        self.assertEqual(self.output_path.read_bytes(), self.JPEG_HEAD + b"a" * 100 + b"b" * 100)
+        self.assertEqual(list(self.dir.glob("*.part")), [])
+
+    def test_non_image_is_rejected(self):
+        """Content-Type に関係なく、画像でないデータは保存されないことを確認"""
+        resp = FakeResponse([b"<!DOCTYPE html><html></html>"], {"Content-Type": "image/jpeg"})
+
+        self.assertFalse(build.save_image_response(resp, self.output_path, max_bytes=1024))
+        self.assertFalse(self.output_path.exists())
+        self.assertEqual(list(self.dir.iterdir()), [])
+
+    def test_content_length_over_limit_is_rejected(self):
+        """Content-Length が上限を超える場合はダウンロードしないことを確認"""
+        resp = FakeResponse([self.JPEG_HEAD], {"Content-Length": "4096"})
+
+        self.assertFalse(build.save_image_response(resp, self.output_path, max_bytes=1024))
+        self.assertFalse(self.output_path.exists())
+
+    def test_stream_over_limit_is_aborted(self):
+        """受信中に上限を超えた場合は中断し、一時ファイルも残らないことを確認"""
+        resp = FakeResponse([self.JPEG_HEAD] + [b"x" * 512] * 4)
+
+        self.assertFalse(build.save_image_response(resp, self.output_path, max_bytes=1024))
+        self.assertEqual(list(self.dir.iterdir()), [])
+
+    def test_stream_past_budget_is_aborted(self):
+        """受信中にネットワーク予算を使い切った場合は中断し、一時ファイルも残らないことを確認"""
+        def trickle():
+            yield self.JPEG_HEAD
+            build._network_deadline = build.time.monotonic() - 1
+            yield b"x" * 512
+
+        resp = FakeResponse(trickle())
+
+        try:
+            with self.assertRaises(build.requests.Timeout):
+                build.save_image_response(resp, self.output_path, max_bytes=1024 * 1024)
+        finally:
+            build.reset_network_state()
+        self.assertEqual(list(self.dir.iterdir()), [])
+
+    def test_ad_hoc_session_is_closed(self):
+        """session を渡さない場合は作成したセッションが閉じられ、渡した場合は閉じないことを確認"""
+        error = build.requests.ConnectionError("offline")
+        with mock.patch.object(build.requests, "Session") as session_class, \
+             mock.patch.object(build, "http_get", side_effect=error):
+            self.assertFalse(build.download_image_from_google_drive("https://example.com/a.jpg", self.output_path))
+            session_class.return_value.close.assert_called_once()
+
+            shared = mock.Mock()
+            self.assertFalse(build.download_image_from_google_drive("https://example.com/a.jpg", self.output_path, shared))
+            shared.close.assert_not_called()
+
+    def test_sniff_image_type(self):
+        """マジックナンバーから画像形式を判定できることを確認"""
+        self.assertEqual(build.sniff_image_type(self.JPEG_HEAD), "jpeg")
+        self.assertEqual(build.sniff_image_type(b"\x89PNG\r\n\x1a\n\x00\x00"), "png")
+        self.assertEqual(build.sniff_image_type(b"RIFF\x00\x00\x00\x00WEBPVP8 "), "webp")
+        self.assertIsNone(build.sniff_image_type(b"<html>"))
+
+
+if __name__ == "__main__":
+    # テストを実行
+    unittest.main(verbosity=2)
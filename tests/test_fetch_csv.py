@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_fetch_csv.py - CSV取得のユニットテスト
+
+Google スプレッドシートからのCSV取得をテストします。
+- ETag / Last-Modified による条件付きリクエスト
+- 本文ハッシュによる変更検知
+- キャッシュファイルが差し替えられた場合の再取得
+- ストリーミング取得とタイムスタンプ順のマージ（--stream-ingest）
+- 再試行・ホストごとの一時停止・ネットワーク予算（http_get）
+"""
+
+import threading
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+# プロジェクトルートをパスに追加
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import build
+
+CSV_URL = "https://docs.google.com/spreadsheets/d/e/TEST/pub?output=csv"
+CSV_BODY = "タイムスタンプ,想い出（必須）\n2026/01/11 8:00:00,ありがとう\n".encode("utf-8")
+PHOTO_URL = "https://docs.google.com/spreadsheets/d/e/PHOTO/pub?output=csv"
+COMMENTS_BODY = (
+    "タイムスタンプ,想い出（必須）,公開可能なお名前（ニックネーム、任意）,好きだったメニュー（複数可、任意）\n"
+    "2026/01/10 8:00:00,一番古い想い出,太郎,塩ラーメン\n"
+    "2026/01/12 9:00:00,\"改行を\n含む想い出\",,\n"
+    "2026/01/14 10:00:00,一番新しい想い出,花子,\n"
+).encode("utf-8")
+PHOTOS_BODY = (
+    "タイムスタンプ,想い出の写真,写真にまつわる想い出,公開可能なお名前（ニックネーム、任意）\n"
+    "2026/01/11 12:00:00,https://drive.google.com/open?id=abc,写真の想い出,次郎\n"
+    "2026/01/13 12:00:00,https://drive.google.com/open?id=def,,\n"
+).encode("utf-8")
+
+
+class FakeResponse:
+    """requests.Response の代わりに使うテスト用のレスポンス"""
+
+    def __init__(self, status_code=200, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.encoding = None
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8")
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise build.requests.HTTPError(f"{self.status_code}")
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class TestFetchCsv(unittest.TestCase):
+    """条件付きCSV取得のテストクラス"""
+
+    def setUp(self):
+        """一時ディレクトリに data/ を用意"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = Path(self.tmp.name)
+        self.cache_path = self.data_dir / "comments.csv"
+        self.patch = mock.patch.object(build, "DATA_DIR", self.data_dir)
+        self.patch.start()
+        build.reset_network_state()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmp.cleanup()
+
+    def first_fetch(self, fetch_state):
+        """初回取得（ETag付き）でキャッシュを作成"""
+        response = FakeResponse(200, CSV_BODY, {"ETag": '"v1"', "Last-Modified": "Sat, 10 Jan 2026 00:00:00 GMT"})
+        with mock.patch.object(build.requests, "get", return_value=response):
+            df = build.fetch_csv_data(CSV_URL, fetch_state)
+        return df
+
+    def test_first_fetch_records_validators(self):
+        """初回取得でキャッシュとバリデータが保存されることを確認"""
+        fetch_state = {}
+        df = self.first_fetch(fetch_state)
+
+        self.assertEqual(len(df), 1)
+        self.assertTrue(self.cache_path.exists())
+        entry = fetch_state["comments.csv"]
+        self.assertEqual(entry["etag"], '"v1"')
+        self.assertTrue(entry["changed"])
+        self.assertEqual(entry["cache_hash"], build.compute_file_hash(self.cache_path))
+
+    def test_not_modified_uses_cache(self):
+        """304 の場合はキャッシュを使い、ファイルを書き直さないことを確認"""
+        fetch_state = {}
+        self.first_fetch(fetch_state)
+        mtime = self.cache_path.stat().st_mtime_ns
+
+        with mock.patch.object(build.requests, "get", return_value=FakeResponse(304)) as get:
+            df = build.fetch_csv_data(CSV_URL, fetch_state)
+
+        headers = get.call_args.kwargs["headers"]
+        self.assertEqual(headers["If-None-Match"], '"v1"')
+        self.assertIn("If-Modified-Since", headers)
+        self.assertEqual(len(df), 1)
+        self.assertFalse(fetch_state["comments.csv"]["changed"])
+        self.assertEqual(self.cache_path.stat().st_mtime_ns, mtime)
+
+    def test_same_body_without_validators_is_unchanged(self):
+        """ETag がなくても本文が同じなら変更なしと判定されることを確認"""
+        fetch_state = {}
+        self.first_fetch(fetch_state)
+
+        with mock.patch.object(build.requests, "get", return_value=FakeResponse(200, CSV_BODY)):
+            text = build.fetch_csv_if_changed(CSV_URL, self.cache_path, fetch_state)
+
+        self.assertIsNone(text)
+        self.assertFalse(fetch_state["comments.csv"]["changed"])
+
+    def test_changed_body_is_returned(self):
+        """本文が変わった場合は新しい本文が返ることを確認"""
+        fetch_state = {}
+        self.first_fetch(fetch_state)
+        new_body = CSV_BODY + "2026/01/12 9:00:00,また行きたい\n".encode("utf-8")
+
+        with mock.patch.object(build.requests, "get", return_value=FakeResponse(200, new_body)):
+            df = build.fetch_csv_data(CSV_URL, fetch_state)
+
+        self.assertEqual(len(df), 2)
+        self.assertTrue(fetch_state["comments.csv"]["changed"])
+
+    def test_modified_cache_disables_conditional_request(self):
+        """キャッシュが書き換えられていたら条件付きヘッダーを送らないことを確認"""
+        fetch_state = {}
+        self.first_fetch(fetch_state)
+        self.cache_path.write_text("タイムスタンプ,想い出（必須）\n", encoding="utf-8")
+
+        with mock.patch.object(build.requests, "get", return_value=FakeResponse(200, CSV_BODY)) as get:
+            text = build.fetch_csv_if_changed(CSV_URL, self.cache_path, fetch_state)
+
+        self.assertEqual(get.call_args.kwargs["headers"], {})
+        self.assertIsNotNone(text)
+
+
+class TestStreamIngest(unittest.TestCase):
+    """ストリーミング取得とマージのテストクラス"""
+
+    def setUp(self):
+        """一時ディレクトリに data/ を用意し、読み込み単位を小さくする"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = Path(self.tmp.name)
+        self.patches = [
+            mock.patch.object(build, "DATA_DIR", self.data_dir),
+            mock.patch.object(build, "STREAM_CHUNK_ROWS", 1),
+            mock.patch.object(build, "DOWNLOAD_CHUNK_SIZE", 16),
+            mock.patch.object(build, "HTTP_BACKOFF_BASE", 0),
+        ]
+        for p in self.patches:
+            p.start()
+        build.reset_network_state()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def fake_get(self, url, **kwargs):
+        """URL に応じたレスポンスを返す"""
+        return FakeResponse(200, COMMENTS_BODY if url == CSV_URL else PHOTOS_BODY, {"ETag": '"v1"'})
+
+    def stream(self, fetch_state):
+        with mock.patch.object(build.requests, "get", side_effect=self.fake_get) as get:
+            rows = build.fetch_and_merge_csv_stream(CSV_URL, PHOTO_URL, fetch_state)
+        return rows, get
+
+    def test_stream_saves_body_unchanged(self):
+        """少しずつ受け取った本文がそのままキャッシュに保存されることを確認"""
+        fetch_state = {}
+        rows, get = self.stream(fetch_state)
+
+        self.assertEqual(rows, 5)
+        self.assertTrue(get.call_args.kwargs["stream"])
+        self.assertEqual((self.data_dir / "comments.csv").read_bytes(), COMMENTS_BODY)
+        self.assertEqual((self.data_dir / "photos.csv").read_bytes(), PHOTOS_BODY)
+        self.assertEqual(fetch_state["photos.csv"]["etag"], '"v1"')
+        self.assertEqual(list(self.data_dir.glob(".*.part")), [])
+
+    def test_merge_by_timestamp(self):
+        """2つのフォームの行がタイムスタンプの新しい順にマージされることを確認"""
+        self.stream({})
+
+        df = build.load_local_csv()
+
+        self.assertEqual(list(df.columns), build.MERGED_COLUMNS)
+        self.assertEqual(
+            list(df["timestamp"]),
+            ["2026/01/14 10:00:00", "2026/01/13 12:00:00", "2026/01/12 9:00:00",
+             "2026/01/11 12:00:00", "2026/01/10 8:00:00"],
+        )
+        self.assertEqual(df["comment"].iloc[2], "改行を\n含む想い出")
+        self.assertEqual(df["photo"].iloc[3], "https://drive.google.com/open?id=abc")
+
+    def test_same_merged_csv_as_in_memory_merge(self):
+        """同じタイムスタンプの行を含めて、merged.csv が従来のマージと同じ内容・並びになることを確認"""
+        comments = COMMENTS_BODY + (
+            "2026/01/14 10:00:00,同じ時刻の想い出1,,\n"
+            "2026/01/14 10:00:00,同じ時刻の想い出2,,\n"
+        ).encode("utf-8")
+        photos = PHOTOS_BODY + "2026/01/14 10:00:00,https://drive.google.com/open?id=ghi,同じ時刻の写真,\n".encode("utf-8")
+
+        def fake_get(url, **kwargs):
+            return FakeResponse(200, comments if url == CSV_URL else photos)
+
+        merged_path = self.data_dir / "merged.csv"
+        with mock.patch.object(build.requests, "get", side_effect=fake_get):
+            build.fetch_and_merge_csv_data(CSV_URL, PHOTO_URL, {})
+            expected = merged_path.read_bytes()
+            for chunk_rows in (1, 2, 5000):
+                with self.subTest(chunk_rows=chunk_rows), mock.patch.object(build, "STREAM_CHUNK_ROWS", chunk_rows):
+                    merged_path.unlink()
+                    build.fetch_and_merge_csv_stream(CSV_URL, PHOTO_URL, {})
+                    self.assertEqual(merged_path.read_bytes(), expected)
+        self.assertEqual([p.name for p in self.data_dir.iterdir() if p.name.startswith(".")], [])
+
+    def test_same_comments_as_in_memory_merge(self):
+        """表示用のコメントデータが従来のマージと同じになることを確認"""
+        with mock.patch.object(build.requests, "get", side_effect=self.fake_get):
+            expected = build.prepare_comments_data(build.fetch_and_merge_csv_data(CSV_URL, PHOTO_URL, {}))
+        self.stream({})
+
+        comments = build.prepare_comments_data(build.load_local_csv())
+
+        fields = ["timestamp", "content", "name", "photo_filename"]
+        self.assertEqual([[c[k] for k in fields] for c in comments], [[c[k] for k in fields] for c in expected])
+
+    def test_unchanged_sources_skip_merge(self):
+        """どちらのCSVも変わっていなければ merged.csv を書き直さないことを確認"""
+        fetch_state = {}
+        self.stream(fetch_state)
+        merged_path = self.data_dir / "merged.csv"
+        mtime = merged_path.stat().st_mtime_ns
+        for entry in fetch_state.values():
+            entry["changed"] = False
+
+        rows, _ = self.stream(fetch_state)
+
+        self.assertEqual(rows, -1)
+        self.assertEqual(merged_path.stat().st_mtime_ns, mtime)
+        self.assertFalse(any(entry["changed"] for entry in fetch_state.values()))
+
+    def test_fetch_error_uses_cache(self):
+        """取得に失敗してもキャッシュからマージできることを確認"""
+        self.stream({})
+        (self.data_dir / "merged.csv").unlink()
+
+        with mock.patch.object(build.requests, "get", side_effect=build.requests.ConnectionError("offline")):
+            rows = build.fetch_and_merge_csv_stream(CSV_URL, PHOTO_URL, {})
+
+        self.assertEqual(rows, 5)
+
+
+
+class TestHttpGet(unittest.TestCase):
+    """共通の HTTP 取得のテストクラス"""
+
+    def setUp(self):
+        """再試行の待ち時間をなくし、ホストごとの失敗回数を消去"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = Path(self.tmp.name)
+        self.patches = [
+            mock.patch.object(build, "DATA_DIR", self.data_dir),
+            mock.patch.object(build, "HTTP_BACKOFF_BASE", 0),
+        ]
+        for p in self.patches:
+            p.start()
+        build.reset_network_state()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        build.reset_network_state()
+        self.tmp.cleanup()
+
+    def test_transient_errors_are_retried(self):
+        """503 や接続エラーの後に再試行して取得できることを確認"""
+        responses = [FakeResponse(503), build.requests.ConnectionError("reset"), FakeResponse(200, CSV_BODY)]
+
+        with mock.patch.object(build.requests, "get", side_effect=responses) as get:
+            response = build.http_get(CSV_URL)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual(get.call_args.kwargs["timeout"], (build.HTTP_CONNECT_TIMEOUT, build.HTTP_READ_TIMEOUT))
+
+    def test_last_error_response_is_returned(self):
+        """再試行しても 5xx の場合は最後のレスポンスが返り、4xx は再試行しないことを確認"""
+        with mock.patch.object(build.requests, "get", return_value=FakeResponse(500)) as get:
+            response = build.http_get(CSV_URL)
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(get.call_count, build.HTTP_RETRIES + 1)
+
+        with mock.patch.object(build.requests, "get", return_value=FakeResponse(404)) as get:
+            build.http_get(CSV_URL)
+
+        get.assert_called_once()
+
+    def test_retried_request_counts_as_one_failure(self):
+        """再試行を使い切ったリクエストは、一時停止の判定で1回の失敗として数えられることを確認"""
+        with mock.patch.object(build.requests, "get", return_value=FakeResponse(503)) as get:
+            build.http_get(CSV_URL)
+
+        self.assertEqual(get.call_count, build.HTTP_RETRIES + 1)
+        self.assertEqual(build._host_circuits["docs.google.com"]["failures"], 1)
+
+    def test_slow_body_stops_at_budget(self):
+        """本文の受信中に予算を使い切ると中断し、キャッシュが置き換えられないことを確認"""
+        cache_path = self.data_dir / "comments.csv"
+        cache_path.write_bytes(CSV_BODY)
+        build.reset_network_state(60)
+
+        def trickle(chunk_size=1):
+            yield CSV_BODY[:8]
+            # 受信の途中で予算の期限を過ぎる
+            build._network_deadline = build.time.monotonic() - 1
+            yield CSV_BODY[8:]
+
+        response = FakeResponse(200, b"new body")
+        response.iter_content = trickle
+        with mock.patch.object(build.requests, "get", return_value=response):
+            with self.assertRaises(build.requests.Timeout):
+                build.stream_csv_if_changed(CSV_URL, cache_path, {})
+
+        self.assertEqual(cache_path.read_bytes(), CSV_BODY)
+        self.assertEqual([p.name for p in self.data_dir.iterdir()], ["comments.csv"])
+
+    def test_circuit_opens_after_repeated_failures(self):
+        """同じホストで失敗が続くと、しばらくリクエストを送らなくなることを確認"""
+        with mock.patch.object(build, "HTTP_RETRIES", 0), \
+             mock.patch.object(build.requests, "get", side_effect=build.requests.ConnectTimeout("slow")) as get:
+            for _ in range(build.HTTP_BREAKER_THRESHOLD):
+                with self.assertRaises(build.requests.Timeout):
+                    build.http_get(CSV_URL)
+            with self.assertRaises(build.requests.ConnectionError):
+                build.http_get(CSV_URL)
+
+        self.assertEqual(get.call_count, build.HTTP_BREAKER_THRESHOLD)
+
+        # 別のホストには影響しない
+        with mock.patch.object(build.requests, "get", return_value=FakeResponse(200)):
+            self.assertEqual(build.http_get("https://example.com/a.jpg").status_code, 200)
+
+    def test_concurrent_failures_are_all_counted(self):
+        """複数のスレッドから失敗を記録しても、回数が失われないことを確認"""
+        with mock.patch.object(build, "HTTP_BREAKER_THRESHOLD", 1000):
+            threads = [
+                threading.Thread(target=lambda: [build.record_host_result("example.com", False) for _ in range(50)])
+                for _ in range(4)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        self.assertEqual(build._host_circuits["example.com"]["failures"], 200)
+
+    def test_exhausted_budget_falls_back_to_cache(self):
+        """ネットワーク予算を使い切った後はリクエストせずにキャッシュを使うことを確認"""
+        (self.data_dir / "comments.csv").write_bytes(CSV_BODY)
+        build.reset_network_state(1)
+
+        with mock.patch.object(build.time, "monotonic", return_value=build.time.monotonic() + 2), \
+             mock.patch.object(build.requests, "get") as get:
+            df = build.fetch_csv_data(CSV_URL, {})
+
+        get.assert_not_called()
+        self.assertEqual(len(df), 1)
+
+if __name__ == "__main__":
+    # テストを実行
+    unittest.main(verbosity=2)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_generate_html.py - HTML生成のユニットテスト
+
+templates/ から public/ へのHTML出力をテストします。
+- タイムラインの先頭だけを index.html に埋め込む分割出力
+- 分割ページでの左右の振り分けと通し番号（id）の引き継ぎ
+- 前回のビルドで出力したページの削除
+- コンパイル済みテンプレートのキャッシュと、ファイルへの逐次書き込み
+- 写真の寸法と、読み込み中の代表色・ぼかし画像
+"""
+
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+# プロジェクトルートをパスに追加
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import build
+
+
+class TestGenerateHtml(unittest.TestCase):
+    """HTML生成のテストクラス"""
+
+    def setUp(self):
+        """一時ディレクトリを public/ として使用"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.public_dir = Path(self.tmp.name) / "public"
+        self.public_dir.mkdir()
+        self.cache_dir = Path(self.tmp.name) / ".jinja_cache"
+        self.patches = [
+            mock.patch.object(build, "PUBLIC_DIR", self.public_dir),
+            mock.patch.object(build, "JINJA_CACHE_DIR", self.cache_dir),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def make_comments(self, count):
+        """prepare_comments_data() と同じ形式のコメントを作成"""
+        return [
+            {"name": f"投稿者{i}", "timestamp": "2026年01月11日", "content": f"想い出{i}", "photo_filename": ""}
+            for i in range(1, count + 1)
+        ]
+
+    def generate(self, comments, initial_items, chunk_size):
+        """タイムライン設定を指定してHTMLを生成"""
+        config = build.load_config()
+        config["timeline"] = {"initial_items": initial_items, "chunk_size": chunk_size}
+        build.generate_html(comments, [], "", config, copy_static=False)
+        return (self.public_dir / "index.html").read_text(encoding="utf-8")
+
+    def page(self, n):
+        return (self.public_dir / "timeline" / f"page-{n}.html").read_text(encoding="utf-8")
+
+    def test_timeline_is_split_into_pages(self):
+        """先頭の件数だけが index.html に入り、残りがページに分割されることを確認"""
+        html = self.generate(self.make_comments(7), initial_items=3, chunk_size=2)
+
+        self.assertIn("想い出3<", html)
+        self.assertNotIn("想い出4<", html)
+        self.assertIn('data-page-count="2"', html)
+        self.assertIn('data-total-count="7"', html)
+        self.assertIn("想い出4<", self.page(1))
+        self.assertIn("想い出5<", self.page(1))
+        self.assertIn("想い出7<", self.page(2))
+        self.assertFalse((self.public_dir / "timeline" / "page-3.html").exists())
+
+    def test_page_keeps_left_right_alternation(self):
+        """分割ページでも全体の通し番号で左右が振り分けられることを確認"""
+        self.generate(self.make_comments(6), initial_items=3, chunk_size=3)
+
+        page = self.page(1)
+        # 4件目（偶数）は右、5件目（奇数）は左
+        self.assertLess(page.index("timeline-right"), page.index("想い出4<"))
+        self.assertLess(page.index("想い出4<"), page.index("timeline-left"))
+        # 検索結果からのリンク先の id も通し番号
+        self.assertIn('id="comment-4"', page)
+
+    def test_small_timeline_is_not_split(self):
+        """件数が埋め込み件数以下の場合は分割せず、古いページを削除することを確認"""
+        self.generate(self.make_comments(5), initial_items=2, chunk_size=2)
+        html = self.generate(self.make_comments(2), initial_items=2, chunk_size=2)
+
+        self.assertNotIn('id="timelineMore"', html)
+        self.assertFalse((self.public_dir / "timeline").exists())
+
+    def test_zero_initial_items_embeds_everything(self):
+        """埋め込み件数が 0 の場合は全件を index.html に出力することを確認"""
+        html = self.generate(self.make_comments(5), initial_items=0, chunk_size=2)
+
+        self.assertIn("想い出5<", html)
+        self.assertFalse((self.public_dir / "timeline").exists())
+
+    def test_compiled_templates_are_cached(self):
+        """コンパイル済みのテンプレートが保存され、次回は再利用されることを確認"""
+        self.generate(self.make_comments(1), initial_items=0, chunk_size=2)
+        self.assertTrue(any(self.cache_dir.iterdir()))
+
+        with mock.patch.object(build.jinja2.Environment, "compile") as compile_template:
+            html = self.generate(self.make_comments(1), initial_items=0, chunk_size=2)
+
+        compile_template.assert_not_called()
+        self.assertIn("想い出1<", html)
+
+    def test_streamed_output_matches_render(self):
+        """逐次書き込みの結果が render() と同じになることを確認"""
+        env = build.create_jinja_env()
+        template = env.from_string("{% for i in items %}<p>{{ i }}</p>{% endfor %}")
+        path = self.public_dir / "out.html"
+
+        with mock.patch.object(build, "RENDER_BUFFER_SIZE", 3):
+            written = build.render_to_file(template, path, items=range(10))
+
+        expected = template.render(items=range(10))
+        self.assertEqual(path.read_text(encoding="utf-8"), expected)
+        self.assertEqual(written, len(expected.encode("utf-8")))
+
+    def test_photos_reserve_space_with_placeholder(self):
+        """写真の img に寸法と代表色・ぼかし画像が出力されることを確認"""
+        config = build.load_config()
+        image_variants = {"a.webp": {
+            "width": 800, "height": 600, "srcset": {"webp": "static/images/a.webp 800w"},
+            "color": "#336699", "placeholder": "data:image/webp;base64,AAAA",
+        }}
+        build.generate_html([], ["a.webp"], "", config, copy_static=False, image_variants=image_variants)
+        html = (self.public_dir / "index.html").read_text(encoding="utf-8")
+
+        self.assertIn(
+            'width="800" height="600" style="background: #336699 url(data:image/webp;base64,AAAA) center / cover no-repeat"',
+            html,
+        )
+
+    def test_failed_render_keeps_previous_output(self):
+        """出力の途中で失敗した場合は前回のファイルが残ることを確認"""
+        env = build.create_jinja_env()
+        template = env.from_string("<p>{{ items | first }}</p>{{ missing.attr }}")
+        path = self.public_dir / "out.html"
+        path.write_text("前回の出力", encoding="utf-8")
+
+        with self.assertRaises(Exception):
+            build.render_to_file(template, path, items=[1])
+
+        self.assertEqual(path.read_text(encoding="utf-8"), "前回の出力")
+        self.assertEqual([p.name for p in self.public_dir.iterdir()], ["out.html"])
+
+
+if __name__ == "__main__":
+    # テストを実行
+    unittest.main(verbosity=2)
@@ -9,6 +9,9 @@ test_menu_aggregation.py - メニュー集計機能のユニットテスト
 - 全角カンマ（，）
 - 複数区切り文字の混在
 - 空欄の処理
+- NFKC 正規化（半角カナ・全角英数字）と別名のまとめ
+- pandas 版と csv エンジン版の一致
+- 行ごとの分割結果のキャッシュ（新しい行だけの分割、バージョンの違い）
 """
 
 import unittest
@@ -20,7 +23,19 @@ import pandas as pd
 PROJECT_ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(PROJECT_ROOT))
 
-from build import aggregate_menu_items, normalize_form_df
+import build
+from build import aggregate_menu_items, aggregate_menu_records, compile_menu_aliases, normalize_form_df
+
+
+def menu_frame(menus: list) -> pd.DataFrame:
+    """メニュー欄だけを指定した正規化済みの DataFrame を作成"""
+    return pd.DataFrame({
+        "timestamp": ["2026/01/11 8:00:00"] * len(menus),
+        "comment": [""] * len(menus),
+        "name": [""] * len(menus),
+        "menu": menus,
+        "photo": [""] * len(menus),
+    })
 
 
 class TestMenuAggregation(unittest.TestCase):
@@ -277,6 +292,70 @@ class TestMenuAggregation(unittest.TestCase):
         )
         
         print(f"\n✓ 「焦がしガーリック」の集計件数確認成功: {garlic_count}件")
+    
+    def test_halfwidth_kana_is_normalized(self):
+        """半角カナ・全角英数字のメニューが通常の表記にまとめられることを確認"""
+        df = menu_frame(["ﾁｬｰｼｭｰ麺", "チャーシュー麺, ＢＬＴ", "BLT"])
+        
+        menu_stats = aggregate_menu_items(df)
+        
+        self.assertEqual(menu_stats, {"チャーシュー麺": 2, "BLT": 2})
+    
+    def test_aliases_are_merged(self):
+        """config の別名が正式名にまとめられることを確認"""
+        aliases = compile_menu_aliases({"焦がしガーリック": ["焦がしにんにく", "ガーリック"]})
+        df = menu_frame(["焦がしにんにく", "ガーリック、わさび塩", "焦がし ガーリック", "わさび塩"])
+        
+        menu_stats = aggregate_menu_items(df, aliases)
+        
+        self.assertEqual(menu_stats, {"焦がしガーリック": 3, "わさび塩": 2})
+    
+    def test_duplicate_rows_keep_counts_and_tie_order(self):
+        """同じ内容の行がすべて数えられ、同数のメニューが初出順に並ぶことを確認"""
+        df = menu_frame(["わさび塩, 塩ラーメン", "レモン塩", "わさび塩, 塩ラーメン", "レモン塩、柚子胡椒"])
+        
+        menu_stats = aggregate_menu_items(df)
+        
+        self.assertEqual(list(menu_stats.items()), [("わさび塩", 2), ("塩ラーメン", 2), ("レモン塩", 2), ("柚子胡椒", 1)])
+    
+    def test_token_cache_skips_known_rows(self):
+        """分割結果のキャッシュがあると、新しい行だけが分割されることを確認"""
+        token_cache = {}
+        aggregate_menu_items(menu_frame(["塩ラーメン, わさび塩", "レモン塩"]), token_cache=token_cache)
+        
+        counters = {}
+        df = menu_frame(["塩ラーメン, わさび塩", "レモン塩", "柚子胡椒", "レモン塩"])
+        with build.trace_stage(counters, "menu_stats") as stage_counters:
+            menu_stats = aggregate_menu_items(df, token_cache=token_cache)
+        
+        self.assertEqual(stage_counters.get("menu_rows_tokenized"), 1)
+        self.assertEqual(len(token_cache), 3)
+        self.assertEqual(menu_stats, aggregate_menu_items(df))
+    
+    def test_token_cache_drops_removed_rows(self):
+        """データからなくなった行がキャッシュから取り除かれることを確認"""
+        token_cache = {}
+        aggregate_menu_items(menu_frame(["塩ラーメン", "レモン塩"]), token_cache=token_cache)
+        aggregate_menu_records(menu_frame(["レモン塩"]).to_dict("records"), token_cache=token_cache)
+        
+        self.assertEqual(list(token_cache.values()), [["レモン塩"]])
+    
+    def test_token_version_covers_aliases(self):
+        """別名の辞書が変わるとキャッシュのバージョンが変わることを確認"""
+        aliases = compile_menu_aliases({"焦がしガーリック": ["焦がしにんにく"]})
+        
+        self.assertEqual(build.menu_token_version(aliases), build.menu_token_version(dict(aliases)))
+        self.assertNotEqual(build.menu_token_version(aliases), build.menu_token_version({}))
+    
+    def test_records_match_dataframe(self):
+        """csv エンジン（行の辞書のリスト）でも同じ集計結果になることを確認"""
+        df = normalize_form_df(pd.read_csv(self.test_csv_path, encoding='utf-8'), "comments")
+        aliases = compile_menu_aliases({"焦がしガーリック": ["焦がしにんにく"]})
+        
+        self.assertEqual(
+            aggregate_menu_records(df.to_dict("records"), aliases),
+            aggregate_menu_items(df, aliases),
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_minify.py - HTML / CSS 最適化のユニットテスト
+
+--minify で行う public/ の HTML・CSS の縮小をテストします。
+- white-space: pre-wrap の要素の改行の保持
+- HTML コメントの削除と、インラインスクリプトの縮小
+- 使われていないセレクタの削除（@media の中も含む）
+- 結果の再現性（2回目の実行で変わらないこと）
+"""
+
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+# プロジェクトルートをパスに追加
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import build
+
+CSS = """
+/* コメント本文 */
+.comment-body p {
+    white-space: pre-wrap;
+    margin: 0;
+}
+
+.used { color: red; }
+.unused { color: blue; }
+
+@media (max-width: 768px) {
+    .used, .unused-in-media { padding: 4px; }
+    .only-unused { display: none; }
+}
+
+@keyframes fadeIn {
+    from { opacity: 0; }
+    to { opacity: 1; }
+}
+"""
+
+HTML = """<!DOCTYPE html>
+<html>
+<head>
+    <!-- スタイル -->
+    <link rel="stylesheet" href="static/css/style.css">
+</head>
+<body>
+    <div class="used">
+        <span>見出し</span>
+    </div>
+    <div class="comment-body">
+<p>一行目
+    二行目
+
+三行目</p>
+    </div>
+    <script>
+        // モーダルを開く
+        const label = "// これは文字列";  /* ブロックコメント */
+        document.body.classList.add('is-ready');
+    </script>
+</body>
+</html>
+"""
+
+
+class TestMinifyHtml(unittest.TestCase):
+    """HTML 縮小のテストクラス"""
+
+    def setUp(self):
+        self.preserve = build.preserved_whitespace_selectors(CSS)
+
+    def test_preserved_whitespace_selectors(self):
+        """white-space: pre-wrap のセレクタが見つかることを確認"""
+        self.assertEqual(len(self.preserve), 1)
+
+    def test_pre_wrap_text_is_kept(self):
+        """コメント本文の改行や空白がそのまま残ることを確認"""
+        minified = build.minify_html(HTML, self.preserve)
+
+        self.assertIn("<p>一行目\n    二行目\n\n三行目</p>", minified)
+
+    def test_comments_and_whitespace_are_removed(self):
+        """HTML コメントが削除され、空白がまとめられることを確認"""
+        minified = build.minify_html(HTML, self.preserve)
+
+        self.assertNotIn("<!--", minified)
+        self.assertNotIn("    <span>", minified)
+        self.assertLess(len(minified), len(HTML))
+
+    def test_inline_script_is_minified(self):
+        """インラインスクリプトのコメントが削除され、文字列は残ることを確認"""
+        minified = build.minify_html(HTML, self.preserve)
+
+        self.assertNotIn("モーダルを開く", minified)
+        self.assertNotIn("ブロックコメント", minified)
+        self.assertIn('const label = "// これは文字列";', minified)
+
+    def test_minify_is_idempotent(self):
+        """縮小済みの HTML を再度縮小しても変わらないことを確認"""
+        once = build.minify_html(HTML, self.preserve)
+
+        self.assertEqual(build.minify_html(once, self.preserve), once)
+
+    def test_conditional_comment_is_kept(self):
+        """条件付きコメントは削除しないことを確認"""
+        html = "<head><!--[if IE]><p>古いブラウザ</p><![endif]--></head>"
+
+        self.assertIn("<!--[if IE]>", build.minify_html(html))
+
+
+class TestMinifyCss(unittest.TestCase):
+    """CSS の縮小と未使用セレクタの削除のテストクラス"""
+
+    def setUp(self):
+        minified_html = build.minify_html(HTML, build.preserved_whitespace_selectors(CSS))
+        self.used = build.collect_used_selectors([minified_html])
+
+    def test_unused_selectors_are_removed(self):
+        """使われていないセレクタが @media の中も含めて削除されることを確認"""
+        css = build.minify_css(CSS, self.used)
+
+        self.assertIn(".used{color:red}", css)
+        self.assertIn(".comment-body p{white-space:pre-wrap;margin:0}", css)
+        self.assertNotIn(".unused", css)
+        self.assertNotIn(".only-unused", css)
+        self.assertIn("@media (max-width: 768px){.used{padding:4px}}", css)
+
+    def test_keyframes_are_kept(self):
+        """@keyframes は中身を削除せずに残すことを確認"""
+        css = build.minify_css(CSS, self.used)
+
+        self.assertIn("@keyframes fadeIn{from{opacity:0}to{opacity:1}}", css)
+
+    def test_script_classes_and_safelist_are_kept(self):
+        """スクリプトの文字列にあるクラスと CSS_PURGE_SAFELIST のクラスは残ることを確認"""
+        css = build.minify_css(".is-ready{opacity:1}.show{display:block}.hidden{display:none}", self.used)
+
+        self.assertIn(".is-ready", css)
+        self.assertIn(".show", css)
+        self.assertNotIn(".hidden", css)
+
+    def test_without_used_only_minifies(self):
+        """使用中のセレクタを渡さない場合は削除せずに縮小だけ行うことを確認"""
+        css = build.minify_css(CSS)
+
+        self.assertNotIn("/*", css)
+        self.assertIn(".unused{color:blue}", css)
+
+
+class TestOptimizePublicFiles(unittest.TestCase):
+    """public/ の最適化のテストクラス"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.static_dir = root / "static"
+        self.public_dir = root / "public"
+        (self.static_dir / "css").mkdir(parents=True)
+        (self.public_dir / "static" / "css").mkdir(parents=True)
+        (self.static_dir / "css" / "style.css").write_text(CSS, encoding="utf-8")
+        (self.public_dir / "static" / "css" / "style.css").write_text(CSS, encoding="utf-8")
+        (self.public_dir / "index.html").write_text(HTML, encoding="utf-8")
+
+        self.patches = [
+            mock.patch.object(build, "STATIC_DIR", self.static_dir),
+            mock.patch.object(build, "PUBLIC_DIR", self.public_dir),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def test_optimize_is_reproducible(self):
+        """2回実行しても出力が変わらず、元の static/css/ は変更されないことを確認"""
+        results = build.optimize_public_files()
+        first = (self.public_dir / "static" / "css" / "style.css").read_text(encoding="utf-8")
+
+        build.optimize_public_files()
+
+        self.assertEqual((self.public_dir / "static" / "css" / "style.css").read_text(encoding="utf-8"), first)
+        self.assertEqual((self.static_dir / "css" / "style.css").read_text(encoding="utf-8"), CSS)
+        before, after = results["index.html"]
+        self.assertLess(after, before)
+
+
+if __name__ == "__main__":
+    # テストを実行
+    unittest.main(verbosity=2)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_prepare_comments.py - コメントデータ変換のユニットテスト
+
+DataFrame からテンプレート用の辞書リストへの変換をテストします。
+- 書式が混在するタイムスタンプでの並び替え
+- 写真URLからのファイル名生成（写真ストアの対応表と旧形式）
+- 名前・メニューの補完
+- 旧来の列並び（フォールバック）
+"""
+
+import unittest
+import sys
+import hashlib
+from pathlib import Path
+
+import pandas as pd
+
+# プロジェクトルートをパスに追加
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from build import prepare_comments_data, prepare_comments_records, normalize_form_df
+
+
+class TestPrepareComments(unittest.TestCase):
+    """コメントデータ変換のテストクラス"""
+
+    def make_df(self, rows):
+        """正規化済みスキーマのDataFrameを作成"""
+        return pd.DataFrame(rows, columns=["timestamp", "comment", "name", "menu", "photo"])
+
+    def test_sorted_newest_first_with_mixed_formats(self):
+        """書式の異なるタイムスタンプも解釈され、新しい順に並ぶことを確認"""
+        df = self.make_df([
+            ["2026/01/11 8:00:00", "一番目", "", "", ""],
+            ["2026-01-12", "二番目", "", "", ""],
+            ["2026/1/10 7:05:09", "三番目", "", "", ""],
+        ])
+
+        comments = prepare_comments_data(df)
+
+        self.assertEqual([c["content"] for c in comments], ["二番目", "一番目", "三番目"])
+
+    def test_photo_filename_matches_download(self):
+        """写真のファイル名が「タイムスタンプ + URLハッシュ」で生成されることを確認"""
+        url = "https://drive.google.com/open?id=abc"
+        df = self.make_df([
+            ["2026/01/11 8:00:00", "写真あり", "", "", f" {url} "],
+            ["2026/01/11 9:00:00", "URLではない", "", "", "写真なし"],
+        ])
+
+        comments = {c["content"]: c for c in prepare_comments_data(df)}
+
+        url_hash = hashlib.md5(url.encode("utf-8")).hexdigest()[:8]
+        self.assertEqual(comments["写真あり"]["photo_filename"], f"photo_20260111_80000_{url_hash}.webp")
+        self.assertIsNone(comments["URLではない"]["photo_filename"])
+
+    def test_photo_map_is_preferred(self):
+        """写真ストアにあるURLはストアのファイル名、ないURLは旧形式になることを確認"""
+        stored = "https://drive.google.com/open?id=stored"
+        legacy = "https://drive.google.com/open?id=legacy"
+        photo_map = {stored: "photo_0123abcd.webp"}
+        rows = [
+            ["2026/01/11 8:00:00", "ストアあり", "", "", stored],
+            ["2026/01/11 9:00:00", "ストアなし", "", "", legacy],
+        ]
+
+        for comments in (prepare_comments_data(self.make_df(rows), photo_map),
+                         prepare_comments_records([dict(zip(["timestamp", "comment", "name", "menu", "photo"], r)) for r in rows], photo_map)):
+            by_content = {c["content"]: c for c in comments}
+            self.assertEqual(by_content["ストアあり"]["photo_filename"], "photo_0123abcd.webp")
+            self.assertTrue(by_content["ストアなし"]["photo_filename"].startswith("photo_20260111_90000_"))
+
+    def test_anonymous_name_and_menu_text(self):
+        """名前が空なら「匿名」になり、メニューが本文に追記されることを確認"""
+        df = self.make_df([["2026/01/11 8:00:00", "美味しかった", "　", "塩ラーメン", ""]])
+
+        comment = prepare_comments_data(df)[0]
+
+        self.assertEqual(comment["name"], "匿名")
+        self.assertEqual(comment["content"], "美味しかった\n\n【好きだったメニュー】\n塩ラーメン")
+
+    def test_empty_comments_are_dropped(self):
+        """本文もメニューもない行が除外されることを確認"""
+        df = self.make_df([
+            ["2026/01/11 8:00:00", "  ", "太郎", "", ""],
+            ["2026/01/11 9:00:00", None, "花子", None, None],
+        ])
+
+        self.assertEqual(prepare_comments_data(df), [])
+
+    def test_legacy_columns(self):
+        """旧来の列並びでも本文・名前・写真URLを取得できることを確認"""
+        df = pd.DataFrame({
+            "日時": ["2026/01/11 8:00:00"],
+            "本文": ["ありがとう"],
+            "名前": ["太郎"],
+            "メニュー": [""],
+            "写真URL": ["https://example.com/a.jpg"],
+        })
+
+        comment = prepare_comments_data(df)[0]
+
+        self.assertEqual(comment["name"], "太郎")
+        self.assertEqual(comment["photo_url"], "https://example.com/a.jpg")
+        self.assertTrue(comment["photo_filename"].startswith("photo_20260111_80000_"))
+
+    def test_real_test_data(self):
+        """テストデータの全コメントが変換されることを確認"""
+        df = normalize_form_df(pd.read_csv(PROJECT_ROOT / "tests" / "data" / "comments.csv"), "comments")
+
+        comments = prepare_comments_data(df)
+
+        self.assertGreater(len(comments), 0)
+        self.assertTrue(all(c["content"].strip() for c in comments))
+
+
+if __name__ == "__main__":
+    # テストを実行
+    unittest.main(verbosity=2)
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_process_images.py - 画像処理のユニットテスト
+
+raw_images/ → static/images/ の変換処理をテストします。
+- 画像マニフェストによる再エンコードのスキップ
+- 元画像・設定・出力の変更検知
+- プロセスプールによる並列エンコード
+- srcset 用のバリアント出力と、使われなくなった出力の削除
+- JPEG の縮小デコードと EXIF の向きの適用、画素数の上限
+- 読み込み中に表示する代表色とぼかし画像
+"""
+
+import time
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from PIL import Image
+
+# プロジェクトルートをパスに追加
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import build
+
+
+class TestProcessImages(unittest.TestCase):
+    """画像処理のテストクラス"""
+
+    def setUp(self):
+        """一時ディレクトリに raw_images/ と static/images/ を用意"""
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.raw_dir = root / "raw_images"
+        self.out_dir = root / "static" / "images"
+        self.data_dir = root / "data"
+        for d in (self.raw_dir, self.out_dir, self.data_dir):
+            d.mkdir(parents=True)
+
+        self.patches = [
+            mock.patch.object(build, "RAW_IMAGES_DIR", self.raw_dir),
+            mock.patch.object(build, "OUTPUT_IMAGES_DIR", self.out_dir),
+            mock.patch.object(build, "DATA_DIR", self.data_dir),
+            mock.patch.object(build, "IMAGE_MANIFEST_FILE", self.data_dir / ".image_manifest.json"),
+            mock.patch.object(build, "STATE_DB_FILE", self.data_dir / ".state.db"),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def make_image(self, name: str, size=(1600, 1200), color=(200, 120, 40)):
+        """テスト用の画像を raw_images/ に作成"""
+        path = self.raw_dir / name
+        Image.new("RGB", size, color).save(path, "JPEG")
+        return path
+
+    def test_resize_and_convert(self):
+        """画像が最大サイズに収まるよう縮小され、WebPで出力されることを確認"""
+        self.make_image("a.jpg")
+
+        images = build.process_images()
+
+        self.assertEqual(images, ["a.webp"])
+        with Image.open(self.out_dir / "a.webp") as img:
+            self.assertLessEqual(img.width, build.MAX_IMAGE_WIDTH)
+            self.assertLessEqual(img.height, build.MAX_IMAGE_HEIGHT)
+
+    def test_unchanged_images_are_skipped(self):
+        """2回目のビルドでは変更のない画像を再エンコードしないことを確認"""
+        self.make_image("a.jpg")
+        self.make_image("b.jpg", color=(10, 20, 30))
+        build.process_images()
+
+        with mock.patch.object(build.Image, "open", wraps=build.Image.open) as opened:
+            images = build.process_images()
+
+        self.assertEqual(images, ["a.webp", "b.webp"])
+        opened.assert_not_called()
+
+    def test_changed_source_is_reencoded(self):
+        """元画像の内容が変わった場合は再エンコードされることを確認"""
+        self.make_image("a.jpg")
+        self.make_image("b.jpg")
+        build.process_images()
+
+        self.make_image("a.jpg", color=(0, 0, 255))
+        with mock.patch.object(build.Image, "open", wraps=build.Image.open) as opened:
+            build.process_images()
+
+        opened.assert_called_once()
+        self.assertEqual(Path(opened.call_args[0][0]).name, "a.jpg")
+
+    def test_missing_output_is_rebuilt(self):
+        """出力ファイルが削除された場合は作り直されることを確認"""
+        self.make_image("a.jpg")
+        build.process_images()
+        (self.out_dir / "a.webp").unlink()
+
+        images = build.process_images()
+
+        self.assertEqual(images, ["a.webp"])
+        self.assertTrue((self.out_dir / "a.webp").exists())
+
+    def test_settings_change_invalidates_manifest(self):
+        """エンコード設定が変わった場合は再エンコードされることを確認"""
+        self.make_image("a.jpg")
+        build.process_images()
+
+        with mock.patch.object(build, "IMAGE_QUALITY", 50), \
+             mock.patch.object(build.Image, "open", wraps=build.Image.open) as opened:
+            build.process_images()
+
+        opened.assert_called_once()
+
+    def test_process_pool_matches_sequential(self):
+        """プロセスプールでも逐次処理と同じ結果になることを確認"""
+        for i in range(4):
+            self.make_image(f"img{i}.jpg", color=(i * 40, 80, 120))
+        self.make_image("broken.jpg")
+        (self.raw_dir / "broken.jpg").write_bytes(b"not an image")
+
+        images = build.process_images(workers=2)
+
+        self.assertEqual(images, [f"img{i}.webp" for i in range(4)])
+        self.assertNotIn("broken.jpg", build.load_image_manifest())
+
+    def test_memory_budget_limits_in_flight_jobs(self):
+        """メモリ予算が画像2枚分より小さい場合、同時に投入されるジョブが1件までになることを確認"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        jobs = []
+        for i in range(3):
+            src = self.make_image(f"img{i}.jpg")
+            jobs.append((src, self.out_dir / f"img{i}.webp"))
+
+        in_flight = []
+        peak = []
+
+        class TrackingExecutor(ThreadPoolExecutor):
+            """投入中（未完了）のジョブ数を記録するエグゼキューター"""
+
+            def submit(self, *args, **kwargs):
+                future = super().submit(*args, **kwargs)
+                in_flight.append(future)
+                peak.append(sum(not f.done() for f in in_flight))
+                return future
+
+        # 1枚あたり 0.6 MB と見積もらせ、予算 1 MB では2枚目を同時に投入できないようにする
+        with mock.patch.object(build, "IMAGE_MEMORY_BUDGET_MB", 1), \
+             mock.patch.object(build, "estimate_decode_bytes", return_value=600 * 1024) as estimate, \
+             mock.patch("concurrent.futures.ProcessPoolExecutor", TrackingExecutor):
+            results = list(build.run_encode_jobs(jobs, build.image_settings(), workers=2))
+
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(error is None for _, _, error in results))
+        self.assertEqual(len(in_flight), 3)
+        self.assertEqual(max(peak), 1)
+        # 見積もりはジョブごとに1回だけ（予算待ちの間に読み直さない）
+        self.assertEqual(estimate.call_count, 3)
+
+        # 予算に余裕があれば、エンコード中でも2件目が投入される
+        def slow_encode(*args):
+            time.sleep(0.2)
+            return {}
+
+        in_flight.clear()
+        peak.clear()
+        with mock.patch.object(build, "IMAGE_MEMORY_BUDGET_MB", 1), \
+             mock.patch.object(build, "estimate_decode_bytes", return_value=400 * 1024), \
+             mock.patch.object(build, "encode_image", side_effect=slow_encode), \
+             mock.patch("concurrent.futures.ProcessPoolExecutor", TrackingExecutor):
+            list(build.run_encode_jobs(jobs, build.image_settings(), workers=2))
+
+        self.assertEqual(max(peak), 2)
+
+    def test_variants_are_written_and_recorded(self):
+        """最大幅より小さいバリアントが出力され、マニフェストに記録されることを確認"""
+        self.make_image("a.jpg", size=(1600, 1200))
+
+        with mock.patch.object(build, "IMAGE_VARIANT_WIDTHS", [480, 2000]):
+            build.process_images()
+            variants = build.image_variant_manifest(build.load_image_manifest())
+
+        with Image.open(self.out_dir / "a-480w.webp") as img:
+            self.assertEqual(img.size, (480, 360))
+        self.assertFalse((self.out_dir / "a-2000w.webp").exists())
+        self.assertEqual(variants["a.webp"]["width"], 1067)
+        self.assertEqual(variants["a.webp"]["height"], 800)
+        self.assertEqual(
+            variants["a.webp"]["srcset"]["webp"],
+            "static/images/a-480w.webp 480w, static/images/a.webp 1067w",
+        )
+
+    def test_missing_variant_is_rebuilt(self):
+        """バリアントが削除された場合は再エンコードされることを確認"""
+        self.make_image("a.jpg")
+        build.process_images()
+        (self.out_dir / "a-480w.webp").unlink()
+
+        build.process_images()
+
+        self.assertTrue((self.out_dir / "a-480w.webp").exists())
+
+    def test_width_change_removes_old_variant(self):
+        """バリアントの幅を変えると、古い幅の出力が削除されることを確認"""
+        self.make_image("a.jpg")
+        (self.out_dir / "manual.webp").write_bytes(b"not in manifest")
+        build.process_images()
+
+        with mock.patch.object(build, "IMAGE_VARIANT_WIDTHS", [640]):
+            build.process_images()
+
+        self.assertEqual(
+            sorted(p.name for p in self.out_dir.iterdir()),
+            ["a-640w.webp", "a.webp", "manual.webp"],
+        )
+
+    def test_removed_source_outputs_are_deleted(self):
+        """元画像を削除すると、その出力とバリアントも削除されることを確認"""
+        self.make_image("a.jpg")
+        self.make_image("b.jpg")
+        build.process_images()
+
+        (self.raw_dir / "b.jpg").unlink()
+        build.process_images()
+
+        self.assertFalse(any(p.name.startswith("b") for p in self.out_dir.iterdir()))
+        self.assertTrue((self.out_dir / "a-480w.webp").exists())
+
+    def test_failed_encode_keeps_previous_outputs(self):
+        """エンコードに失敗した画像は前回の出力とマニフェストのエントリが残り、元画像の削除で出力も削除されることを確認"""
+        src = self.make_image("a.jpg")
+        build.process_images()
+        entry = build.load_image_manifest()["a.jpg"]
+        src.write_bytes(b"broken")
+
+        images = build.process_images()
+
+        self.assertEqual(images, ["a.webp"])
+        self.assertEqual(build.load_image_manifest()["a.jpg"], entry)
+        self.assertTrue((self.out_dir / "a-480w.webp").exists())
+
+        src.unlink()
+        build.process_images()
+
+        self.assertEqual(build.load_image_manifest(), {})
+        self.assertEqual(list(self.out_dir.iterdir()), [])
+
+    def test_failed_hash_keeps_previous_outputs(self):
+        """元画像の読み込み（ハッシュ計算）に失敗した場合も、前回の出力とエントリが残ることを確認"""
+        src = self.make_image("a.jpg")
+        build.process_images()
+        entry = build.load_image_manifest()["a.jpg"]
+        src.write_bytes(b"changed")
+
+        with mock.patch.object(build, "compute_file_hash", side_effect=OSError("read error")):
+            images = build.process_images()
+
+        self.assertEqual(images, ["a.webp"])
+        self.assertEqual(build.load_image_manifest()["a.jpg"], entry)
+        self.assertTrue((self.out_dir / "a.webp").exists())
+
+    def test_large_jpeg_is_decoded_at_reduced_size(self):
+        """大きな JPEG が出力サイズ以上の縮小率でデコードされ、正しい寸法で出力されることを確認"""
+        src = self.make_image("big.jpg", size=(4000, 3000))
+
+        with Image.open(src) as img:
+            build.draft_source_image(img, build.image_settings())
+            self.assertEqual(img.size, (2000, 1500))
+        self.assertLess(
+            build.estimate_decode_bytes(src, build.image_settings()),
+            build.estimate_decode_bytes(src),
+        )
+
+        build.process_images()
+
+        with Image.open(self.out_dir / "big.webp") as img:
+            self.assertEqual(img.size, (1067, 800))
+
+    def test_exif_orientation_is_applied(self):
+        """EXIF の向き（90度回転）が出力に反映されることを確認"""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        Image.new("RGB", (4000, 3000), (200, 120, 40)).save(self.raw_dir / "portrait.jpg", "JPEG", exif=exif)
+
+        build.process_images()
+
+        with Image.open(self.out_dir / "portrait.webp") as img:
+            self.assertEqual(img.size, (600, 800))
+
+    def test_too_many_pixels_is_rejected(self):
+        """画素数が上限を超える元画像はエンコードされないことを確認"""
+        self.make_image("a.jpg", size=(400, 300))
+        self.make_image("huge.jpg", size=(1600, 1200))
+
+        with mock.patch.object(build, "MAX_SOURCE_PIXELS", 500_000):
+            images = build.process_images()
+
+        self.assertEqual(images, ["a.webp"])
+        self.assertFalse((self.out_dir / "huge.webp").exists())
+
+    def test_placeholder_is_recorded_on_encode(self):
+        """エンコード時に代表色とぼかし画像が記録され、スキップ時は再計算されないことを確認"""
+        self.make_image("a.jpg", color=(200, 120, 40))
+        build.process_images()
+
+        variants = build.image_variant_manifest(build.load_image_manifest())
+        self.assertTrue(variants["a.webp"]["placeholder"].startswith("data:image/webp;base64,"))
+        r, g, b = (int(variants["a.webp"]["color"][i:i + 2], 16) for i in (1, 3, 5))
+        self.assertLessEqual(max(abs(r - 200), abs(g - 120), abs(b - 40)), 8)
+
+        with mock.patch.object(build, "image_placeholder") as placeholder:
+            build.process_images()
+
+        placeholder.assert_not_called()
+        self.assertEqual(build.image_variant_manifest(build.load_image_manifest()), variants)
+
+    def test_removed_source_is_pruned_from_manifest(self):
+        """削除された元画像のエントリがマニフェストから除外されることを確認"""
+        self.make_image("a.jpg")
+        self.make_image("b.jpg")
+        build.process_images()
+
+        (self.raw_dir / "b.jpg").unlink()
+        build.process_images()
+
+        self.assertEqual(sorted(build.load_image_manifest()), ["a.jpg"])
+
+
+if __name__ == "__main__":
+    # テストを実行
+    unittest.main(verbosity=2)
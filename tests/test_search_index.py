@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_search_index.py - 検索インデックスのユニットテスト
+
+public/search/ に出力する想い出の検索インデックスをテストします。
+- 文字 n-gram への分割（NFKC 正規化・小文字化）
+- シャードに分割した転置インデックスの内容（差分で符号化したコメント番号）
+- 検索結果の表示用データの分割と、前回の出力の削除
+"""
+
+import json
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+# プロジェクトルートをパスに追加
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import build
+
+
+class TestSearchTokens(unittest.TestCase):
+    """トークン分割のテストクラス"""
+
+    def test_unigrams_and_bigrams(self):
+        """文字の連続ごとにユニグラムとバイグラムが取り出されることを確認"""
+        self.assertEqual(build.search_tokens("塩ラー、味"), {"塩", "ラ", "ー", "塩ラ", "ラー", "味"})
+
+    def test_normalization(self):
+        """全角英数字・半角カナ・大文字が同じトークンになることを確認"""
+        self.assertEqual(build.search_tokens("ＡＢ"), build.search_tokens("ab"))
+        self.assertEqual(build.search_tokens("ﾗｰﾒﾝ"), build.search_tokens("ラーメン"))
+
+    def test_shard_is_stable(self):
+        """シャード番号が範囲内で、FNV-1a の値どおりであることを確認"""
+        self.assertEqual(build.search_shard("a"), 0xe40c292c % build.SEARCH_SHARD_COUNT)
+        for token in build.search_tokens("焦がしガーリックが忘れられません"):
+            self.assertIn(build.search_shard(token), range(build.SEARCH_SHARD_COUNT))
+
+
+class TestWriteSearchIndex(unittest.TestCase):
+    """検索インデックスの出力のテストクラス"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.public_dir = Path(self.tmp.name) / "public"
+        self.patches = [
+            mock.patch.object(build, "PUBLIC_DIR", self.public_dir),
+            mock.patch.object(build, "SEARCH_DOCS_PER_FILE", 2),
+        ]
+        for p in self.patches:
+            p.start()
+        self.comments = [
+            {"timestamp": "2026/01/13 10:00:00", "name": "太郎", "menu": "", "content": "塩ラーメンが好きでした"},
+            {"timestamp": "2026/01/12 9:00:00", "name": "匿名", "menu": "焦がしガーリック",
+             "content": "ありがとう\n\n【好きだったメニュー】\n焦がしガーリック"},
+            {"timestamp": float("nan"), "name": "花子", "menu": "", "content": "ラーメン" * 30},
+        ]
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def lookup(self, token):
+        """シャードからトークンのコメント番号を復元"""
+        shard = json.loads((self.public_dir / "search" / f"index-{build.search_shard(token)}.json").read_text(encoding="utf-8"))
+        ids, current = [], 0
+        for delta in shard.get(token, []):
+            current += delta
+            ids.append(current)
+        return ids
+
+    def test_postings(self):
+        """本文・お名前・メニューのトークンからコメント番号が引けることを確認"""
+        stats = build.write_search_index(self.comments)
+
+        self.assertEqual(stats["docs"], 3)
+        self.assertEqual(self.lookup("ラー"), [0, 2])
+        self.assertEqual(self.lookup("花子"), [2])
+        self.assertEqual(self.lookup("ガー"), [1])
+        self.assertEqual(self.lookup("存在"), [])
+
+    def test_docs_and_meta(self):
+        """表示用データが分割され、meta.json に件数とバージョンが入ることを確認"""
+        build.write_search_index(self.comments)
+        search_dir = self.public_dir / "search"
+
+        meta = json.loads((search_dir / "meta.json").read_text(encoding="utf-8"))
+        self.assertEqual(meta["count"], 3)
+        self.assertEqual(meta["docs_per_file"], 2)
+        self.assertEqual(len(meta["version"]), 12)
+        docs = json.loads((search_dir / "docs-1.json").read_text(encoding="utf-8"))
+        name, timestamp, snippet = docs[0]
+        self.assertEqual((name, timestamp), ("花子", ""))
+        self.assertEqual(len(snippet), build.SEARCH_SNIPPET_LENGTH + 1)
+        self.assertTrue(snippet.endswith("…"))
+
+    def test_stale_files_are_removed(self):
+        """件数が減ったとき、前回の出力の不要なファイルが残らないことを確認"""
+        build.write_search_index(self.comments)
+        build.write_search_index(self.comments[:1])
+
+        self.assertFalse((self.public_dir / "search" / "docs-1.json").exists())
+        self.assertEqual(self.lookup("ラー"), [0])
+
+
+if __name__ == "__main__":
+    # テストを実行
+    unittest.main(verbosity=2)
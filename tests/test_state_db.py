@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_state_db.py - 状態データベースのユニットテスト
+
+data/.state.db（SQLite）に保存するビルド状態をテストします。
+- WAL モードでの作成と、読み込み・保存の往復
+- JSON 形式の状態ファイルからの1回だけの移行
+- 旧形式のダウンロード履歴の読み込み
+- 変わったエントリだけの書き込みと、壊れたデータベースでの読み込み
+- 失敗したURLの記録と、複数スレッドからの同時書き込み
+- メニューの分割結果のキャッシュ（新しい行の追加、なくなった行・古いバージョンの削除）
+"""
+
+import json
+import sqlite3
+import threading
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+# プロジェクトルートをパスに追加
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import build
+
+
+class TestStateDb(unittest.TestCase):
+    """状態データベースのテストクラス"""
+
+    def setUp(self):
+        """一時ディレクトリに data/ を用意"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = Path(self.tmp.name)
+        self.db_path = self.data_dir / ".state.db"
+        self.patches = [
+            mock.patch.object(build, "STATE_DB_FILE", self.db_path),
+            mock.patch.object(build, "FETCH_STATE_FILE", self.data_dir / ".fetch_state.json"),
+            mock.patch.object(build, "IMAGE_MANIFEST_FILE", self.data_dir / ".image_manifest.json"),
+            mock.patch.object(build, "PHOTO_STORE_FILE", self.data_dir / ".photo_store.json"),
+            mock.patch.object(build, "DOWNLOAD_HISTORY_FILE", self.data_dir / ".download_history.json"),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def write_json(self, name, data):
+        (self.data_dir / name).write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+    def test_round_trip_in_wal_mode(self):
+        """保存した状態がそのまま読み込め、データベースが WAL モードになることを確認"""
+        manifest = {"a.jpg": {"source_hash": "abc", "output": "a.webp", "variants": [{"file": "a.webp", "width": 800}]}}
+        build.save_image_manifest(manifest)
+        build.save_fetch_state({"comments.csv": {"etag": '"v1"', "changed": True}})
+
+        self.assertEqual(build.load_image_manifest(), manifest)
+        # changed は読み込み時に False になる
+        self.assertEqual(build.load_fetch_state(), {"comments.csv": {"etag": '"v1"', "changed": False}})
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+    def test_saved_manifest_replaces_previous(self):
+        """マニフェストから消したエントリは保存後に残らないことを確認"""
+        build.save_image_manifest({"a.jpg": {"source_hash": "a"}, "b.jpg": {"source_hash": "b"}})
+        build.save_image_manifest({"a.jpg": {"source_hash": "a"}})
+
+        self.assertEqual(list(build.load_image_manifest()), ["a.jpg"])
+
+    def test_json_files_are_migrated_once(self):
+        """JSON の状態ファイルが移行され、*.migrated に名前が変わることを確認"""
+        self.write_json(".fetch_state.json", {"comments.csv": {"etag": '"v1"'}})
+        self.write_json(".image_manifest.json", {"a.jpg": {"source_hash": "abc"}})
+        self.write_json(".photo_store.json", {
+            "urls": {"https://example.com/a.jpg": "sha"},
+            "contents": {"sha": {"filename": "photo_sha.jpg", "size": 3}},
+        })
+        self.write_json(".download_history.json", {
+            "1234abcd": {"url": "https://example.com/old.jpg", "filename": "photo_20260111_80000_1234abcd.jpg"},
+        })
+
+        self.assertEqual(build.load_fetch_state()["comments.csv"]["etag"], '"v1"')
+        self.assertEqual(build.load_image_manifest(), {"a.jpg": {"source_hash": "abc"}})
+        self.assertEqual(build.load_photo_map(), {"https://example.com/a.jpg": "photo_sha.webp"})
+        self.assertEqual(list(build.load_download_history()), ["1234abcd"])
+        self.assertEqual(build.load_download_history()["1234abcd"]["filename"], "photo_20260111_80000_1234abcd.jpg")
+        self.assertEqual(sorted(p.name for p in self.data_dir.glob("*.migrated")), [
+            ".download_history.json.migrated", ".fetch_state.json.migrated",
+            ".image_manifest.json.migrated", ".photo_store.json.migrated",
+        ])
+
+        # 同じ名前の JSON が戻されても、移行済みなら取り込まない
+        self.write_json(".fetch_state.json", {"photos.csv": {}})
+        build._state_db_ready.clear()
+        self.assertEqual(list(build.load_fetch_state()), ["comments.csv"])
+
+    def test_only_changed_rows_are_written(self):
+        """保存時は変わったエントリだけが書き込まれ、なくなったエントリは削除されることを確認"""
+        manifest = {f"{i}.jpg": {"source_hash": str(i)} for i in range(5)}
+        build.save_image_manifest(manifest)
+
+        manifest["1.jpg"] = {"source_hash": "changed"}
+        del manifest["4.jpg"]
+        with build.state_db() as conn:
+            self.assertEqual(build.sync_state_table(conn, "image_manifest", {
+                filename: (entry["source_hash"], json.dumps(entry, ensure_ascii=False))
+                for filename, entry in manifest.items()
+            }), 2)
+            conn.rollback()
+        build.save_image_manifest(manifest)
+
+        self.assertEqual(build.load_image_manifest(), manifest)
+
+    def test_unreadable_database_does_not_abort(self):
+        """状態データベースが壊れていても、ダウンロード履歴の読み込みが空で続くことを確認"""
+        self.db_path.write_bytes(b"not a database" * 100)
+        build._state_db_ready.clear()
+
+        self.assertEqual(build.load_download_history(), {})
+
+    def test_failed_urls_are_counted_and_cleared(self):
+        """失敗したURLの回数が増え、成功すると記録が消えることを確認"""
+        url = "https://example.com/ng.jpg"
+        build.record_failed_urls({url: "404"}, [])
+        build.record_failed_urls({url: "403"}, [])
+
+        with build.state_db() as conn:
+            self.assertEqual(conn.execute("SELECT error, attempts FROM failed_urls").fetchall(), [("403", 2)])
+
+        build.record_failed_urls({}, [url])
+
+        with build.state_db() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM failed_urls").fetchone()[0], 0)
+
+    def test_menu_token_cache_round_trip(self):
+        """メニューの分割結果が追加・削除され、別のバージョンの結果は読み込まれないことを確認"""
+        build.save_menu_token_cache({"abc": ["塩ラーメン"], "def": ["レモン塩"]}, set(), "v1")
+        token_cache = build.load_menu_token_cache("v1")
+        self.assertEqual(token_cache, {"abc": ["塩ラーメン"], "def": ["レモン塩"]})
+
+        build.save_menu_token_cache({"abc": ["塩ラーメン"], "ghi": ["柚子胡椒"]}, set(token_cache), "v1")
+        self.assertEqual(build.load_menu_token_cache("v1"), {"abc": ["塩ラーメン"], "ghi": ["柚子胡椒"]})
+
+        build.save_menu_token_cache({}, set(), "v2")
+        self.assertEqual(build.load_menu_token_cache("v1"), {})
+        with build.state_db() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM menu_row_tokens").fetchone()[0], 0)
+
+    def test_concurrent_writers(self):
+        """複数のスレッドから同時に書き込んでも、すべての写真が保存されることを確認"""
+        def register(worker):
+            for i in range(20):
+                sha = f"{worker}-{i}"
+                build.save_photo_store({
+                    "urls": {f"https://example.com/{sha}.jpg": sha},
+                    "contents": {sha: {"filename": f"photo_{sha}.jpg"}},
+                })
+
+        threads = [threading.Thread(target=register, args=(worker,)) for worker in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(build.load_photo_map()), 80)
+
+
+if __name__ == "__main__":
+    # テストを実行
+    unittest.main(verbosity=2)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_synthetic_data.py - ベンチマーク用合成データのユニットテスト
+
+benchmarks/synthetic.py が生成するデータをテストします。
+- Googleフォームと同じ列名で normalize_form_df() が列を拾えること
+- 同じシードなら同じデータになること
+- 画像が JPEG / PNG で生成されること
+"""
+
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+from PIL import Image
+
+# プロジェクトルートをパスに追加
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "benchmarks"))
+
+import build
+import synthetic
+
+
+class TestSyntheticData(unittest.TestCase):
+    """合成データのテストクラス"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_comments_csv_is_normalized(self):
+        """コメントCSVの列が正規化後のスキーマに対応付くことを確認"""
+        path = synthetic.generate_comments_csv(self.dir / "comments.csv", 50)
+
+        df = build.normalize_form_df(pd.read_csv(path), "comments")
+
+        self.assertEqual(len(df), 50)
+        self.assertTrue(df["comment"].str.len().gt(0).all())
+        self.assertTrue(df["timestamp"].str.match(r"\d{4}/\d{2}/\d{2} \d{1,2}:\d{2}:\d{2}$").all())
+        self.assertGreater(len(build.aggregate_menu_items(df)), 0)
+
+    def test_photos_csv_is_normalized(self):
+        """写真CSVの写真URLから写真のファイル名が作られることを確認"""
+        path = synthetic.generate_photos_csv(self.dir / "photos.csv", 20)
+
+        df = build.normalize_form_df(pd.read_csv(path), "photos")
+
+        self.assertTrue(df["photo"].str.startswith("https://drive.google.com/").all())
+        self.assertTrue(all(c["photo_filename"] for c in build.prepare_comments_data(df)))
+
+    def test_same_seed_is_reproducible(self):
+        """同じシードなら同じCSVが生成されることを確認"""
+        a = synthetic.generate_comments_csv(self.dir / "a.csv", 30, seed=1)
+        b = synthetic.generate_comments_csv(self.dir / "b.csv", 30, seed=1)
+
+        self.assertEqual(a.read_bytes(), b.read_bytes())
+
+    def test_image_corpus(self):
+        """画像が指定枚数生成され、5枚に1枚が PNG になることを確認"""
+        paths = synthetic.generate_image_corpus(self.dir / "raw_images", 5)
+
+        self.assertEqual([p.suffix for p in paths], [".jpg"] * 4 + [".png"])
+        with Image.open(paths[0]) as img:
+            self.assertIn(img.size, synthetic.IMAGE_SIZES)
+
+
+if __name__ == "__main__":
+    # テストを実行
+    unittest.main(verbosity=2)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_watch.py - ウォッチモードのユニットテスト
+
+--watch の変更検知と差分再ビルドをテストします。
+- 監視対象の変更の検知（エディタの一時ファイルは無視）
+- 変更された入力に応じた再ビルドの範囲
+- 書き換えた出力の古い事前圧縮ファイルの削除
+- ライブリロード用スクリプトの挿入
+"""
+
+import os
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+# プロジェクトルートをパスに追加
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import build
+
+
+class TestWatchSnapshot(unittest.TestCase):
+    """変更検知のテストクラス"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.templates_dir = root / "templates"
+        self.content_dir = root / "content"
+        self.css_dir = root / "static" / "css"
+        for d in (self.templates_dir, self.content_dir, self.css_dir, root / "raw_images"):
+            d.mkdir(parents=True)
+        (self.templates_dir / "index.html").write_text("<p>{{ site_title }}</p>", encoding="utf-8")
+        (self.content_dir / "about.md").write_text("# 店主について", encoding="utf-8")
+        (self.css_dir / "style.css").write_text("p{}", encoding="utf-8")
+        self.config_file = root / "config.json"
+        self.config_file.write_text("{}", encoding="utf-8")
+
+        self.patches = [
+            mock.patch.object(build, "TEMPLATES_DIR", self.templates_dir),
+            mock.patch.object(build, "CONTENT_DIR", self.content_dir),
+            mock.patch.object(build, "STATIC_DIR", root / "static"),
+            mock.patch.object(build, "RAW_IMAGES_DIR", root / "raw_images"),
+            mock.patch.object(build, "CONFIG_FILE", self.config_file),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def touch(self, path: Path, text: str):
+        """内容を書き換え、更新日時も確実に変える"""
+        path.write_text(text, encoding="utf-8")
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    def test_no_change(self):
+        """変更がなければ何も検知しないことを確認"""
+        before = build.snapshot_watch_targets()
+
+        self.assertEqual(build.changed_watch_areas(before, build.snapshot_watch_targets()), set())
+
+    def test_changed_areas(self):
+        """変更・追加されたファイルの入力名を検知することを確認"""
+        before = build.snapshot_watch_targets()
+        self.touch(self.templates_dir / "index.html", "<h1>{{ site_title }}</h1>")
+        self.touch(self.config_file, '{"site": {}}')
+        (self.css_dir / "extra.css").write_text("a{}", encoding="utf-8")
+
+        areas = build.changed_watch_areas(before, build.snapshot_watch_targets())
+
+        self.assertEqual(areas, {"templates", "config", "css"})
+
+    def test_editor_temp_files_are_ignored(self):
+        """エディタの一時ファイルは変更として扱わないことを確認"""
+        before = build.snapshot_watch_targets()
+        (self.content_dir / ".about.md.swp").write_text("x", encoding="utf-8")
+        (self.content_dir / "about.md~").write_text("x", encoding="utf-8")
+
+        self.assertEqual(build.changed_watch_areas(before, build.snapshot_watch_targets()), set())
+
+
+class TestRebuildChanged(unittest.TestCase):
+    """差分再ビルドのテストクラス"""
+
+    def setUp(self):
+        self.session = {
+            "env": object(), "config": {}, "comments": [], "menu_stats": {},
+            "images": ["a.webp"], "image_variants": {}, "about_html": "", "store_history": [],
+        }
+        self.patches = {
+            name: mock.patch.object(build, name)
+            for name in ("generate_html", "copy_static_files", "process_images", "load_config", "load_markdown_content")
+        }
+        self.mocks = {name: p.start() for name, p in self.patches.items()}
+        self.mocks["process_images"].return_value = ["a.webp", "b.webp"]
+        self.mocks["load_markdown_content"].return_value = "<p>店主について</p>"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.public_dir = Path(self.tmp.name)
+        self.public_patch = mock.patch.object(build, "PUBLIC_DIR", self.public_dir)
+        self.public_patch.start()
+
+    def tearDown(self):
+        for p in self.patches.values():
+            p.stop()
+        self.public_patch.stop()
+        self.tmp.cleanup()
+
+    def test_template_change_only_renders_html(self):
+        """テンプレートの変更では画像処理や static のコピーを行わないことを確認"""
+        steps = build.rebuild_changed(self.session, {"templates"})
+
+        self.assertEqual(steps, ["html"])
+        self.mocks["process_images"].assert_not_called()
+        self.mocks["copy_static_files"].assert_not_called()
+        # 同じ Jinja2 環境を使い回す
+        self.assertIs(self.mocks["generate_html"].call_args.kwargs["env"], self.session["env"])
+
+    def test_css_change_only_syncs_static(self):
+        """CSS の変更では HTML を再生成しないことを確認"""
+        steps = build.rebuild_changed(self.session, {"css"})
+
+        self.assertEqual(steps, ["static"])
+        self.mocks["generate_html"].assert_not_called()
+
+    def test_content_change_updates_session(self):
+        """about.md の変更で店主についての HTML が更新されることを確認"""
+        steps = build.rebuild_changed(self.session, {"content"})
+
+        self.assertEqual(steps, ["markdown", "html"])
+        self.assertEqual(self.session["about_html"], "<p>店主について</p>")
+        self.mocks["load_config"].assert_not_called()
+
+    def test_image_change_runs_all_image_steps(self):
+        """画像の変更でエンコード・同期・HTML 再生成が行われることを確認"""
+        with mock.patch.object(build, "load_image_manifest", return_value={}):
+            steps = build.rebuild_changed(self.session, {"images"})
+
+        self.assertEqual(steps, ["images", "static", "html"])
+        self.assertEqual(self.session["images"], ["a.webp", "b.webp"])
+
+    def test_stale_compressed_files_are_removed(self):
+        """再ビルドで書き換えた出力の .gz / .br が削除され、変わっていない出力のものは残ることを確認"""
+        index = self.public_dir / "index.html"
+        style = self.public_dir / "css" / "style.css"
+        style.parent.mkdir()
+        for path in (index, style):
+            path.write_text("<p>古い内容</p>", encoding="utf-8")
+            for ext in ("gz", "br"):
+                sibling = path.with_name(f"{path.name}.{ext}")
+                sibling.write_bytes(b"compressed")
+                os.utime(sibling, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns))
+
+        def rewrite_index(*args, **kwargs):
+            index.write_text("<p>新しい内容</p>", encoding="utf-8")
+            os.utime(index, ns=(0, index.stat().st_mtime_ns + 1))
+
+        self.mocks["generate_html"].side_effect = rewrite_index
+        steps = build.rebuild_changed(self.session, {"templates"})
+
+        self.assertEqual(steps, ["html", "precompressed"])
+        self.assertFalse((self.public_dir / "index.html.gz").exists())
+        self.assertFalse((self.public_dir / "index.html.br").exists())
+        self.assertTrue((style.parent / "style.css.gz").exists())
+        self.assertTrue((style.parent / "style.css.br").exists())
+
+
+class TestLiveReload(unittest.TestCase):
+    """ライブリロードのテストクラス"""
+
+    def test_script_is_injected_before_body_end(self):
+        """</body> の直前にスクリプトが挿入されることを確認"""
+        html = build.inject_live_reload("<html><body><p>想い出</p></body></html>")
+
+        self.assertIn(build.LIVE_RELOAD_PATH, html)
+        self.assertTrue(html.endswith("</script></body></html>"))
+
+    def test_fragment_is_unchanged(self):
+        """</body> のない断片はそのまま返すことを確認"""
+        fragment = '<div class="timeline-item"></div>'
+
+        self.assertEqual(build.inject_live_reload(fragment), fragment)
+
+    def test_notify_increments_generation(self):
+        """通知のたびに世代番号が増えることを確認"""
+        before = build._reload_generation
+
+        build.notify_live_reload()
+
+        self.assertEqual(build._reload_generation, before + 1)
+
+
+if __name__ == "__main__":
+    # テストを実行
+    unittest.main(verbosity=2)